@@ -1,14 +1,15 @@
+from core.context_processors import lazy, request_memo
 from .models import DefaultSiteSetting
 
 def admin_settings(request):
     """
     Add admin-related settings to all admin templates
     """
-    settings = DefaultSiteSetting.objects.first()
-    if not settings:
-        settings = DefaultSiteSetting.objects.create()
+    def settings():
+        # Shared with core.context_processors' default_settings
+        return request_memo(request, 'default_settings', DefaultSiteSetting.get_default_settings)
     
     return {
-        'admin_settings': settings,
-        'admin_site_name': settings.site_name if settings else 'Admin Dashboard'
-    }
\ No newline at end of file
+        'admin_settings': lazy(request, 'default_settings', DefaultSiteSetting.get_default_settings),
+        'admin_site_name': lazy(request, 'admin_site_name', lambda: settings().site_name or 'Admin Dashboard'),
+    }
@@ -131,6 +131,7 @@ urlpatterns = [
     path('api/brand-stats/', views.brand_stats, name='brand_stats'),
     path('api/supplier-stats/', views.supplier_stats, name='supplier_stats'),
     path('api/recent-brands/', views.recent_brands, name='recent_brands'),
+    path('api/fragment-cache-stats/', views.fragment_cache_stats, name='fragment_cache_stats'),
     path('api/toggle-blog-category/', views.toggle_blog_category, name='toggle_blog_category'),
     path('api/toggle-blog-status/', views.toggle_blog_status, name='toggle_blog_status'),
     path('api/bulk-category-action/', views.bulk_category_action, name='bulk_category_action'),
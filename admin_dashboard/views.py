@@ -570,6 +570,19 @@ def recent_brands(request):
             'error': str(e)
         })
 
+@login_required
+@admin_required
+def fragment_cache_stats(request):
+    """API endpoint for product card fragment cache hit/miss counters"""
+    from shop.fragments import stats
+    
+    if request.method == 'POST' and request.POST.get('reset'):
+        stats.reset()
+    return JsonResponse({
+        'success': True,
+        **stats.snapshot()
+    })
+
 @login_required
 @admin_required
 def toggle_blog_category(request):
@@ -1827,9 +1840,9 @@ def ajax_upload_image(request):
         if file.size > 5 * 1024 * 1024:
             return JsonResponse({'success': False, 'error': 'File size too large (max 5MB)'})
         
-        # Save file temporarily for preview
-        import os
-        from django.conf import settings
+        # Save file for preview. Storage is content-addressed, so saving the
+        # form afterwards reuses this blob; gc_media_blobs removes previews
+        # that are never saved.
         from django.core.files.storage import default_storage
         
         filename = f"temp_{file_type}_{file.name}"
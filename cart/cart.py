@@ -1,58 +1,149 @@
 from decimal import Decimal
 from django.conf import settings
 from shop.models import Product
+from shop.pricing import price_index
+from . import reservations
+from .middleware import get_cart_token, set_cart_token, touch_cart_token
+from .storage import get_storage, new_token
+
+class CartLine:
+    __slots__ = ('quantity', 'price')
+
+    def __init__(self, quantity, price):
+        self.quantity = quantity
+        self.price = price
+
+    @property
+    def total_price(self):
+        return self.price * self.quantity
+
 
 class Cart:
+    """
+    The visitor's cart, kept by ``cart.storage`` under the token in their
+    cart cookie. Each change writes only the line it touches.
+
+    ``lines`` maps product id to a CartLine (quantity and the list price
+    when it was last changed). The item count and subtotal are summed once
+    on load and then adjusted by each change, so ``len()`` and
+    ``get_total_price()`` do not walk the lines. What the visitor is
+    actually charged, after promotions and coupons, comes from ``priced()``.
+    Any change releases the stock a checkout is holding for the cart.
+    """
     def __init__(self, request):
-        self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
+        self.request = request
+        self.storage = get_storage()
+        self.token = get_cart_token(request)
+        if self.token is None:
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                # Signed in without the cookie (another browser, or it expired): use their cart.
+                self.token = self.storage.token_for_user(user.pk)
+                if self.token is not None:
+                    set_cart_token(request, self.token)
+            self._import_session_cart()
+        stored = self.storage.load(self.token) if self.token else {}
+        self.lines = {product_id: CartLine(quantity, price) for product_id, (quantity, price) in stored.items()}
+        self.item_count = sum(line.quantity for line in self.lines.values())
+        self.subtotal = sum((line.total_price for line in self.lines.values()), Decimal('0'))
+    
+    def _import_session_cart(self):
+        # Carts from before the cart store lived in the session; move one
+        # over the first time its owner comes back.
+        session = getattr(self.request, 'session', None)
+        if session is None or not session.session_key:
+            return
+        legacy = session.pop(settings.CART_SESSION_ID, None)
+        if not legacy:
+            return
+        self._ensure_token()
+        for product_id, item in legacy.items():
+            if Product.objects.filter(pk=product_id).exists():
+                self.storage.set_line(self.token, int(product_id), item['quantity'], Decimal(item['price']))
+    
+    def _ensure_token(self):
+        if self.token is None:
+            self.token = new_token()
+            set_cart_token(self.request, self.token)
+            user = getattr(self.request, 'user', None)
+            if user is not None and user.is_authenticated:
+                self.storage.assign_user(self.token, user.pk)
     
     def add(self, product, quantity=1, override_quantity=False):
-        product_id = str(product.id)
-        if product_id not in self.cart:
-            self.cart[product_id] = {
-                'quantity': 0,
-                'price': str(product.price)
-            }
-        
-        if override_quantity:
-            self.cart[product_id]['quantity'] = quantity
-        else:
-            self.cart[product_id]['quantity'] += quantity
+        line = self.lines.get(product.id)
+        if line is None:
+            line = self.lines[product.id] = CartLine(0, product.price)
+        new_quantity = quantity if override_quantity else line.quantity + quantity
+        self.item_count += new_quantity - line.quantity
+        self.subtotal += new_quantity * product.price - line.total_price
+        line.quantity = new_quantity
+        line.price = product.price
         
-        self.save()
+        self._ensure_token()
+        self.storage.set_line(self.token, product.id, line.quantity, line.price)
+        touch_cart_token(self.request)
+        reservations.release(self.token)
     
     def save(self):
-        self.session.modified = True
+        # Every change is written as it happens.
+        pass
     
     def remove(self, product):
-        product_id = str(product.id)
-        if product_id in self.cart:
-            del self.cart[product_id]
-            self.save()
+        line = self.lines.pop(product.id, None)
+        if line is not None:
+            self.item_count -= line.quantity
+            self.subtotal -= line.total_price
+            self.storage.remove_line(self.token, product.id)
+            touch_cart_token(self.request)
+            reservations.release(self.token)
+    
+    def line_total(self, product_id):
+        line = self.lines.get(product_id)
+        return line.total_price if line is not None else Decimal('0')
+    
+    def priced(self, coupon_code=None, fresh=False):
+        """
+        A ``shop.pricing.PricedCart`` for the lines at today's list prices,
+        with live promotions and ``coupon_code`` applied. One query, for the
+        prices; lines whose product is gone or inactive are left out.
+        ``fresh`` re-checks the promotions' version stamp first (one more
+        query); use it when charging.
+        """
+        prices = dict(
+            Product.objects.filter(pk__in=list(self.lines), is_active=True).values_list('pk', 'price')
+        ) if self.lines else {}
+        return price_index.price_lines(
+            {product_id: (line.quantity, prices[product_id]) for product_id, line in self.lines.items() if product_id in prices},
+            coupon_code,
+            max_age=0 if fresh else None,
+        )
     
     def __iter__(self):
-        product_ids = self.cart.keys()
-        products = Product.objects.filter(id__in=product_ids)
-        cart = self.cart.copy()
-        
-        for product in products:
-            cart[str(product.id)]['product'] = product
-        
-        for item in cart.values():
-            item['price'] = Decimal(item['price'])
-            item['total_price'] = item['price'] * item['quantity']
-            yield item
+        """``{'product', 'quantity', 'price', 'total_price'}`` per line, with all products from one query."""
+        products = Product.objects.in_bulk(list(self.lines))
+        for product_id, line in self.lines.items():
+            product = products.get(product_id)
+            if product is None:
+                continue  # deleted since it was added
+            yield {
+                'product': product,
+                'quantity': line.quantity,
+                'price': line.price,
+                'total_price': line.total_price,
+            }
     
     def __len__(self):
-        return sum(item['quantity'] for item in self.cart.values())
+        return self.item_count
     
     def get_total_price(self):
-        return sum(Decimal(item['price']) * item['quantity'] for item in self.cart.values())
+        return self.subtotal
     
     def clear(self):
-        del self.session[settings.CART_SESSION_ID]
-        self.save()
\ No newline at end of file
+        if self.token:
+            reservations.release(self.token)
+            self.storage.clear(self.token)
+            set_cart_token(self.request, None)
+            self.token = None
+        self.lines = {}
+        self.item_count = 0
+        self.subtotal = Decimal('0')
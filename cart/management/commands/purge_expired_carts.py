@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from cart.storage import get_storage
+
+
+class Command(BaseCommand):
+    help = 'Delete server-side carts that have passed their expiry'
+
+    def handle(self, *args, **options):
+        count = get_storage().purge_expired()
+        self.stdout.write(self.style.SUCCESS(f'Purged {count} expired carts'))
@@ -0,0 +1,54 @@
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from cart import storage
+
+DEFAULT_COOKIE_NAME = 'cart_token'
+TOKEN_RE = re.compile(r'[A-Za-z0-9_-]{20,64}')
+
+
+def cookie_name():
+    return getattr(settings, 'CART_COOKIE_NAME', DEFAULT_COOKIE_NAME)
+
+
+def get_cart_token(request):
+    """The request's cart token, or None if it has no cart yet."""
+    if not hasattr(request, 'cart_token'):
+        token = request.COOKIES.get(cookie_name(), '')
+        request.cart_token = token if TOKEN_RE.fullmatch(token) else None
+    request.cart_accessed = True
+    return request.cart_token
+
+
+def set_cart_token(request, token):
+    """Point the request at another cart (None for none); the response updates the cookie."""
+    request.cart_token = token
+    request.cart_token_changed = True
+
+
+def touch_cart_token(request):
+    """The cart was written, so its server-side expiry moved; re-send the cookie to match."""
+    request.cart_token_changed = True
+
+
+class CartMiddleware:
+    """Sends the cart token cookie when a request changes the token or writes the cart."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if getattr(request, 'cart_token_changed', False):
+            if request.cart_token:
+                response.set_cookie(
+                    cookie_name(), request.cart_token, max_age=storage.ttl(),
+                    secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax',
+                )
+            else:
+                response.delete_cookie(cookie_name(), samesite='Lax')
+        if getattr(request, 'cart_accessed', False):
+            patch_vary_headers(response, ('Cookie',))
+        return response
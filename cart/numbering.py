@@ -0,0 +1,78 @@
+"""
+Order numbers from a block-reserved sequence.
+
+An order number is the day it was placed plus a counter, e.g.
+``261018-00004217``. The counter is the ``order`` row of Sequence, which
+only ever goes up, so numbers sort by time and new ones land at the end
+of the unique index instead of at random places in it.
+
+Each process reserves ``ORDER_NUMBER_BLOCK_SIZE`` numbers at a time with
+one conditional UPDATE, and then hands them out from memory. The UPDATE
+locks the row until its short transaction commits, so two processes can
+never get overlapping blocks. A process that forks discards the block it
+inherited. Numbers are unique across workers and increasing within each
+one. Across workers they interleave by at most one block. Numbers left
+in a block when its process exits are never used, so gaps are expected.
+
+Blocks must be reserved outside any long transaction. A rollback would
+free the block in the database while this process kept handing it out,
+and a long transaction would hold every other worker's reservation
+behind it. ``cart.orders.place_order()`` takes its number before its
+transaction for this reason.
+"""
+import os
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from cart.models import Sequence
+
+SEQUENCE_NAME = 'order'
+DEFAULT_BLOCK_SIZE = 20
+COUNTER_DIGITS = 8
+
+
+def block_size():
+    return getattr(settings, 'ORDER_NUMBER_BLOCK_SIZE', DEFAULT_BLOCK_SIZE)
+
+
+def reserve_block(name, size):
+    """Reserve the next ``size`` values of sequence ``name``; returns ``(first, last)``."""
+    with transaction.atomic():
+        if not Sequence.objects.filter(name=name).update(last_value=F('last_value') + size):
+            Sequence.objects.get_or_create(name=name)
+            Sequence.objects.filter(name=name).update(last_value=F('last_value') + size)
+        last = Sequence.objects.filter(name=name).values_list('last_value', flat=True).get()
+    return last - size + 1, last
+
+
+class Allocator:
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._next = self._last = 0
+        self._pid = None
+
+    def next_value(self):
+        with self._lock:
+            if self._pid != os.getpid() or self._next > self._last:
+                self._next, self._last = reserve_block(self.name, block_size())
+                self._pid = os.getpid()
+            value = self._next
+            self._next += 1
+            return value
+
+
+order_numbers = Allocator(SEQUENCE_NAME)
+
+
+def format_order_number(value, day=None):
+    day = day or timezone.localdate()
+    return f'{day:%y%m%d}-{value:0{COUNTER_DIGITS}d}'
+
+
+def next_order_number():
+    return format_order_number(order_numbers.next_value())
@@ -0,0 +1,141 @@
+"""
+Stock held for carts in checkout.
+
+Stock is only ever changed with a conditional UPDATE, which decrements
+only if enough is left:
+
+    UPDATE inventory SET stock_quantity = stock_quantity - n
+     WHERE product_id = p AND stock_quantity >= n
+
+The database applies the check and the write to a row as one step, so two
+checkouts can never both take the last unit, whatever the interleaving.
+``reserve()`` runs one such UPDATE per cart line, in product id order so
+concurrent carts lock rows in the same order, inside a single
+transaction. If any line falls short, the whole reservation rolls back.
+
+Opening checkout reserves the cart's lines for ``CART_RESERVATION_TTL``
+seconds, recorded as StockReservation rows. Placing the order
+(``confirm()``) re-takes the hold and deletes the rows, so the decrement
+becomes permanent. Changing the cart releases its hold. Holds that time
+out go back to stock in ``release_expired()`` (the
+``release_expired_reservations`` command), or earlier, when another cart
+runs short on the same product.
+
+A reservation row is restocked only by whoever deletes it, so a release
+racing an expiry sweep returns the units once.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from admin_dashboard.models import Inventory
+from cart.models import StockReservation
+
+DEFAULT_TTL = 15 * 60
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, requested):
+        super().__init__(f'Not enough stock of product {product_id} for {requested}')
+        self.product_id = product_id
+        self.requested = requested
+
+
+def ttl():
+    return getattr(settings, 'CART_RESERVATION_TTL', DEFAULT_TTL)
+
+
+def _take(product_id, quantity):
+    return Inventory.objects.filter(product_id=product_id, stock_quantity__gte=quantity).update(
+        stock_quantity=F('stock_quantity') - quantity
+    )
+
+
+def _restock(reservations):
+    """Delete ``reservations`` and put their units back; returns the product id of each one released."""
+    restocked = []
+    for pk, product_id, quantity in list(reservations.order_by('product_id').values_list('pk', 'product_id', 'quantity')):
+        if StockReservation.objects.filter(pk=pk).delete()[0]:
+            Inventory.objects.filter(product_id=product_id).update(stock_quantity=F('stock_quantity') + quantity)
+            restocked.append(product_id)
+    return restocked
+
+
+def _stock_changed(product_ids):
+    # Conditional UPDATEs skip Inventory's signals; refresh the in-stock
+    # flags of products that sold out or came back.
+    from shop import cards
+    from shop.facets import facet_index
+    from shop.models import Product, ProductCard
+
+    stock = dict(Inventory.objects.filter(product_id__in=product_ids).values_list('product_id', 'stock_quantity'))
+    shown = dict(ProductCard.objects.filter(pk__in=product_ids).values_list('pk', 'in_stock'))
+    changed = [pk for pk, in_stock in shown.items() if in_stock != (stock.get(pk, 0) > 0)]
+    for product_id in changed:
+        Product.touch(product_id)
+        facet_index.stock_changed(product_id, stock.get(product_id, 0))
+    cards.refresh(changed)
+
+
+def _after_commit(product_ids):
+    if product_ids:
+        product_ids = set(product_ids)
+        # Best effort: the stock change is committed by now whatever happens here.
+        transaction.on_commit(lambda: _stock_changed(product_ids), robust=True)
+
+
+def reserve(token, lines):
+    """
+    Hold ``{product_id: quantity}`` for cart ``token``, replacing any hold
+    it already has. All or nothing; raises InsufficientStock for the first
+    line that falls short. Returns when the hold expires.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=ttl())
+    with transaction.atomic():
+        touched = set(_restock(StockReservation.objects.filter(cart_token=token)))
+        for product_id, quantity in sorted(lines.items()):
+            if quantity <= 0:
+                continue
+            if not _take(product_id, quantity):
+                # Expired holds on this product may be all that is in the way.
+                expired = StockReservation.objects.filter(product_id=product_id, expires_at__lte=now)
+                if not (_restock(expired) and _take(product_id, quantity)):
+                    raise InsufficientStock(product_id, quantity)
+            touched.add(product_id)
+        StockReservation.objects.bulk_create([
+            StockReservation(cart_token=token, product_id=product_id, quantity=quantity, expires_at=expires_at)
+            for product_id, quantity in lines.items() if quantity > 0
+        ])
+        _after_commit(touched)
+    return expires_at
+
+
+def confirm(token, lines):
+    """
+    Take ``lines`` out of stock for good, for an order being placed by cart
+    ``token``. Call it inside the transaction that writes the order, so a
+    failed order puts the stock back. Raises InsufficientStock.
+    """
+    with transaction.atomic():
+        reserve(token, lines)
+        StockReservation.objects.filter(cart_token=token).delete()
+
+
+def release(token):
+    """Return cart ``token``'s hold, if any, to stock."""
+    if not token:
+        return
+    with transaction.atomic():
+        _after_commit(_restock(StockReservation.objects.filter(cart_token=token)))
+
+
+def release_expired():
+    """Return every expired hold to stock; returns how many were released."""
+    with transaction.atomic():
+        restocked = _restock(StockReservation.objects.filter(expires_at__lte=timezone.now()))
+        _after_commit(restocked)
+    return len(restocked)
@@ -0,0 +1,33 @@
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+
+from cart import reservations
+from cart.middleware import get_cart_token, set_cart_token
+from cart.storage import get_storage
+
+
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """Fold the anonymous cart into the user's cart, or make it theirs if they have none."""
+    if request is None:
+        return
+    storage = get_storage()
+    anonymous = get_cart_token(request)
+    own = storage.token_for_user(user.pk)
+    if own is None:
+        if anonymous and storage.load(anonymous):
+            storage.assign_user(anonymous, user.pk)
+        return
+    if anonymous and anonymous != own:
+        storage.merge(anonymous, own)
+        reservations.release(anonymous)
+    if anonymous != own:
+        set_cart_token(request, own)
+
+
+def forget_cart_on_logout(sender, request, user, **kwargs):
+    # The cart stays with the account, not on a shared computer.
+    if request is not None and user is not None and get_cart_token(request):
+        set_cart_token(request, None)
+
+
+user_logged_in.connect(merge_cart_on_login, dispatch_uid='cart_merge_on_login')
+user_logged_out.connect(forget_cart_on_logout, dispatch_uid='cart_forget_on_logout')
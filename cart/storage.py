@@ -0,0 +1,218 @@
+"""
+Where carts live between requests.
+
+A cart is found by a random token in the ``CART_COOKIE_NAME`` cookie
+(set by ``cart.middleware.CartMiddleware``), not by the session. Changing
+one line writes that line only, and the session row is never touched.
+
+``CART_STORAGE`` picks the backend:
+
+* ``DatabaseCartStorage`` (default) keeps ``StoredCart``/``StoredCartLine``
+  rows and upserts one line per change;
+* ``CacheCartStorage`` keeps one cache key per line plus an index of the
+  cart's product ids, for deployments with a shared cache.
+
+Both forget a cart ``CART_TTL`` seconds after its last change. The
+database backend needs ``purge_expired_carts`` to reclaim the rows.
+"""
+import secrets
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from cart.models import StoredCart, StoredCartLine
+
+DEFAULT_TTL = 60 * 60 * 24 * 30
+# A cart's expiry is pushed back at most this often, not on every change.
+EXPIRY_REFRESH = timedelta(hours=1)
+
+
+def new_token():
+    return secrets.token_urlsafe(32)
+
+
+def ttl():
+    return getattr(settings, 'CART_TTL', DEFAULT_TTL)
+
+
+class BaseCartStorage:
+    """Lines are ``{product_id: (quantity, Decimal price)}``."""
+
+    def load(self, token):
+        raise NotImplementedError
+
+    def set_line(self, token, product_id, quantity, price):
+        raise NotImplementedError
+
+    def remove_line(self, token, product_id):
+        raise NotImplementedError
+
+    def clear(self, token):
+        raise NotImplementedError
+
+    def token_for_user(self, user_id):
+        raise NotImplementedError
+
+    def assign_user(self, token, user_id):
+        raise NotImplementedError
+
+    def merge(self, source, target):
+        """Add ``source``'s lines into ``target`` (summing quantities) and delete ``source``."""
+        target_lines = self.load(target)
+        for product_id, (quantity, price) in self.load(source).items():
+            if product_id in target_lines:
+                quantity += target_lines[product_id][0]
+            self.set_line(target, product_id, quantity, price)
+        self.clear(source)
+
+    def purge_expired(self):
+        """Delete expired carts; returns how many. Backends that expire by themselves return 0."""
+        return 0
+
+
+class DatabaseCartStorage(BaseCartStorage):
+    def load(self, token):
+        rows = StoredCartLine.objects.filter(
+            cart__token=token, cart__expires_at__gt=timezone.now()
+        ).values_list('product_id', 'quantity', 'price')
+        return {product_id: (quantity, price) for product_id, quantity, price in rows}
+
+    def _cart_id(self, token):
+        """Id of ``token``'s cart, created or revived, with its expiry pushed back if due."""
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=ttl())
+        row = StoredCart.objects.filter(token=token).values_list('pk', 'expires_at').first()
+        if row is None:
+            cart, _ = StoredCart.objects.get_or_create(token=token, defaults={'expires_at': expires_at})
+            return cart.pk
+        cart_id, current_expiry = row
+        if current_expiry <= now:
+            # Expired but not purged yet: start it over empty.
+            with transaction.atomic():
+                StoredCartLine.objects.filter(cart_id=cart_id).delete()
+                StoredCart.objects.filter(pk=cart_id).update(expires_at=expires_at)
+        elif expires_at - current_expiry > EXPIRY_REFRESH:
+            StoredCart.objects.filter(pk=cart_id).update(expires_at=expires_at)
+        return cart_id
+
+    def set_line(self, token, product_id, quantity, price):
+        StoredCartLine.objects.bulk_create(
+            [StoredCartLine(cart_id=self._cart_id(token), product_id=product_id, quantity=quantity, price=price)],
+            update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity', 'price'],
+        )
+
+    def remove_line(self, token, product_id):
+        StoredCartLine.objects.filter(cart__token=token, product_id=product_id).delete()
+
+    def clear(self, token):
+        StoredCart.objects.filter(token=token).delete()
+
+    def token_for_user(self, user_id):
+        return StoredCart.objects.filter(user_id=user_id, expires_at__gt=timezone.now()).values_list(
+            'token', flat=True
+        ).first()
+
+    def assign_user(self, token, user_id):
+        self._cart_id(token)
+        with transaction.atomic():
+            others = StoredCart.objects.filter(user_id=user_id).exclude(token=token)
+            others.filter(expires_at__lte=timezone.now()).delete()
+            if others.exists():
+                return  # they already have a live cart (made by a concurrent request); never discard it
+            StoredCart.objects.filter(token=token).update(user_id=user_id)
+
+    def merge(self, source, target):
+        with transaction.atomic():
+            target_id = self._cart_id(target)
+            existing = set(StoredCartLine.objects.filter(cart_id=target_id).values_list('product_id', flat=True))
+            for product_id, (quantity, price) in self.load(source).items():
+                if product_id in existing:
+                    StoredCartLine.objects.filter(cart_id=target_id, product_id=product_id).update(
+                        quantity=F('quantity') + quantity, price=price,
+                    )
+                else:
+                    StoredCartLine.objects.create(cart_id=target_id, product_id=product_id, quantity=quantity, price=price)
+            StoredCart.objects.filter(token=source).delete()
+
+    def purge_expired(self):
+        return StoredCart.objects.filter(expires_at__lte=timezone.now()).delete()[1].get('cart.StoredCart', 0)
+
+
+class CacheCartStorage(BaseCartStorage):
+    KEY_PREFIX = 'cart:'
+
+    def _index_key(self, token):
+        return f'{self.KEY_PREFIX}{token}:index'
+
+    def _line_key(self, token, product_id):
+        return f'{self.KEY_PREFIX}{token}:line:{product_id}'
+
+    def _user_key(self, user_id):
+        return f'{self.KEY_PREFIX}user:{user_id}'
+
+    def _index(self, token):
+        """``(product ids, when their keys' expiry was last pushed back)``."""
+        return cache.get(self._index_key(token)) or ([], None)
+
+    def _save_index(self, token, product_ids, refreshed_at):
+        now = timezone.now()
+        if refreshed_at is None or now - refreshed_at > EXPIRY_REFRESH:
+            # Keep older lines alive as long as the cart itself.
+            for product_id in product_ids:
+                cache.touch(self._line_key(token, product_id), ttl())
+            refreshed_at = now
+        cache.set(self._index_key(token), (product_ids, refreshed_at), ttl())
+
+    def load(self, token):
+        product_ids, _ = self._index(token)
+        if not product_ids:
+            return {}
+        stored = cache.get_many([self._line_key(token, product_id) for product_id in product_ids])
+        lines = {}
+        for product_id in product_ids:
+            line = stored.get(self._line_key(token, product_id))
+            if line is not None:
+                lines[product_id] = (line[0], Decimal(line[1]))
+        return lines
+
+    def set_line(self, token, product_id, quantity, price):
+        cache.set(self._line_key(token, product_id), (quantity, str(price)), ttl())
+        product_ids, refreshed_at = self._index(token)
+        if product_id not in product_ids:
+            product_ids = product_ids + [product_id]
+        self._save_index(token, product_ids, refreshed_at)
+
+    def remove_line(self, token, product_id):
+        cache.delete(self._line_key(token, product_id))
+        product_ids, refreshed_at = self._index(token)
+        if product_id in product_ids:
+            self._save_index(token, [pk for pk in product_ids if pk != product_id], refreshed_at)
+
+    def clear(self, token):
+        product_ids, _ = self._index(token)
+        cache.delete_many([self._index_key(token)] + [self._line_key(token, product_id) for product_id in product_ids])
+
+    def token_for_user(self, user_id):
+        return cache.get(self._user_key(user_id))
+
+    def assign_user(self, token, user_id):
+        current = self.token_for_user(user_id)
+        if current and current != token and self._index(current)[0]:
+            return  # they already have a live cart; never discard it
+        cache.set(self._user_key(user_id), token, ttl())
+
+
+_storage = None
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        _storage = import_string(getattr(settings, 'CART_STORAGE', 'cart.storage.DatabaseCartStorage'))()
+    return _storage
@@ -1,3 +1,208 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone, translation
+
+from admin_dashboard.models import Inventory
+from cart import reservations
+from cart.cart import Cart
+from cart.middleware import cookie_name
+from cart.models import StockReservation
+from cart.storage import get_storage, ttl as storage_ttl
+from shop.models import Category, Product
+
+
+def make_product(stock, sku='SKU-1'):
+    category, _ = Category.objects.get_or_create(slug='phones', defaults={'name': 'Phones'})
+    product = Product.objects.create(name=sku, slug=sku.lower(), category=category, price=Decimal('10.00'), sku=sku)
+    Inventory.objects.create(product=product, stock_quantity=stock)
+    return product
+
+
+def stock_of(product):
+    return Inventory.objects.get(product=product).stock_quantity
+
+
+class CartOwnershipTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def make_request(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        request.session = SessionStore()
+        return request
+
+    def test_signed_in_visitor_without_cookie_keeps_their_saved_cart(self):
+        user = User.objects.create_user('shopper', password='secret')
+        saved, added = make_product(5, 'SKU-1'), make_product(5, 'SKU-2')
+        token = 'a' * 43
+        storage = get_storage()
+        storage.set_line(token, saved.pk, 2, saved.price)
+        storage.assign_user(token, user.pk)
+
+        request = self.make_request(user)  # a new browser: no cart cookie
+        cart = Cart(request)
+        cart.add(added)
+
+        self.assertEqual(cart.token, token)
+        self.assertTrue(request.cart_token_changed)
+        self.assertEqual(storage.load(token), {saved.pk: (2, saved.price), added.pk: (1, added.price)})
+
+
+class CartCookieTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_writing_the_cart_resends_the_cookie(self):
+        product = make_product(5)
+        token = 'b' * 43
+        get_storage().set_line(token, product.pk, 1, product.price)
+        self.client.cookies[cookie_name()] = token
+
+        with translation.override('en'):
+            url = reverse('cart:cart_add')
+        response = self.client.post(url, {'product_id': product.pk}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        cookie = response.cookies[cookie_name()]
+        self.assertEqual(cookie.value, token)
+        self.assertEqual(cookie['max-age'], storage_ttl())
+
+
+class CartUpdateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_item_count_matches_the_priced_lines(self):
+        kept, withdrawn = make_product(5, 'SKU-1'), make_product(5, 'SKU-2')
+        token = 'c' * 43
+        get_storage().set_line(token, withdrawn.pk, 3, withdrawn.price)
+        Product.objects.filter(pk=withdrawn.pk).update(is_active=False)
+        self.client.cookies[cookie_name()] = token
+
+        with translation.override('en'):
+            url = reverse('cart:cart_update')
+        response = self.client.post(
+            url, {'product_id': kept.pk, 'quantity': 2}, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+
+        data = response.json()
+        self.assertEqual(data['cart_total_items'], 2)
+        self.assertEqual(data['cart_total'], 20.0)
+
+    def test_add_and_remove_count_the_same_priced_lines(self):
+        kept, withdrawn, removed = make_product(5, 'SKU-1'), make_product(5, 'SKU-2'), make_product(5, 'SKU-3')
+        token = 'd' * 43
+        get_storage().set_line(token, withdrawn.pk, 3, withdrawn.price)
+        get_storage().set_line(token, removed.pk, 1, removed.price)
+        Product.objects.filter(pk=withdrawn.pk).update(is_active=False)
+        self.client.cookies[cookie_name()] = token
+
+        with translation.override('en'):
+            add_url, remove_url = reverse('cart:cart_add'), reverse('cart:cart_remove')
+        added = self.client.post(add_url, {'product_id': kept.pk, 'quantity': 2}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(added.json()['cart_total_items'], 3)
+        removed = self.client.post(remove_url, {'product_id': removed.pk}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(removed.json()['cart_total_items'], 2)
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_reserve_holds_stock_and_release_returns_it(self):
+        product = make_product(5)
+        reservations.reserve('cart-a', {product.pk: 3})
+        self.assertEqual(stock_of(product), 2)
+        reservations.reserve('cart-a', {product.pk: 4})  # replaces the earlier hold
+        self.assertEqual(stock_of(product), 1)
+        reservations.release('cart-a')
+        self.assertEqual(stock_of(product), 5)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_shortfall_on_any_line_reserves_nothing(self):
+        plenty, scarce = make_product(10, 'SKU-1'), make_product(1, 'SKU-2')
+        with self.assertRaises(reservations.InsufficientStock) as raised:
+            reservations.reserve('cart-a', {plenty.pk: 2, scarce.pk: 2})
+        self.assertEqual(raised.exception.product_id, scarce.pk)
+        self.assertEqual((stock_of(plenty), stock_of(scarce)), (10, 1))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_confirm_makes_the_decrement_permanent(self):
+        product = make_product(5)
+        reservations.reserve('cart-a', {product.pk: 2})
+        reservations.confirm('cart-a', {product.pk: 2})
+        reservations.release('cart-a')
+        self.assertEqual(stock_of(product), 3)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_holds_are_released(self):
+        product = make_product(2)
+        reservations.reserve('cart-a', {product.pk: 2})
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        # Another cart running short takes the expired hold's units back first.
+        reservations.reserve('cart-b', {product.pk: 1})
+        self.assertEqual(stock_of(product), 1)
+        self.assertEqual(reservations.release_expired(), 0)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(reservations.release_expired(), 1)
+        self.assertEqual(stock_of(product), 2)
+
+
+class StockReservationConcurrencyTests(TransactionTestCase):
+    STOCK = 25
+    THREADS = 16
+    ATTEMPTS = 8
+
+    def setUp(self):
+        cache.clear()
+
+    def test_many_threads_never_oversell_one_sku(self):
+        product = make_product(self.STOCK)
+        start = threading.Barrier(self.THREADS)
+        granted, refused, errors = [], [], []
+        lock = threading.Lock()
+
+        def shopper(number):
+            try:
+                start.wait()
+                for attempt in range(self.ATTEMPTS):
+                    token = f'cart-{number}-{attempt}'
+                    while True:
+                        try:
+                            reservations.confirm(token, {product.pk: 1})
+                        except reservations.InsufficientStock:
+                            outcome = refused
+                        except OperationalError as e:
+                            if 'locked' in str(e):  # SQLite allows one writer at a time; try again
+                                time.sleep(0.001)
+                                continue
+                            raise
+                        else:
+                            outcome = granted
+                        break
+                    with lock:
+                        outcome.append(token)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=shopper, args=(number,)) for number in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(granted) + len(refused), self.THREADS * self.ATTEMPTS)
+        self.assertEqual(len(granted), self.STOCK)
+        self.assertEqual(stock_of(product), 0)
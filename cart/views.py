@@ -1,10 +1,13 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.contrib import messages
 from django.http import JsonResponse
 from shop.models import Product
+from . import orders, reservations
 from .cart import Cart
-from .models import Order, OrderItem
-import random
-import string
+
+def _item_count(priced):
+    """Units in the cart that still price, i.e. leaving out withdrawn products."""
+    return sum(item.quantity for item in priced.lines.values())
 
 def cart_detail(request):
     return render(request, 'cart/cart.html')
@@ -20,7 +23,7 @@ def cart_add(request):
         
         return JsonResponse({
             'success': True,
-            'cart_total_items': len(cart),
+            'cart_total_items': _item_count(cart.priced()),
             'message': 'Product added to cart!'
         })
     return JsonResponse({'success': False})
@@ -35,7 +38,7 @@ def cart_remove(request):
         
         return JsonResponse({
             'success': True,
-            'cart_total_items': len(cart),
+            'cart_total_items': _item_count(cart.priced()),
             'message': 'Product removed from cart!'
         })
     return JsonResponse({'success': False})
@@ -48,18 +51,17 @@ def cart_update(request):
         product = get_object_or_404(Product, id=product_id, is_active=True)
         cart = Cart(request)
         cart.add(product, quantity, override_quantity=True)
-        
-        cart_item = None
-        for item in cart:
-            if str(item['product'].id) == product_id:
-                cart_item = item
-                break
+        priced = cart.priced(request.POST.get('coupon_code'))
+        line = priced.lines.get(product.id)
         
         return JsonResponse({
             'success': True,
-            'cart_total_items': len(cart),
-            'item_total': float(cart_item['total_price']) if cart_item else 0,
-            'cart_total': float(cart.get_total_price())
+            'cart_total_items': _item_count(priced),
+            'item_total': float(line.total if line else 0),
+            'subtotal': float(priced.subtotal),
+            'discount': float(priced.promotion_discount + priced.coupon_discount),
+            'coupon_error': priced.coupon_error,
+            'cart_total': float(priced.total)
         })
     return JsonResponse({'success': False})
 
@@ -69,29 +71,36 @@ def checkout(request):
         return redirect('cart:cart_detail')
     
     if request.method == 'POST':
-        # Generate order number
-        order_number = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
-        
-        order = Order.objects.create(
-            order_number=order_number,
-            full_name=request.POST.get('full_name'),
-            email=request.POST.get('email'),
-            phone=request.POST.get('phone'),
-            address=request.POST.get('address'),
-            city=request.POST.get('city'),
-            postal_code=request.POST.get('postal_code'),
-            total_amount=cart.get_total_price()
-        )
+        try:
+            placed = orders.place_order(cart, request.POST, request.POST.get('coupon_code'))
+        except reservations.InsufficientStock as e:
+            return _out_of_stock(request, e)
+        except orders.CheckoutError as e:
+            if not e.errors:
+                messages.error(request, str(e))
+                return redirect('cart:cart_detail')
+            coupon_code = None if 'coupon_code' in e.errors else request.POST.get('coupon_code')
+            return render(request, 'cart/checkout.html', {
+                'priced': cart.priced(coupon_code),
+                'errors': e.errors,
+                'details': request.POST,
+            }, status=400)
         
-        for item in cart:
-            OrderItem.objects.create(
-                order=order,
-                product=item['product'],
-                quantity=item['quantity'],
-                price=item['price']
-            )
-        
-        cart.clear()
-        return render(request, 'cart/checkout_success.html', {'order': order})
+        response = render(request, 'cart/checkout_success.html', {'order': placed.order})
+        response['Server-Timing'] = placed.server_timing()
+        return response
     
-    return render(request, 'cart/checkout.html')
\ No newline at end of file
+    # Hold the stock while the visitor fills in the form.
+    priced = cart.priced()
+    try:
+        reserved_until = reservations.reserve(
+            cart.token, {product_id: line.quantity for product_id, line in priced.lines.items()}
+        )
+    except reservations.InsufficientStock as e:
+        return _out_of_stock(request, e)
+    return render(request, 'cart/checkout.html', {'priced': priced, 'reserved_until': reserved_until})
+
+def _out_of_stock(request, error):
+    name = Product.objects.filter(pk=error.product_id).values_list('name', flat=True).first()
+    messages.error(request, f'Sorry, we do not have {error.requested} of {name} in stock any more.')
+    return redirect('cart:cart_detail')
\ No newline at end of file
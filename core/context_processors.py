@@ -1,30 +1,59 @@
+from django.utils.functional import SimpleLazyObject
+
 from core.models import SiteSettings
 from admin_dashboard.models import DefaultSiteSetting
-from shop.models import Category
+from shop import category_tree
 from cart.cart import Cart
 
+MEMO_ATTRIBUTE = '_context_memo'
+
+
+def request_memo(request, key, factory):
+    """``factory()``'s result, computed once per request and shared by every render in it."""
+    memo = request.__dict__.setdefault(MEMO_ATTRIBUTE, {})
+    if key not in memo:
+        memo[key] = factory()
+    return memo[key]
+
+
+def lazy(request, key, factory):
+    """Context value that costs nothing until a template reads it."""
+    return SimpleLazyObject(lambda: request_memo(request, key, factory))
+
+
+class LazyTemplateName:
+    """
+    A template name computed on first use. ``{% include %}`` treats a
+    non-string name as a sequence of candidates, hence ``__iter__``.
+    """
+    def __init__(self, factory):
+        self._factory = factory
+
+    def __str__(self):
+        return self._factory()
+
+    def __iter__(self):
+        yield str(self)
+
+
+def get_cart(request):
+    return request_memo(request, 'cart', lambda: Cart(request))
+
+
 def site_settings(request):
-    # Use DefaultSiteSetting for basic settings
-    default_settings = DefaultSiteSetting.get_default_settings()
-    
-    # Use SiteSettings for header/footer templates (from your existing code)
-    settings = SiteSettings.get_settings()
-    
-    # Determine which header and footer to use
-    header_template = f'includes/headers/{settings.active_header}.html'
-    footer_template = f'includes/footers/{settings.active_footer}.html'
-    
-    # Get categories for menus
-    categories = Category.objects.filter(is_active=True, parent__isnull=True)[:8]
-    
-    # Get cart count
-    cart = Cart(request)
+    # Every value is lazy: AJAX fragments and admin pages that never show
+    # the header, footer or cart pay nothing for them.
+    def settings():
+        # SiteSettings drives the header/footer templates
+        return request_memo(request, 'site_settings', SiteSettings.get_settings)
     
     return {
-        'site_settings': settings,  # For header/footer templates
-        'default_settings': default_settings,  # For basic site info
-        'header_template': header_template,
-        'footer_template': footer_template,
-        'categories': categories,
-        'cart': cart,
-    }
\ No newline at end of file
+        'site_settings': lazy(request, 'site_settings', SiteSettings.get_settings),
+        # DefaultSiteSetting holds the basic site info
+        'default_settings': lazy(request, 'default_settings', DefaultSiteSetting.get_default_settings),
+        'header_template': LazyTemplateName(lambda: f'includes/headers/{settings().active_header}.html'),
+        'footer_template': LazyTemplateName(lambda: f'includes/footers/{settings().active_footer}.html'),
+        # Categories for menus
+        'categories': lazy(request, 'categories', lambda: category_tree.get_tree().roots[:8]),
+        'cart': SimpleLazyObject(lambda: get_cart(request)),
+    }
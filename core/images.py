@@ -0,0 +1,194 @@
+"""
+Responsive image derivatives.
+
+After an upload, ``schedule()`` hands the stored file to a process pool.
+The pool writes fixed-width copies in the source format and in WebP under
+predictable names::
+
+    products/shirt.jpg -> derivatives/products/shirt/400w.jpg
+                          derivatives/products/shirt/400w.webp
+
+Widths at or above the original's are skipped, since upscaling saves
+nothing. When they are written, the list of widths is recorded in the
+cache, and ``srcset()`` only lists widths that exist. A process that did
+not see the result (another worker, or after expiry) rediscovers it from
+storage once and caches that. An image whose derivatives are not ready yet
+is served as its original.
+"""
+import io
+import logging
+import multiprocessing
+import os
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = (200, 400, 800, 1200)
+DERIVATIVE_ROOT = 'derivatives'
+MANIFEST_KEY_PREFIX = 'images:derivatives:'
+MANIFEST_TIMEOUT = 60 * 60 * 24 * 30
+MISSING_TIMEOUT = 60
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+# Source format -> (extension, Pillow format) of its same-format derivatives.
+FORMATS = {
+    'JPEG': ('jpg', 'JPEG'),
+    'PNG': ('png', 'PNG'),
+    'GIF': ('png', 'PNG'),
+    'WEBP': ('webp', 'WEBP'),
+}
+EXTENSIONS = {'.jpg': 'jpg', '.jpeg': 'jpg', '.png': 'png', '.gif': 'png', '.webp': 'webp'}
+
+
+def derivative_name(name, width, extension):
+    stem, _ = posixpath.splitext(name)
+    return f'{DERIVATIVE_ROOT}/{stem}/{width}w.{extension}'
+
+
+def _manifest_key(name):
+    return MANIFEST_KEY_PREFIX + name
+
+
+def generate(name):
+    """
+    Write every derivative of the stored image ``name``; runs in a pool worker.
+    Returns ``{'widths': [...], 'extension': 'jpg'}``.
+    """
+    from PIL import Image, ImageOps
+
+    with default_storage.open(name, 'rb') as source:
+        original = Image.open(source)
+        original.load()
+    source_format = original.format or 'JPEG'
+    extension, pil_format = FORMATS.get(source_format, FORMATS['JPEG'])
+    image = ImageOps.exif_transpose(original)
+    if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    widths = []
+    for width in WIDTHS:
+        if width >= image.width:
+            break
+        height = round(image.height * width / image.width)
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        for ext, fmt, options in (
+            (extension, pil_format, {'quality': JPEG_QUALITY, 'optimize': True}),
+            ('webp', 'WEBP', {'quality': WEBP_QUALITY, 'method': 4}),
+        ):
+            buffer = io.BytesIO()
+            resized.save(buffer, fmt, **options)
+            target = derivative_name(name, width, ext)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            default_storage.save(target, ContentFile(buffer.getvalue()))
+        widths.append(width)
+    return {'widths': widths, 'extension': extension}
+
+
+def delete_derivatives(name):
+    for width in WIDTHS:
+        for extension in ('jpg', 'png', 'webp'):
+            target = derivative_name(name, width, extension)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+    cache.delete(_manifest_key(name))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', None) or max(1, (os.cpu_count() or 2) // 2)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+        return _pool
+
+
+def record(name, result, on_ready=None):
+    """Publish ``generate(name)``'s result so ``srcset()`` starts listing it."""
+    cache.set(_manifest_key(name), result, MANIFEST_TIMEOUT)
+    if on_ready is not None:
+        on_ready()
+
+
+def schedule(name, on_ready=None):
+    """Generate ``name``'s derivatives in the pool; ``on_ready()`` runs here once they exist."""
+    if not name:
+        return
+    if not getattr(settings, 'IMAGE_DERIVATIVES_ASYNC', True):
+        try:
+            result = generate(name)
+        except Exception:
+            logger.exception('Generating derivatives of %s failed', name)
+            return
+        record(name, result, on_ready)
+        return
+
+    def done(future):
+        try:
+            result = future.result()
+        except Exception:
+            logger.exception('Generating derivatives of %s failed', name)
+            return
+        record(name, result, on_ready)
+
+    get_pool().submit(generate, name).add_done_callback(done)
+
+
+def storage_name(image):
+    """Storage name from an ImageField value, a storage name or a MEDIA_URL URL."""
+    name = getattr(image, 'name', image) or ''
+    if name.startswith(settings.MEDIA_URL):
+        name = name[len(settings.MEDIA_URL):]
+    return name
+
+
+def _discover(name):
+    extension = EXTENSIONS.get(posixpath.splitext(name)[1].lower(), 'jpg')
+    widths = [width for width in WIDTHS if default_storage.exists(derivative_name(name, width, 'webp'))]
+    return {'widths': widths, 'extension': extension}
+
+
+def manifest(image):
+    """``{'widths': [...], 'extension': ...}`` once ``image``'s derivatives exist, else None."""
+    name = storage_name(image)
+    if not name:
+        return None
+    key = _manifest_key(name)
+    known = cache.get(key)
+    if known is None:
+        known = _discover(name)
+        cache.set(key, known, MANIFEST_TIMEOUT if known['widths'] else MISSING_TIMEOUT)
+    return known if known['widths'] else None
+
+
+def srcset(image, webp=False, known=None):
+    """``srcset`` attribute value for ``image``'s derivatives ('' if none exist yet)."""
+    known = known or manifest(image)
+    if not known:
+        return ''
+    name = storage_name(image)
+    extension = 'webp' if webp else known['extension']
+    return ', '.join(
+        f'{default_storage.url(derivative_name(name, width, extension))} {width}w' for width in known['widths']
+    )
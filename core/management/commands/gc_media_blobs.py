@@ -0,0 +1,30 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from core import storage
+
+
+class Command(BaseCommand):
+    help = 'Delete uploaded media blobs that no file field references any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help='Keep unreferenced blobs uploaded more recently than this')
+        parser.add_argument('--recount', action='store_true',
+                            help='Recompute reference counts from the database first')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['recount']:
+            referenced = storage.recount()
+            self.stdout.write(f'{referenced} blobs are referenced')
+        removed, freed = storage.collect(timedelta(hours=options['grace_hours']), dry_run=options['dry_run'])
+        elapsed = time.perf_counter() - started
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {removed} files ({filesizeformat(freed)}) in {elapsed:.2f}s'
+        ))
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from admin_dashboard.models import Brand
+from core import images
+from shop.models import Category, ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Generate responsive derivatives for every product image, category image and brand logo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true', help='Skip images whose derivatives are recorded')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        names = set()
+        for model, field in ((ProductImage, 'image'), (Category, 'image'), (Brand, 'logo')):
+            stored = model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+            names.update(stored.values_list(field, flat=True))
+        if options['missing']:
+            names = {name for name in names if images.manifest(name) is None}
+
+        pool = images.get_pool()
+        futures = {pool.submit(images.generate, name): name for name in sorted(names)}
+        done = failed = 0
+        for future, name in futures.items():
+            try:
+                images.record(name, future.result())
+                done += 1
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f'{name}: {exc}')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated derivatives for {done} images ({failed} failed) in {elapsed:.1f}s'
+        ))
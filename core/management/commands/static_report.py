@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from core import staticfiles
+
+
+def _saved(size, compressed):
+    if compressed is None:
+        return '-'
+    return f'{filesizeformat(compressed)} (-{100 - compressed * 100 // size}%)'
+
+
+class Command(BaseCommand):
+    help = 'Show what precompression saved for each collected static asset'
+
+    def handle(self, *args, **options):
+        report = staticfiles.load_report()
+        if not report:
+            self.stdout.write('No compression report; run collectstatic first.')
+            return
+        if staticfiles.brotli is None:
+            self.stdout.write(self.style.WARNING('brotli is not installed; no .br files are written.'))
+        totals = {'size': 0, 'gzip': 0, 'br': 0}
+        self.stdout.write(f'{"asset":<50} {"original":>10} {"gzip":>18} {"brotli":>18}')
+        for name, entry in sorted(report.items(), key=lambda item: -item[1]['size']):
+            self.stdout.write(
+                f'{name:<50} {filesizeformat(entry["size"]):>10} '
+                f'{_saved(entry["size"], entry.get("gzip")):>18} {_saved(entry["size"], entry.get("br")):>18}'
+            )
+            totals['size'] += entry['size']
+            for encoding in ('gzip', 'br'):
+                totals[encoding] += entry.get(encoding) or entry['size']
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(report)} assets, {filesizeformat(totals["size"])}: '
+            f'gzip saves {filesizeformat(totals["size"] - totals["gzip"])}, '
+            f'brotli saves {filesizeformat(totals["size"] - totals["br"])}'
+        ))
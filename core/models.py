@@ -121,4 +121,26 @@ class ContactMessage(models.Model):
     is_read = models.BooleanField(default=False)
     
     def __str__(self):
-        return f"Message from {self.name}"
\ No newline at end of file
+        return f"Message from {self.name}"
+
+class MediaBlob(models.Model):
+    """
+    One unique uploaded file in ``core.storage.ContentAddressedStorage``.
+
+    ``refcount`` is the number of file fields naming it; blobs at zero are
+    removed by ``gc_media_blobs``.
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_saved_at = models.DateTimeField(help_text="Last time this content was uploaded")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['refcount', 'last_saved_at'], name='core_blob_collectable'),
+        ]
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,176 @@
+"""
+On-demand resizing for ``/media/r/<w>x<h>/<path>``.
+
+Only sizes listed in ``IMAGE_RESIZE_SIZES`` are rendered, so the URL space
+cannot be used to fill the disk. A render crops the source to cover
+exactly ``w`` x ``h`` (like ``object-fit: cover``) and keeps its format.
+
+Rendered files are content-addressed. Their name is a hash of the
+source's bytes, the size and ``RENDER_VERSION``, so two uploads of the
+same picture share one file, and replacing a source orphans its old
+renders instead of serving them stale. The same hash is the ETag. Hashing
+a source is remembered per (name, size, mtime), so a cache hit costs two
+stats and no reads of the original.
+
+Concurrent requests for a derivative that is not on disk yet wait for the
+first one's render instead of starting their own. Files are written under
+a temporary name and renamed into place, so another process that renders
+the same file at the same moment cannot expose a partial one.
+
+In production the web server must pass ``MEDIA_URL + 'r/'`` to Django
+rather than look it up under MEDIA_ROOT.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from core.images import storage_name
+
+RENDER_VERSION = 1
+DEFAULT_SIZES = ((100, 100), (200, 200), (300, 300), (400, 400), (600, 600), (800, 800), (1200, 630))
+SOURCE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+MAX_REMEMBERED_SOURCES = 10000
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+# Pillow format of the source -> (extension, content type, Pillow save format) of its renders.
+OUTPUTS = {
+    'JPEG': ('jpg', 'image/jpeg', 'JPEG'),
+    'PNG': ('png', 'image/png', 'PNG'),
+    'GIF': ('png', 'image/png', 'PNG'),
+    'WEBP': ('webp', 'image/webp', 'WEBP'),
+}
+CONTENT_TYPES = {extension: content_type for extension, content_type, _ in OUTPUTS.values()}
+
+
+class ResizeError(Exception):
+    """The requested render is not allowed or its source does not exist."""
+
+
+def allowed_sizes():
+    return {tuple(size) for size in getattr(settings, 'IMAGE_RESIZE_SIZES', DEFAULT_SIZES)}
+
+
+def cache_dir():
+    return Path(getattr(settings, 'IMAGE_RESIZE_CACHE_DIR', None) or Path(settings.MEDIA_ROOT) / 'cache' / 'resized')
+
+
+class Rendered:
+    def __init__(self, digest, path):
+        self.digest = digest
+        self.path = path
+
+    @property
+    def content_type(self):
+        return CONTENT_TYPES[self.path.suffix[1:]]
+
+
+class Resizer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources = OrderedDict()  # (name, size, mtime) -> sha256 of the source's bytes
+        self._inflight = {}  # digest -> Event set once that render is on disk
+
+    def _source_digest(self, name):
+        try:
+            stamp = (name, default_storage.size(name), default_storage.get_modified_time(name).timestamp())
+        except (FileNotFoundError, NotImplementedError, OSError):
+            raise ResizeError(f'No image at {name}')
+        with self._lock:
+            digest = self._sources.get(stamp)
+            if digest is not None:
+                self._sources.move_to_end(stamp)
+                return digest
+        hasher = hashlib.sha256()
+        with default_storage.open(name, 'rb') as source:
+            for chunk in source.chunks():
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        with self._lock:
+            self._sources[stamp] = digest
+            while len(self._sources) > MAX_REMEMBERED_SOURCES:
+                self._sources.popitem(last=False)
+        return digest
+
+    def locate(self, name, width, height):
+        """Digest and on-disk path the render of ``name`` at ``width`` x ``height`` has or will have."""
+        if (width, height) not in allowed_sizes():
+            raise ResizeError(f'{width}x{height} is not an allowed size')
+        name = posixpath.normpath(name).lstrip('/')
+        if name.startswith('..') or posixpath.splitext(name)[1].lower() not in SOURCE_EXTENSIONS:
+            raise ResizeError(f'Cannot resize {name}')
+        source_digest = self._source_digest(name)
+        digest = hashlib.sha256(f'{source_digest}|{width}x{height}|{RENDER_VERSION}'.encode()).hexdigest()
+        directory = cache_dir() / digest[:2]
+        for extension in CONTENT_TYPES:
+            path = directory / f'{digest}.{extension}'
+            if path.exists():
+                return Rendered(digest, path)
+        return Rendered(digest, None)
+
+    def get(self, name, width, height):
+        """The render on disk, produced now if needed; concurrent callers share one render."""
+        rendered = self.locate(name, width, height)
+        if rendered.path is not None:
+            return rendered
+        with self._lock:
+            done = self._inflight.get(rendered.digest)
+            owner = done is None
+            if owner:
+                done = self._inflight[rendered.digest] = threading.Event()
+        if not owner:
+            done.wait()
+            rendered = self.locate(name, width, height)
+            if rendered.path is None:
+                raise ResizeError(f'Rendering {name} at {width}x{height} failed')
+            return rendered
+        try:
+            return Rendered(rendered.digest, self._render(name, width, height, rendered.digest))
+        except (OSError, ValueError) as e:  # unreadable or not an image
+            raise ResizeError(f'Cannot render {name}: {e}') from e
+        finally:
+            with self._lock:
+                del self._inflight[rendered.digest]
+            done.set()
+
+    def _render(self, name, width, height, digest):
+        from PIL import Image, ImageOps
+
+        with default_storage.open(name, 'rb') as source:
+            image = Image.open(source)
+            image.load()
+        extension, _, save_format = OUTPUTS.get(image.format, OUTPUTS['JPEG'])
+        image = ImageOps.exif_transpose(image)
+        if save_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+        options = {'quality': WEBP_QUALITY} if save_format == 'WEBP' else {'quality': JPEG_QUALITY, 'optimize': True}
+
+        directory = cache_dir() / digest[:2]
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'{digest}.{extension}'
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as output:
+                image.save(output, save_format, **options)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        return path
+
+
+resizer = Resizer()
+
+
+def resized_url(image, width, height):
+    """URL of ``image`` (ImageField value, storage name or media URL) rendered at ``width`` x ``height``."""
+    name = storage_name(image)
+    return f'{settings.MEDIA_URL}r/{width}x{height}/{name}' if name else ''
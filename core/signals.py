@@ -0,0 +1,86 @@
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from admin_dashboard.models import Brand
+from core import images, storage
+from shop import cards
+from shop.models import Category, Product, ProductImage
+
+# Models whose uploads get responsive derivatives, and their image field.
+DERIVATIVE_FIELDS = {
+    ProductImage: 'image',
+    Category: 'image',
+    Brand: 'logo',
+}
+
+
+def _product_image_ready(product_id):
+    def ready():
+        # Runs on the pool's callback thread: move the product's card
+        # forward so cached fragments pick up the new srcset.
+        try:
+            Product.touch(product_id)
+            cards.refresh([product_id])
+        finally:
+            connection.close()
+    return ready
+
+
+def remember_new_upload(sender, instance, raw=False, **kwargs):
+    image = getattr(instance, DERIVATIVE_FIELDS[sender])
+    instance._new_upload = bool(image) and not raw and not image._committed
+
+
+def generate_derivatives(sender, instance, raw=False, **kwargs):
+    if raw or not getattr(instance, '_new_upload', False):
+        return
+    instance._new_upload = False
+    name = getattr(instance, DERIVATIVE_FIELDS[sender]).name
+    on_ready = _product_image_ready(instance.product_id) if sender is ProductImage else None
+    transaction.on_commit(lambda: images.schedule(name, on_ready))
+
+
+def delete_derivatives(sender, instance, **kwargs):
+    name = getattr(instance, DERIVATIVE_FIELDS[sender]).name
+    if name and not storage.is_blob(name):  # shared blobs' derivatives go with the blob
+        transaction.on_commit(lambda: images.delete_derivatives(name))
+
+
+def _file_names(instance, fields):
+    return [getattr(instance, field.attname).name for field in fields]
+
+
+def remember_file_names(sender, instance, **kwargs):
+    fields = FILE_FIELDS[sender]
+    stored = None
+    if not instance._state.adding and instance.pk is not None:
+        stored = sender._base_manager.filter(pk=instance.pk).values_list(
+            *[field.attname for field in fields]
+        ).first()
+    instance._stored_file_names = list(stored or ())
+
+
+def count_file_references(sender, instance, **kwargs):
+    storage.adjust_refcounts(
+        added=_file_names(instance, FILE_FIELDS[sender]),
+        removed=getattr(instance, '_stored_file_names', ()),
+    )
+    instance._stored_file_names = _file_names(instance, FILE_FIELDS[sender])
+
+
+def release_file_references(sender, instance, **kwargs):
+    storage.adjust_refcounts(removed=_file_names(instance, FILE_FIELDS[sender]))
+
+
+for model in DERIVATIVE_FIELDS:
+    pre_save.connect(remember_new_upload, sender=model, dispatch_uid=f'derivatives_pre_{model.__name__}')
+    post_save.connect(generate_derivatives, sender=model, dispatch_uid=f'derivatives_post_{model.__name__}')
+    post_delete.connect(delete_derivatives, sender=model, dispatch_uid=f'derivatives_delete_{model.__name__}')
+
+# Every model with file fields keeps MediaBlob.refcount in step (core.storage).
+FILE_FIELDS = dict(storage.file_fields())
+
+for model in FILE_FIELDS:
+    pre_save.connect(remember_file_names, sender=model, dispatch_uid=f'blobs_pre_{model._meta.label}')
+    post_save.connect(count_file_references, sender=model, dispatch_uid=f'blobs_post_{model._meta.label}')
+    post_delete.connect(release_file_references, sender=model, dispatch_uid=f'blobs_delete_{model._meta.label}')
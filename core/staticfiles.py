@@ -0,0 +1,139 @@
+"""
+Static files with content-hashed names and precompressed siblings.
+
+With this storage, ``collectstatic`` writes a content-hashed copy of every
+file (``css/style.css`` -> ``css/style.3d2f1a9c0b7e.css``) using Django's
+ManifestStaticFilesStorage, so ``{% static %}`` URLs change whenever the
+file does. It then writes a ``.gz`` and a ``.br`` next to each
+compressible file. Each sibling is kept only if it is smaller. ``brotli`` is
+pinned in requirements.txt; where it is missing, the ``.br`` siblings are
+skipped. Sizes per asset go to ``compression.json`` in
+STATIC_ROOT, and ``static_report`` prints them.
+
+``core.views.static_asset`` serves STATIC_ROOT. It sends the smallest
+encoding the client accepts, and caches hashed names for a year as
+immutable.
+"""
+import gzip
+import json
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.files.base import ContentFile
+from django.utils._os import safe_join
+
+try:
+    import brotli
+except ImportError:  # .br siblings are skipped
+    brotli = None
+
+COMPRESSIBLE = {'.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico', '.ttf', '.otf', '.eot'}
+MIN_SIZE = 256
+REPORT_NAME = 'compression.json'
+
+# (Content-Encoding, file suffix), in order of preference.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+ACCEPT_RE = re.compile(r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*')
+
+
+def compress(encoding, data):
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return brotli.compress(data, quality=11)
+
+
+def available_encodings():
+    return [encoding for encoding in ENCODINGS if encoding[0] != 'br' or brotli is not None]
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Not collected (tests, a fresh checkout): link the plain name.
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        report = {}
+        for name, hashed_name in self.hashed_files.items():
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE:
+                continue
+            with self.open(hashed_name) as f:
+                data = f.read()
+            if len(data) < MIN_SIZE:
+                continue
+            entry = report[name] = {'hashed_name': hashed_name, 'size': len(data)}
+            for encoding, suffix in ENCODINGS:
+                compressed = compress(encoding, data) if (encoding, suffix) in available_encodings() else None
+                if compressed is not None and len(compressed) >= len(data):
+                    compressed = None
+                for target in {name + suffix, hashed_name + suffix}:
+                    if self.exists(target):
+                        self.delete(target)  # stale, or from a run that had brotli
+                    if compressed is not None:
+                        self._save(target, ContentFile(compressed))
+                entry[encoding] = None if compressed is None else len(compressed)
+        if self.exists(REPORT_NAME):
+            self.delete(REPORT_NAME)
+        self._save(REPORT_NAME, ContentFile(json.dumps(report, indent=1, sort_keys=True).encode()))
+
+
+def load_report():
+    """``{name: {'hashed_name', 'size', 'gzip', 'br'}}`` from the last collectstatic, or {}."""
+    try:
+        with open(os.path.join(settings.STATIC_ROOT, REPORT_NAME), 'rb') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def accepted_encodings(header):
+    accepted = set()
+    for part in (header or '').split(','):
+        match = ACCEPT_RE.fullmatch(part)
+        if not match:
+            continue
+        coding, quality = match.groups()
+        try:
+            if quality is not None and float(quality) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.lower())
+    if '*' in accepted:
+        accepted.update(encoding for encoding, _ in ENCODINGS)
+    return accepted
+
+
+_hashed_names = None
+
+
+def is_hashed(path):
+    global _hashed_names
+    if _hashed_names is None:
+        _hashed_names = frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+    return path in _hashed_names
+
+
+def locate(path, accept_encoding):
+    """
+    ``(file path, Content-Encoding or None, content type)`` of the best
+    variant of collected asset ``path``. Raises FileNotFoundError.
+    """
+    full_path = safe_join(settings.STATIC_ROOT, path)
+    if not os.path.isfile(full_path):
+        raise FileNotFoundError(path)
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    accepted = accepted_encodings(accept_encoding)
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.isfile(full_path + suffix):
+            return full_path + suffix, encoding, content_type
+    return full_path, None, content_type
@@ -0,0 +1,194 @@
+"""
+Content-addressed, deduplicating media storage.
+
+``save()`` hashes an upload and stores it once, as
+``blobs/<d[:2]>/<d[2:4]>/<digest><ext>``. Saving the same bytes again
+(the same logo re-uploaded, the same photo on two products, an admin
+preview that is then saved for real) returns the existing name and
+writes nothing. A blob's bytes never change under its name, so its URL
+can be served with ``Cache-Control: immutable``.
+
+Every blob has a ``MediaBlob`` row. core.signals keeps its ``refcount``
+equal to the number of file fields that name it. ``collect()`` (the
+``gc_media_blobs`` command) deletes blobs that nothing references and
+that have not been uploaded again within a grace period. ``delete()``
+leaves blobs alone, since another row may share them.
+
+Names under ``MEDIA_DEDUP_EXCLUDE`` (generated derivatives and caches,
+which are looked up by their own names) are stored as given.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+from collections import Counter
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+BLOB_ROOT = 'blobs'
+DEFAULT_EXCLUDE = ('derivatives/', 'cache/')
+LEGACY_TEMP_ROOT = 'temp'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_ROOT + '/')
+
+
+def blob_name(digest, extension):
+    return f'{BLOB_ROOT}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def _deduplicates(self, name):
+        excluded = getattr(settings, 'MEDIA_DEDUP_EXCLUDE', DEFAULT_EXCLUDE)
+        return not name.startswith(tuple(excluded))
+
+    def get_available_name(self, name, max_length=None):
+        if self._deduplicates(name):
+            return name  # replaced by the content's name in _save()
+        return super().get_available_name(name, max_length)
+
+    def _save(self, name, content):
+        if not self._deduplicates(name):
+            return super()._save(name, content)
+        from core.models import MediaBlob
+
+        hasher = hashlib.sha256()
+        size = 0
+        for chunk in content.chunks():
+            hasher.update(chunk)
+            size += len(chunk)
+        digest = hasher.hexdigest()
+        name = blob_name(digest, posixpath.splitext(name)[1].lower())
+        now = timezone.now()
+        MediaBlob.objects.update_or_create(
+            digest=digest,
+            defaults={'last_saved_at': now},
+            create_defaults={'name': name, 'size': size, 'last_saved_at': now},
+        )
+        # Checked after the row is fresh, so a concurrent collect() cannot
+        # remove the file between the check and its first reference.
+        if not self.exists(name):
+            self._write(name, content)
+        return name
+
+    def _write(self, name, content):
+        # Concurrent uploads of the same bytes may both get here; each
+        # renames a complete copy into place, so either one can win.
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.upload')
+        try:
+            with os.fdopen(descriptor, 'wb') as output:
+                for chunk in content.chunks():
+                    output.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temporary, self.file_permissions_mode)
+            os.replace(temporary, full_path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+
+    def delete(self, name):
+        if is_blob(name):
+            return  # shared; removed by collect() once unreferenced
+        super().delete(name)
+
+    def delete_blob(self, name):
+        super().delete(name)
+
+
+def file_fields():
+    """``(model, [file field, ...])`` for every installed model with file fields."""
+    for model in apps.get_models():
+        fields = [field for field in model._meta.concrete_fields if isinstance(field, models.FileField)]
+        if fields:
+            yield model, fields
+
+
+def adjust_refcounts(added=(), removed=()):
+    """Add one reference per name in ``added`` and drop one per name in ``removed``."""
+    from core.models import MediaBlob
+
+    delta = Counter(name for name in added if is_blob(name))
+    delta.subtract(name for name in removed if is_blob(name))
+    by_change = {}
+    for name, change in delta.items():
+        if change:
+            by_change.setdefault(change, []).append(name)
+    for change, names in by_change.items():
+        MediaBlob.objects.filter(name__in=names).update(refcount=F('refcount') + change)
+
+
+def recount():
+    """Recompute every ``refcount`` from the file fields; returns the number of referenced blobs."""
+    from core.models import MediaBlob
+
+    references = Counter()
+    for model, fields in file_fields():
+        for row in model._base_manager.values_list(*[field.attname for field in fields]).iterator():
+            references.update(name for name in row if is_blob(name))
+    by_count = {}
+    for name, count in references.items():
+        by_count.setdefault(count, []).append(name)
+    with transaction.atomic():
+        MediaBlob.objects.exclude(refcount=0).update(refcount=0)
+        for count, names in by_count.items():
+            for start in range(0, len(names), 500):
+                MediaBlob.objects.filter(name__in=names[start:start + 500]).update(refcount=count)
+    return len(references)
+
+
+def _stale_files(root, cutoff, known=frozenset()):
+    storage = default_storage
+    if not storage.exists(root):
+        return
+    directories, files = storage.listdir(root)
+    for directory in directories:
+        yield from _stale_files(f'{root}/{directory}', cutoff, known)
+    for filename in files:
+        name = f'{root}/{filename}'
+        if name not in known and storage.get_modified_time(name) < cutoff:
+            yield name
+
+
+def collect(grace=timedelta(hours=24), dry_run=False):
+    """
+    Delete unreferenced blobs last uploaded before ``grace`` ago, plus stray
+    files under the blob root and old pre-dedup previews under ``temp/``.
+    Returns ``(files removed, bytes freed)``.
+    """
+    from core import images
+    from core.models import MediaBlob
+
+    storage = default_storage
+    delete = getattr(storage, 'delete_blob', storage.delete)
+    cutoff = timezone.now() - grace
+    removed = freed = 0
+    collectable = MediaBlob.objects.filter(refcount__lte=0, last_saved_at__lt=cutoff)
+    for pk, name, size in list(collectable.values_list('pk', 'name', 'size')):
+        if not dry_run:
+            # Conditional, so blobs re-uploaded or referenced since the query ran survive.
+            if not collectable.filter(pk=pk).delete()[0]:
+                continue
+            delete(name)
+            images.delete_derivatives(name)
+        removed += 1
+        freed += size
+
+    known = set(MediaBlob.objects.values_list('name', flat=True))
+    strays = list(_stale_files(BLOB_ROOT, cutoff, known)) + list(_stale_files(LEGACY_TEMP_ROOT, cutoff))
+    for name in strays:
+        removed += 1
+        freed += storage.size(name)
+        if not dry_run:
+            delete(name)
+    return removed, freed
@@ -0,0 +1,44 @@
+from django import template
+from django.utils.html import format_html
+
+from core import images
+from core.resize import resized_url
+
+register = template.Library()
+
+
+@register.filter
+def srcset(image, variant=''):
+    """{{ image|srcset }} or {{ image|srcset:"webp" }} -- derivative widths, '' until generated."""
+    return images.srcset(image, webp=variant == 'webp')
+
+
+@register.filter
+def resized(image, size):
+    """{{ image|resized:"400x400" }} -- URL of the on-demand render at an allow-listed size."""
+    width, _, height = size.partition('x')
+    return resized_url(image, int(width), int(height))
+
+
+@register.simple_tag
+def responsive_image(image, alt='', sizes='100vw', css_class='', style=''):
+    """
+    {% responsive_image product.primary_image.image alt=product.name sizes="(min-width: 992px) 25vw, 50vw" %}
+
+    A <picture> offering WebP and same-format derivatives, falling back to
+    the original. Accepts an ImageField value, a storage name or a media URL.
+    """
+    url = getattr(image, 'url', image)
+    if not url:
+        return ''
+    known = images.manifest(image)
+    if not known:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" style="{}" loading="lazy">', url, alt, css_class, style
+        )
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" style="{}" loading="lazy"></picture>',
+        images.srcset(image, webp=True, known=known), sizes,
+        url, images.srcset(image, known=known), sizes, alt, css_class, style,
+    )
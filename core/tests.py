@@ -1,3 +1,48 @@
-from django.test import TestCase
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.template import engines
+from django.test import RequestFactory, TestCase
 
-# Create your tests here.
+from admin_dashboard.models import DefaultSiteSetting
+from cart.storage import get_storage
+from core.models import SiteSettings
+from shop.models import Category, Product
+
+
+class LazyContextProcessorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def make_request(self, **cookies):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies)
+        request.user = AnonymousUser()
+        request.session = SessionStore()
+        return request
+
+    def render(self, source, request):
+        return engines['django'].from_string(source).render({'greeting': 'hello'}, request)
+
+    def test_template_using_no_context_values_runs_no_queries(self):
+        request = self.make_request()
+        with self.assertNumQueries(0):
+            html = self.render('<p>{{ greeting }}</p>', request)
+        self.assertEqual(html, '<p>hello</p>')
+
+    def test_values_are_computed_once_per_request(self):
+        SiteSettings.objects.create(site_name='Shop')
+        DefaultSiteSetting.objects.create(site_name='Shop')
+        category = Category.objects.create(name='Phones', slug='phones')
+        product = Product.objects.create(name='Phone', slug='phone', category=category, price='10.00', sku='P-1')
+        token = 'a' * 43
+        get_storage().set_line(token, product.pk, 2, product.price)
+
+        source = '{{ site_settings.site_name }} {{ default_settings.site_name }} {{ cart|length }} {{ header_template }}'
+        request = self.make_request(cart_token=token)
+        first = self.render(source, request)
+        cache.clear()
+        with self.assertNumQueries(0):
+            second = self.render(source, request)
+        self.assertEqual(first, second)
+        self.assertEqual(first, 'Shop Shop 2 includes/headers/header1.html')
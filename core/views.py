@@ -1,13 +1,22 @@
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
 from django.utils.translation import get_language, activate
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET, require_safe
+from django.views.static import was_modified_since
+from core import staticfiles
 from core.models import ContactMessage, SiteSettings
-from shop.models import Category, Product
+from core.resize import ResizeError, resizer
+from shop.models import Category, ProductCard
 import json
+import os
 
 def home(request):
-    featured_products = Product.objects.filter(is_featured=True, is_active=True)[:8]
-    latest_products = Product.objects.filter(is_active=True).order_by('-created_at')[:8]
+    featured_products = ProductCard.objects.filter(is_featured=True).order_by('id')[:8]
+    latest_products = ProductCard.objects.order_by('-created_at', 'id')[:8]
     
     context = {
         'featured_products': featured_products,
@@ -44,4 +53,47 @@ def change_language(request):
             request.session['django_language'] = lang
             activate(lang)
             return JsonResponse({'success': True})
-    return JsonResponse({'success': False})
\ No newline at end of file
+    return JsonResponse({'success': False})
+
+
+def resized_image_etag(request, width, height, path):
+    try:
+        return resizer.locate(path, width, height).digest
+    except ResizeError:
+        return None
+
+
+@require_GET
+@cache_control(public=True, max_age=60 * 60 * 24 * 30)
+@condition(etag_func=resized_image_etag)
+def resized_image(request, width, height, path):
+    """``/media/r/<w>x<h>/<path>``: ``path`` cropped to an allow-listed size, rendered once."""
+    try:
+        rendered = resizer.get(path, width, height)
+    except ResizeError as e:
+        raise Http404(str(e))
+    return FileResponse(open(rendered.path, 'rb'), content_type=rendered.content_type)
+
+
+@require_safe
+def static_asset(request, path):
+    """Collected static file, precompressed if the client accepts it; hashed names never expire."""
+    try:
+        full_path, encoding, content_type = staticfiles.locate(path, request.headers.get('Accept-Encoding'))
+    except (FileNotFoundError, SuspiciousFileOperation):
+        raise Http404(path)
+    stat = os.stat(full_path)
+    if not staticfiles.is_hashed(path) and not was_modified_since(
+        request.headers.get('If-Modified-Since'), stat.st_mtime
+    ):
+        return HttpResponseNotModified()
+    response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ['Accept-Encoding'])
+    if staticfiles.is_hashed(path):
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        patch_cache_control(response, public=True, max_age=60 * 60)
+    return response
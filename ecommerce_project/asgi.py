@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce_project.settings')
 
 application = get_asgi_application()
+
+# Build in-process catalog indexes before the first request arrives.
+from shop.autocomplete import autocomplete_index  # noqa: E402
+
+autocomplete_index.warm()
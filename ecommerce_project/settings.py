@@ -56,6 +56,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'cart.middleware.CartMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -147,6 +148,20 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads are stored once per unique content (core.storage); generated
+# files under these prefixes keep their names. Run gc_media_blobs daily.
+# collectstatic writes hashed, precompressed assets (core.staticfiles).
+STORAGES = {
+    'default': {'BACKEND': 'core.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'core.staticfiles.CompressedManifestStaticFilesStorage'},
+}
+MEDIA_DEDUP_EXCLUDE = ['derivatives/', 'cache/']
+
+# Sizes /media/r/<w>x<h>/<path> will render (core.resize), and where the
+# renders are kept.
+IMAGE_RESIZE_SIZES = [(100, 100), (200, 200), (300, 300), (400, 400), (600, 600), (800, 800), (1200, 630)]
+IMAGE_RESIZE_CACHE_DIR = MEDIA_ROOT / 'cache' / 'resized'
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -158,7 +173,24 @@ REST_FRAMEWORK = {
 }
 
 # Session settings
-CART_SESSION_ID = 'cart'
+CART_SESSION_ID = 'cart'  # where carts lived before the cart store; imported on first visit
+
+# Carts are kept server-side under a token cookie (cart.storage). Use
+# 'cart.storage.CacheCartStorage' with a shared cache to keep them out of the
+# database; run purge_expired_carts daily with the database backend.
+CART_STORAGE = 'cart.storage.DatabaseCartStorage'
+CART_COOKIE_NAME = 'cart_token'
+CART_TTL = 60 * 60 * 24 * 30
+CART_RESERVATION_TTL = 15 * 60  # how long checkout holds a cart's stock
+ORDER_NUMBER_BLOCK_SIZE = 20  # order numbers each worker reserves per database round trip
+
+# Also index a Latin transliteration of Bengali product text (shop.analysis),
+# so "mobail" finds "মোবাইল".
+SEARCH_TRANSLITERATE_BENGALI = True
+
+# In-process catalog indexes (facets, category tree, autocomplete, prices)
+# re-check their database version stamp at most this often, in seconds.
+VERSION_CHECK_INTERVAL = 1.0
 
 # Admin site header
 ADMIN_SITE_HEADER = "Ecommerce Admin Dashboard"
@@ -20,10 +20,15 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.conf.urls.i18n import i18n_patterns
 
+from core.views import resized_image, static_asset
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('i18n/', include('django.conf.urls.i18n')),
     path('admin-dashboard/', include('admin_dashboard.urls')),
+    path('api/shop/', include('shop.api_urls')),
+    path(f'{settings.MEDIA_URL.lstrip("/")}r/<int:width>x<int:height>/<path:path>', resized_image, name='resized_image'),
+    path(f'{settings.STATIC_URL.lstrip("/")}<path:path>', static_asset, name='static_asset'),
 ]
 
 urlpatterns += i18n_patterns(
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce_project.settings')
 
 application = get_wsgi_application()
+
+# Build in-process catalog indexes before the first request arrives.
+from shop.autocomplete import autocomplete_index  # noqa: E402
+
+autocomplete_index.warm()
@@ -0,0 +1,129 @@
+"""
+Text analysis shared by every product search structure.
+
+``normalize()`` puts English and Bengali text into one canonical form.
+``tokenize()`` splits it into terms. ``index_terms()`` also adds a Latin
+transliteration of each Bengali term, so a customer typing "mobail" finds
+"মোবাইল". The FTS table, the in-memory backend, autocomplete and the
+trigram index all analyze documents with ``index_terms()`` when indexing.
+Queries go through the cheaper ``tokenize()``, so bilingual matching costs
+nothing extra per search.
+
+Bengali needs more than casefolding:
+
+* NFC, so a two-part vowel sign typed as two code points (ে + া)
+  equals the precomposed ো;
+* the legacy "ত্ + ZWJ" spelling of khanda ta becomes ৎ, and the legacy
+  "অ + া" spelling of আ becomes আ;
+* zero-width joiners/non-joiners, soft hyphens and BOMs are removed,
+  since they only affect rendering;
+* Bengali digits become ASCII digits;
+* vowel signs, hasanta and nukta count as word characters. Python's ``\\w``
+  (and SQLite's default tokenizer) would split শার্ট into শ, র, ট.
+"""
+import re
+import unicodedata
+
+from django.conf import settings
+
+INVISIBLE = dict.fromkeys(map(ord, '\u200b\u200c\u200d\u2060\ufeff\u00ad'))
+BENGALI_DIGITS = str.maketrans('০১২৩৪৫৬৭৮৯', '0123456789')
+SPELLING_VARIANTS = (
+    ('ত্\u200d', 'ৎ'),  # ta + hasanta + ZWJ
+    ('অা', 'আ'),
+)
+
+TOKEN_RE = re.compile(r'[\w\u0980-\u09ff]+')
+BENGALI_RE = re.compile(r'[\u0980-\u09ff]')
+
+INDEPENDENT_VOWELS = {
+    'অ': 'o', 'আ': 'a', 'ই': 'i', 'ঈ': 'i', 'উ': 'u', 'ঊ': 'u', 'ঋ': 'ri',
+    'এ': 'e', 'ঐ': 'oi', 'ও': 'o', 'ঔ': 'ou',
+}
+VOWEL_SIGNS = {
+    'া': 'a', 'ি': 'i', 'ী': 'i', 'ু': 'u', 'ূ': 'u', 'ৃ': 'ri',
+    'ে': 'e', 'ৈ': 'oi', 'ো': 'o', 'ৌ': 'ou',
+}
+CONSONANTS = {
+    'ক': 'k', 'খ': 'kh', 'গ': 'g', 'ঘ': 'gh', 'ঙ': 'ng',
+    'চ': 'ch', 'ছ': 'chh', 'জ': 'j', 'ঝ': 'jh', 'ঞ': 'n',
+    'ট': 't', 'ঠ': 'th', 'ড': 'd', 'ঢ': 'dh', 'ণ': 'n',
+    'ত': 't', 'থ': 'th', 'দ': 'd', 'ধ': 'dh', 'ন': 'n',
+    'প': 'p', 'ফ': 'f', 'ব': 'b', 'ভ': 'bh', 'ম': 'm',
+    'য': 'j', 'র': 'r', 'ল': 'l', 'শ': 'sh', 'ষ': 'sh', 'স': 's', 'হ': 'h',
+}
+# NFC leaves these as consonant + nukta.
+NUKTA_CONSONANTS = {'ড': 'r', 'ঢ': 'rh', 'য': 'y'}
+SIGNS = {'ৎ': 't', 'ং': 'ng', 'ঃ': 'h', 'ঁ': ''}
+HASANTA = '\u09cd'
+NUKTA = '\u09bc'
+
+
+def _strip_latin_diacritics(text):
+    if text.isascii():
+        return text
+    return ''.join(
+        ''.join(part for part in unicodedata.normalize('NFD', char) if not unicodedata.combining(part))
+        if '\u00c0' <= char <= '\u024f' else char
+        for char in text
+    )
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFC', text or '')
+    for variant, canonical in SPELLING_VARIANTS:
+        text = text.replace(variant, canonical)
+    text = text.translate(INVISIBLE).translate(BENGALI_DIGITS)
+    return _strip_latin_diacritics(text.casefold())
+
+
+def tokenize(text):
+    """Normalized terms of ``text``; used for queries and as the base of ``index_terms()``."""
+    return TOKEN_RE.findall(normalize(text))
+
+
+def transliterate(term):
+    """Rough phonetic Latin spelling of a Bengali term, e.g. 'ফোন' -> 'fon'."""
+    output = []
+    length = len(term)
+    i = 0
+    while i < length:
+        char = term[i]
+        if char in CONSONANTS:
+            if i + 1 < length and term[i + 1] == NUKTA and char in NUKTA_CONSONANTS:
+                output.append(NUKTA_CONSONANTS[char])
+                i += 1
+            else:
+                output.append(CONSONANTS[char])
+            following = term[i + 1] if i + 1 < length else ''
+            if following in VOWEL_SIGNS:
+                output.append(VOWEL_SIGNS[following])
+                i += 1
+            elif following == HASANTA:
+                i += 1
+            elif following in CONSONANTS or following in SIGNS:
+                output.append('o')  # inherent vowel, dropped at the end of a word
+        elif char in INDEPENDENT_VOWELS:
+            output.append(INDEPENDENT_VOWELS[char])
+        elif char in SIGNS:
+            output.append(SIGNS[char])
+        elif char in VOWEL_SIGNS:
+            output.append(VOWEL_SIGNS[char])
+        elif not BENGALI_RE.match(char):
+            output.append(char)
+        i += 1
+    return ''.join(output)
+
+
+def index_terms(text):
+    """``tokenize(text)`` plus, if enabled, a transliteration of each Bengali term."""
+    terms = tokenize(text)
+    if not getattr(settings, 'SEARCH_TRANSLITERATE_BENGALI', True):
+        return terms
+    extra = []
+    for term in terms:
+        if BENGALI_RE.search(term):
+            latin = transliterate(term)
+            if latin and latin != term:
+                extra.append(latin)
+    return terms + extra
@@ -0,0 +1,133 @@
+"""
+Read-only JSON catalog API for the mobile app and partner feeds.
+
+Every response carries a strong ETag built from the newest ``updated_at``
+and row count of what it serializes, plus the category tree version
+(categories are nested in products and have no ``updated_at`` of their
+own). Clients send it back in If-None-Match and get a 304 without the
+serializer ever running.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.http import Http404, JsonResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET
+
+from shop import category_tree, search, versions
+from shop.models import Product
+from shop.pagination import SORT_ORDERINGS, cursor_page
+from shop.search_cache import result_cache
+from shop.serializers import CategorySerializer, ProductSerializer
+
+PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+CACHE_MAX_AGE = 60
+
+
+def _fields(request, serializer_class):
+    """Requested sparse fieldset (``?fields=id,name``), or None for all fields."""
+    requested = request.GET.get('fields')
+    if not requested:
+        return None
+    allowed = serializer_class.Meta.fields
+    return [name for name in requested.split(',') if name in allowed] or None
+
+
+def _limit(request):
+    try:
+        return min(max(int(request.GET.get('limit', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return PAGE_SIZE
+
+
+def _serializable(request, products):
+    """Load only the relations the requested fieldset serializes."""
+    fields = _fields(request, ProductSerializer)
+    if fields is None or 'category' in fields:
+        products = products.select_related('category')
+    if fields is None or {'primary_image', 'primary_image_srcset', 'images'} & set(fields):
+        products = products.select_related('primary_image').prefetch_related('images')
+    return products
+
+
+def _products(request):
+    """Active products matching the list filters."""
+    products = Product.objects.filter(is_active=True)
+    category_slug = request.GET.get('category')
+    if category_slug:
+        category = category_tree.get_tree().by_slug.get(category_slug)
+        if category is None:
+            return products.none()
+        products = products.filter(category.subtree_q('category__'))
+    query = request.GET.get('q')
+    if query:
+        ids = result_cache.get_or_compute('search', query, lambda: search.search_ids(query, limit=None))
+        products = products.filter(pk__in=ids)
+    return products
+
+
+def _etag(request, queryset):
+    stamp = queryset.order_by().aggregate(newest=Max('updated_at'), count=Count('pk'))
+    key = '|'.join([
+        str(stamp['newest']),
+        str(stamp['count']),
+        str(versions.get_version(category_tree.VERSION_KEY)),
+        request.get_full_path(),
+    ])
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def product_list_etag(request):
+    return _etag(request, _products(request))
+
+
+def product_detail_etag(request, slug):
+    return _etag(request, Product.objects.filter(slug=slug, is_active=True))
+
+
+def category_list_etag(request):
+    key = f'{versions.get_version(category_tree.VERSION_KEY)}|{request.get_full_path()}'
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+@require_GET
+@cache_control(public=True, max_age=CACHE_MAX_AGE)
+@condition(etag_func=product_list_etag)
+def product_list(request):
+    """``?category=&q=&sort=&limit=&cursor=&fields=``, keyset-paginated."""
+    sort_by = request.GET.get('sort', 'newest')
+    if sort_by not in SORT_ORDERINGS:
+        sort_by = 'newest'
+    products = _serializable(request, _products(request))
+    page = cursor_page(products, sort_by, _limit(request), request.GET.get('cursor') or None)
+    return JsonResponse({
+        'results': ProductSerializer(page.object_list, many=True, fields=_fields(request, ProductSerializer)).data,
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+@require_GET
+@cache_control(public=True, max_age=CACHE_MAX_AGE)
+@condition(etag_func=product_detail_etag)
+def product_detail(request, slug):
+    product = _serializable(request, Product.objects.filter(slug=slug, is_active=True)).first()
+    if product is None:
+        raise Http404('No active product with that slug.')
+    return JsonResponse(ProductSerializer(product, fields=_fields(request, ProductSerializer)).data)
+
+
+@require_GET
+@cache_control(public=True, max_age=CACHE_MAX_AGE)
+@condition(etag_func=category_list_etag)
+def category_list(request):
+    """Active categories in menu order, with their parent for rebuilding the tree."""
+    fields = _fields(request, CategorySerializer)
+    tree = category_tree.get_tree()
+    data = []
+    for category in sorted(tree.by_id.values(), key=lambda node: (node.depth, node.display_order, node.name)):
+        item = CategorySerializer(category, fields=fields).data
+        item['parent'] = category.parent_id
+        data.append(item)
+    return JsonResponse({'results': data})
@@ -0,0 +1,10 @@
+from django.urls import path
+from . import api
+
+app_name = 'shop_api'
+
+urlpatterns = [
+    path('products/', api.product_list, name='product_list'),
+    path('products/<slug:slug>/', api.product_detail, name='product_detail'),
+    path('categories/', api.category_list, name='category_list'),
+]
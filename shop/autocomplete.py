@@ -0,0 +1,311 @@
+"""
+In-process prefix index for the header search box.
+
+Every active product gets a slot. Each distinct word of its name and
+name_bn maps to the slots containing it, kept sorted by popularity rank
+(units sold), so the best matches for a prefix are the first few values of
+a k-way merge over the words in the prefix's ``bisect`` range. SKUs go in
+a second sorted table because customers type them whole ("SKU-19...").
+No rows are read from the database per keystroke.
+
+Vocabularies are packed into one UTF-8 blob plus an offsets array instead
+of a list of ``str`` objects. Postings are ``array('I')``, or a bare int for
+words used by a single product. Together that keeps a 200k-product catalog
+around 15 MB, plus the pk -> slot dict.
+
+A saved product tombstones its old slot and takes a new one. Words and
+SKUs the packed tables lack go into small sorted side lists, so a save
+never copies the blobs. Once tombstones and side entries pass
+``REBUILD_PENDING_RATIO`` of the live slots, the index is rebuilt, which
+also refreshes popularity ranks. Saves are logged with their product id,
+so other workers replay them rather than reload (see shop.versions).
+"""
+import heapq
+import sys
+from array import array
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.db import DatabaseError
+
+from shop import analysis, versions
+
+SUGGESTION_LIMIT = 8
+VERSION_KEY = 'autocomplete'
+
+# Single short prefixes ("s", "sh") match a large share of the vocabulary,
+# so their answers are memoised until the next change.
+MEMO_MAX_PREFIX = 3
+MEMO_MAX_ENTRIES = 5000
+
+# Rebuild once dead slots plus side-list entries exceed this share of the
+# live slots (and at least REBUILD_MIN_PENDING of them).
+REBUILD_PENDING_RATIO = 0.25
+REBUILD_MIN_PENDING = 1000
+
+# Sorts after every string that starts with the prefix it is appended to.
+_PREFIX_END = chr(0x10FFFF)
+
+
+class PackedStrings:
+    """Sorted strings in one UTF-8 blob, indexable (as bytes) for ``bisect``."""
+
+    def __init__(self, strings=()):
+        encoded = [string.encode() for string in strings]
+        self.offsets = array('I', [0])
+        for item in encoded:
+            self.offsets.append(self.offsets[-1] + len(item))
+        self.blob = b''.join(encoded)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.blob[self.offsets[index]:self.offsets[index + 1]]
+
+    def prefix_range(self, prefix):
+        # UTF-8 byte order is code point order, so bytes bisect like str.
+        prefix = prefix.encode()
+        start = bisect_left(self, prefix)
+        return start, bisect_left(self, prefix + b'\xff', start)
+
+    def find(self, string):
+        item = string.encode()
+        index = bisect_left(self, item)
+        return index, index < len(self) and self[index] == item
+
+    def nbytes(self):
+        return sys.getsizeof(self.blob) + sys.getsizeof(self.offsets)
+
+
+def _words(name, name_bn):
+    return set(analysis.index_terms(name)) | set(analysis.index_terms(name_bn))
+
+
+def _slots(posting):
+    return (posting,) if isinstance(posting, int) else posting
+
+
+class AutocompleteIndex(versions.VersionedIndex):
+    version_key = VERSION_KEY
+    logs_changes = True
+
+    def __init__(self):
+        super().__init__()
+        self._reset()
+
+    def _reset(self):
+        self.words = PackedStrings()    # sorted distinct words
+        self.postings = []              # aligned with words: slot or array('I') of slots, best rank first
+        self.skus = PackedStrings()     # sorted casefolded SKUs
+        self.sku_slots = array('I')     # aligned with skus
+        self.product_ids = array('q')   # slot -> product id
+        self.ranks = array('I')         # slot -> popularity rank, 0 = best seller
+        self.alive = bytearray()        # slot -> 1 while the product is indexed
+        self.slots = {}                 # product id -> live slot
+        self.new_words = []             # sorted words missing from self.words
+        self.new_postings = []          # aligned with new_words
+        self.new_skus = []              # sorted (casefolded SKU, slot) missing from self.skus
+        self._pending = 0               # dead slots + side-list entries
+        self._memo = {}
+
+    def _load(self):
+        from django.db.models import Sum
+
+        from cart.models import OrderItem
+        from shop.models import Product
+
+        sold = dict(
+            OrderItem.objects.exclude(order__status='cancelled')
+            .values('product_id')
+            .annotate(sold=Sum('quantity'))
+            .values_list('product_id', 'sold')
+        )
+        rows = list(Product.objects.filter(is_active=True).values_list('pk', 'name', 'name_bn', 'sku'))
+        rows.sort(key=lambda row: (-sold.get(row[0], 0), -row[0]))
+
+        self._reset()
+        postings = defaultdict(list)
+        skus = []
+        for slot, (pk, name, name_bn, sku) in enumerate(rows):
+            self.product_ids.append(pk)
+            self.slots[pk] = slot
+            self.ranks.append(slot)
+            for word in _words(name, name_bn):
+                postings[word].append(slot)
+            if sku:
+                skus.append((sku.casefold(), slot))
+        self.alive = bytearray(b'\x01') * len(rows)
+
+        words = sorted(postings)
+        self.words = PackedStrings(words)
+        self.postings = [
+            postings[word][0] if len(postings[word]) == 1 else array('I', postings[word]) for word in words
+        ]
+        skus.sort()
+        self.skus = PackedStrings(sku for sku, _ in skus)
+        self.sku_slots = array('I', (slot for _, slot in skus))
+
+    def warm(self):
+        """Build the index up front (called at worker start)."""
+        try:
+            self._ensure_fresh()
+        except DatabaseError:
+            pass  # tables not migrated yet; the first request will build it
+
+    # ----- incremental maintenance -----
+
+    def _retire(self, pk):
+        """Tombstone ``pk``'s live slot and return its rank, or None."""
+        slot = self.slots.pop(pk, None)
+        if slot is None:
+            return None
+        self.alive[slot] = 0
+        self._pending += 1
+        return self.ranks[slot]
+
+    def _add_word(self, word, slot):
+        index, found = self.words.find(word)
+        postings = self.postings
+        if not found:
+            index = bisect_left(self.new_words, word)
+            if index == len(self.new_words) or self.new_words[index] != word:
+                self.new_words.insert(index, word)
+                self.new_postings.insert(index, slot)
+                self._pending += 1
+                return
+            postings = self.new_postings
+        posting = postings[index]
+        if isinstance(posting, int):
+            posting = postings[index] = array('I', (posting,))
+        insort(posting, slot, key=self.ranks.__getitem__)
+
+    def _put(self, pk, is_active, name, name_bn, sku):
+        rank = self._retire(pk)
+        self._memo.clear()
+        if not is_active:
+            return
+        if rank is None:
+            rank = len(self.product_ids)  # new products start at the bottom
+        slot = len(self.product_ids)
+        self.product_ids.append(pk)
+        self.ranks.append(rank)
+        self.alive.append(1)
+        self.slots[pk] = slot
+        for word in _words(name, name_bn):
+            self._add_word(word, slot)
+        if sku:
+            insort(self.new_skus, (sku.casefold(), slot))
+            self._pending += 1
+
+    def _rebuild_if_fragmented(self):
+        if self._pending > max(REBUILD_MIN_PENDING, len(self.slots) * REBUILD_PENDING_RATIO):
+            self._load()
+
+    def _replay(self, product_ids):
+        from shop.models import Product
+
+        rows = {
+            pk: row for pk, *row in Product.objects.filter(pk__in=set(product_ids))
+            .values_list('pk', 'is_active', 'name', 'name_bn', 'sku')
+        }
+        for pk in set(product_ids):
+            if pk in rows:
+                self._put(pk, *rows[pk])
+            else:
+                self._retire(pk)
+        self._memo.clear()
+        self._rebuild_if_fragmented()
+
+    def product_changed(self, product):
+        def change():
+            self._put(product.pk, product.is_active, product.name, product.name_bn, product.sku)
+            self._rebuild_if_fragmented()
+        self._apply(change, product.pk)
+
+    def product_deleted(self, pk):
+        def change():
+            self._retire(pk)
+            self._memo.clear()
+            self._rebuild_if_fragmented()
+        self._apply(change, pk)
+
+    # ----- queries -----
+
+    def _word_postings(self, prefix):
+        start, end = self.words.prefix_range(prefix)
+        postings = [_slots(posting) for posting in self.postings[start:end]]
+        if self.new_words:
+            start = bisect_left(self.new_words, prefix)
+            end = bisect_left(self.new_words, prefix + _PREFIX_END, start)
+            postings.extend(_slots(posting) for posting in self.new_postings[start:end])
+        return postings
+
+    def _collect(self, slots, limit, results, seen):
+        for slot in slots:
+            if self.alive[slot] and slot not in seen:
+                seen.add(slot)
+                results.append(self.product_ids[slot])
+                if len(results) == limit:
+                    break
+
+    def suggest(self, query, limit=SUGGESTION_LIMIT):
+        """Ids of up to ``limit`` active products matching ``query``, most popular first."""
+        words = analysis.tokenize(query)
+        if not words:
+            return []
+        self._ensure_fresh()
+        with self._lock:
+            memo_key = (words[0], limit) if len(words) == 1 and len(words[0]) <= MEMO_MAX_PREFIX else None
+            if memo_key in self._memo:
+                return self._memo[memo_key]
+
+            results, seen = [], set()
+            sku = query.strip().casefold()
+            if len(sku) > MEMO_MAX_PREFIX and not any(char.isspace() for char in sku):
+                start, end = self.skus.prefix_range(sku)
+                sku_matches = list(self.sku_slots[start:end])
+                start = bisect_left(self.new_skus, (sku,))
+                end = bisect_left(self.new_skus, (sku + _PREFIX_END,), start)
+                sku_matches.extend(slot for _, slot in self.new_skus[start:end])
+                sku_matches.sort(key=self.ranks.__getitem__)
+                self._collect(sku_matches, limit, results, seen)
+
+            if len(results) < limit:
+                # Every word is treated as a prefix. The one with the fewest
+                # postings drives the merge; the others only filter.
+                groups = sorted(
+                    (self._word_postings(word) for word in words),
+                    key=lambda group: sum(len(slots) for slots in group),
+                )
+                driver, others = groups[0], groups[1:]
+                filters = []
+                for group in others:
+                    slots = set()
+                    for posting in group:
+                        slots.update(posting)
+                    filters.append(slots)
+                if all(filters):
+                    matches = heapq.merge(*driver, key=self.ranks.__getitem__)
+                    self._collect(
+                        (slot for slot in matches if all(slot in slots for slots in filters)),
+                        limit, results, seen,
+                    )
+
+            if memo_key is not None and len(self._memo) < MEMO_MAX_ENTRIES:
+                self._memo[memo_key] = results
+            return results
+
+    def memory_bytes(self):
+        """Approximate footprint of the index structures, for capacity checks."""
+        with self._lock:
+            total = self.words.nbytes() + self.skus.nbytes() + sys.getsizeof(self.postings)
+            total += sum(sys.getsizeof(posting) for posting in self.postings)
+            for values in (self.sku_slots, self.product_ids, self.ranks, self.alive, self.slots, self.new_skus):
+                total += sys.getsizeof(values)
+            total += sum(sys.getsizeof(word) for word in self.new_words)
+            total += sum(sys.getsizeof(posting) for posting in self.new_postings)
+            return total
+
+
+autocomplete_index = AutocompleteIndex()
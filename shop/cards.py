@@ -0,0 +1,92 @@
+"""
+Maintenance of the ``ProductCard`` read model.
+
+``refresh()`` recomputes the cards of some products from Product, Category,
+ProductImage and Inventory in one query and upserts them. Inactive or deleted
+products lose their card. The signals in shop.signals call it whenever one
+of those sources changes; ``rebuild()`` (the ``rebuild_product_cards``
+command) recomputes every card.
+"""
+from django.db import transaction
+
+from shop.models import Category, Product, ProductCard
+
+CARD_FIELDS = [
+    field.name for field in ProductCard._meta.concrete_fields if not field.primary_key
+]
+
+
+def build_card(product):
+    """Unsaved ProductCard for ``product``, which must have category, primary_image and inventory loaded."""
+    inventory = getattr(product, 'inventory', None)
+    return ProductCard(
+        id=product.pk,
+        name=product.name,
+        name_bn=product.name_bn,
+        slug=product.slug,
+        price=product.price,
+        compare_price=product.compare_price,
+        discount_percentage=product.get_discount_percentage(),
+        image_url=product.primary_image.image.url if product.primary_image_id else '',
+        category_id=product.category_id,
+        category_slug=product.category.slug,
+        category_path=product.category.path,
+        brand=product.brand,
+        in_stock=bool(inventory and inventory.stock_quantity > 0),
+        is_featured=product.is_featured,
+        created_at=product.created_at,
+        updated_at=product.updated_at,
+    )
+
+
+def _source(product_ids=None):
+    products = Product.objects.filter(is_active=True).select_related(
+        'category', 'primary_image', 'inventory'
+    ).defer('description', 'description_bn', 'short_description', 'short_description_bn')
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    return products
+
+
+def _save(cards):
+    ProductCard.objects.bulk_create(
+        cards, batch_size=500, update_conflicts=True, unique_fields=['id'], update_fields=CARD_FIELDS,
+    )
+
+
+def refresh(product_ids):
+    """Bring the cards of ``product_ids`` in line with their products."""
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    cards = [build_card(product) for product in _source(product_ids)]
+    with transaction.atomic():
+        ProductCard.objects.filter(pk__in=product_ids - {card.pk for card in cards}).delete()
+        _save(cards)
+
+
+def refresh_category(category):
+    """Refresh every card in ``category``'s subtree (its slug or path changed)."""
+    subtree = Category.objects.filter(category.subtree_q()).values('pk')
+    refresh(Product.objects.filter(category__in=subtree).values_list('pk', flat=True))
+
+
+def remove(product_ids):
+    ProductCard.objects.filter(pk__in=product_ids).delete()
+
+
+def rebuild(batch_size=500):
+    """Recompute every card from scratch; returns the number of cards written."""
+    count = 0
+    with transaction.atomic():
+        ProductCard.objects.all().delete()
+        batch = []
+        for product in _source().order_by('pk').iterator(chunk_size=batch_size):
+            batch.append(build_card(product))
+            if len(batch) >= batch_size:
+                _save(batch)
+                count += len(batch)
+                batch = []
+        _save(batch)
+        count += len(batch)
+    return count
@@ -0,0 +1,71 @@
+"""
+In-process snapshot of the active category tree.
+
+Header menus, the home page category grid and breadcrumbs read from one
+``CategoryTree`` per worker instead of querying on every render. Saving or
+deleting a Category or Product bumps the ``category_tree`` version stamp,
+and each worker rebuilds its snapshot the next time it sees a new version.
+"""
+import threading
+from collections import defaultdict
+
+from django.db.models import Count, Q
+
+from shop import versions
+
+VERSION_KEY = 'category_tree'
+
+
+class CategoryTree:
+    def __init__(self, categories):
+        self.by_id = {category.pk: category for category in categories}
+        self.by_slug = {category.slug: category for category in categories}
+        self._children = defaultdict(list)
+        for category in categories:  # already in display order
+            if category.parent_id is None or category.parent_id in self.by_id:
+                self._children[category.parent_id].append(category)
+        for category in categories:
+            category.menu_children = self._children.get(category.pk, [])
+            category.subtree_product_count = category.product_count
+        for category in sorted(categories, key=lambda node: -node.depth):
+            parent = self.by_id.get(category.parent_id)
+            if parent is not None:
+                parent.subtree_product_count += category.subtree_product_count
+        self.roots = self._children.get(None, [])
+
+    def children_of(self, category):
+        return self._children.get(getattr(category, 'pk', category), [])
+
+    def ancestors(self, category):
+        """Breadcrumb trail from the root down to (excluding) ``category``."""
+        return [self.by_id[pk] for pk in category.get_ancestor_ids() if pk in self.by_id]
+
+    def subtree_ids(self, category):
+        lower = category.path
+        return [pk for pk, node in self.by_id.items() if node.path.startswith(lower)]
+
+
+_lock = threading.Lock()
+_snapshot = None
+_snapshot_version = None
+
+
+def get_tree():
+    global _snapshot, _snapshot_version
+    current = versions.get_version(VERSION_KEY)
+    if _snapshot_version != current:
+        with _lock:
+            if _snapshot_version != current:
+                from shop.models import Category
+
+                categories = list(
+                    Category.objects.filter(is_active=True)
+                    .annotate(product_count=Count('product', filter=Q(product__is_active=True)))
+                    .order_by('display_order', 'name')
+                )
+                _snapshot, _snapshot_version = CategoryTree(categories), current
+    return _snapshot
+
+
+def invalidate():
+    versions.bump_version(VERSION_KEY)
@@ -0,0 +1,266 @@
+"""
+Faceted navigation for the shop listing.
+
+``FacetIndex`` keeps one posting list (a set of product ids) per facet value
+in memory, so facet counts for any combination of filters are set
+intersections instead of a GROUP BY per facet per request. The page of
+products itself is still fetched with ``apply_selection()`` so the database
+can use its indexes for ordering and pagination.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import F, Q
+
+from shop import versions
+
+VERSION_KEY = 'facets'
+
+# (key, label, lower bound inclusive, upper bound exclusive)
+PRICE_BUCKETS = (
+    ('0-500', 'Under ৳500', Decimal('0'), Decimal('500')),
+    ('500-1000', '৳500 - ৳1,000', Decimal('500'), Decimal('1000')),
+    ('1000-2500', '৳1,000 - ৳2,500', Decimal('1000'), Decimal('2500')),
+    ('2500-5000', '৳2,500 - ৳5,000', Decimal('2500'), Decimal('5000')),
+    ('5000-', '৳5,000 & above', Decimal('5000'), None),
+)
+
+
+def price_bucket(price):
+    price = Decimal(str(price))
+    for key, _, lower, upper in PRICE_BUCKETS:
+        if price >= lower and (upper is None or price < upper):
+            return key
+    return None
+
+
+def is_on_sale(price, compare_price):
+    return compare_price is not None and Decimal(str(compare_price)) > Decimal(str(price))
+
+
+def parse_selection(params):
+    """Read the facet filters out of a QueryDict."""
+    bucket_keys = {bucket[0] for bucket in PRICE_BUCKETS}
+    return {
+        'category': params.get('category') or None,
+        'brand': [brand for brand in params.getlist('brand') if brand],
+        'price': [key for key in params.getlist('price') if key in bucket_keys],
+        'in_stock': params.get('in_stock') == '1',
+        'on_sale': params.get('on_sale') == '1',
+    }
+
+
+class FacetIndex(versions.VersionedIndex):
+    version_key = VERSION_KEY
+
+    def __init__(self):
+        super().__init__()
+        self._reset()
+
+    def _reset(self):
+        self.all = set()
+        self.products = {}  # pk -> (category_id, brand, price bucket, on sale)
+        self.by_category = defaultdict(set)
+        self.by_brand = defaultdict(set)
+        self.by_price = defaultdict(set)
+        self.on_sale = set()
+        self.in_stock = set()  # product ids with stock, active or not
+        self.categories = {}  # pk -> (parent_id, slug, name)
+        self.category_ids = {}  # slug -> pk
+        self.children = defaultdict(list)
+        self._subtrees = {}
+
+    # ----- loading and incremental maintenance -----
+
+    def _load(self):
+        from admin_dashboard.models import Inventory
+        from shop.models import Category, Product
+
+        self._reset()
+        for pk, parent_id, slug, name in Category.objects.filter(is_active=True).values_list(
+            'pk', 'parent_id', 'slug', 'name'
+        ):
+            self.categories[pk] = (parent_id, slug, name)
+            self.category_ids[slug] = pk
+        for pk, (parent_id, _, _) in self.categories.items():
+            self.children[parent_id].append(pk)
+
+        rows = Product.objects.filter(is_active=True).values_list(
+            'pk', 'category_id', 'brand', 'price', 'compare_price'
+        )
+        for row in rows:
+            self._add(*row)
+        self.in_stock = set(Inventory.objects.filter(stock_quantity__gt=0).values_list('product_id', flat=True))
+
+    def _add(self, pk, category_id, brand, price, compare_price):
+        record = (category_id, brand or None, price_bucket(price), is_on_sale(price, compare_price))
+        self.products[pk] = record
+        self.all.add(pk)
+        self.by_category[record[0]].add(pk)
+        if record[1]:
+            self.by_brand[record[1]].add(pk)
+        self.by_price[record[2]].add(pk)
+        if record[3]:
+            self.on_sale.add(pk)
+
+    def _discard(self, pk):
+        record = self.products.pop(pk, None)
+        if record is None:
+            return
+        self.all.discard(pk)
+        self.by_category[record[0]].discard(pk)
+        if record[1]:
+            self.by_brand[record[1]].discard(pk)
+            if not self.by_brand[record[1]]:
+                del self.by_brand[record[1]]
+        self.by_price[record[2]].discard(pk)
+        self.on_sale.discard(pk)
+
+    def product_changed(self, product):
+        def change():
+            self._discard(product.pk)
+            if product.is_active:
+                self._add(product.pk, product.category_id, product.brand, product.price, product.compare_price)
+        self._apply(change)
+
+    def product_deleted(self, pk):
+        def change():
+            self._discard(pk)
+            self.in_stock.discard(pk)
+        self._apply(change)
+
+    def stock_changed(self, product_id, stock_quantity):
+        def change():
+            if int(stock_quantity) > 0:
+                self.in_stock.add(product_id)
+            else:
+                self.in_stock.discard(product_id)
+        self._apply(change)
+
+    # ----- queries -----
+
+    def subtree(self, category_id):
+        """Ids of ``category_id`` and all of its active descendants."""
+        ids = self._subtrees.get(category_id)
+        if ids is None:
+            ids, stack = set(), [category_id]
+            while stack:
+                current = stack.pop()
+                ids.add(current)
+                stack.extend(self.children.get(current, ()))
+            self._subtrees[category_id] = ids
+        return ids
+
+    def category_subtree_ids(self, slug):
+        self._ensure_fresh()
+        with self._lock:
+            category_id = self.category_ids.get(slug)
+            return set() if category_id is None else set(self.subtree(category_id))
+
+    def _category_postings(self, category_id):
+        postings = set()
+        for pk in self.subtree(category_id):
+            postings |= self.by_category.get(pk, set())
+        return postings
+
+    def _filter_sets(self, selection):
+        filters = {}
+        if selection['category']:
+            category_id = self.category_ids.get(selection['category'])
+            filters['category'] = set() if category_id is None else self._category_postings(category_id)
+        if selection['brand']:
+            filters['brand'] = set().union(*(self.by_brand.get(brand, set()) for brand in selection['brand']))
+        if selection['price']:
+            filters['price'] = set().union(*(self.by_price.get(key, set()) for key in selection['price']))
+        if selection['in_stock']:
+            filters['in_stock'] = self.in_stock
+        if selection['on_sale']:
+            filters['on_sale'] = self.on_sale
+        return filters
+
+    @staticmethod
+    def _intersect(base, sets):
+        result = base
+        for ids in sorted(sets, key=len):
+            result = result & ids
+            if not result:
+                break
+        return result
+
+    def counts(self, selection, restrict_to=None):
+        """
+        Facet values with counts for the current selection.
+
+        Counts within a facet ignore that facet's own filter (so picking one
+        brand still shows how many products the other brands have) but
+        respect every other active filter.
+        """
+        self._ensure_fresh()
+        with self._lock:
+            base = self.all if restrict_to is None else self.all & set(restrict_to)
+            filters = self._filter_sets(selection)
+
+            def matching(excluding=None):
+                return self._intersect(base, [ids for facet, ids in filters.items() if facet != excluding])
+
+            others = matching('category')
+            selected_id = self.category_ids.get(selection['category'])
+            category_values = []
+            for pk in sorted(self.children.get(selected_id, ()), key=lambda pk: self.categories[pk][2]):
+                count = len(self._category_postings(pk) & others)
+                if count:
+                    _, slug, name = self.categories[pk]
+                    category_values.append({'value': slug, 'label': name, 'count': count, 'selected': False})
+
+            others = matching('brand')
+            brand_values = [
+                {'value': brand, 'label': brand, 'count': len(ids & others), 'selected': brand in selection['brand']}
+                for brand, ids in sorted(self.by_brand.items())
+            ]
+
+            others = matching('price')
+            price_values = [
+                {'value': key, 'label': label, 'count': len(self.by_price.get(key, set()) & others),
+                 'selected': key in selection['price']}
+                for key, label, _, _ in PRICE_BUCKETS
+            ]
+
+            return {
+                'total': len(matching()),
+                'category': category_values,
+                'brand': [value for value in brand_values if value['count'] or value['selected']],
+                'price': price_values,
+                'in_stock': len(self.in_stock & matching('in_stock')),
+                'on_sale': len(self.on_sale & matching('on_sale')),
+            }
+
+
+facet_index = FacetIndex()
+
+
+def apply_selection(queryset, selection):
+    """Apply the same filters the facet counts describe to a Product or ProductCard queryset."""
+    if selection['category']:
+        queryset = queryset.filter(category_id__in=facet_index.category_subtree_ids(selection['category']))
+    if selection['brand']:
+        queryset = queryset.filter(brand__in=selection['brand'])
+    if selection['price']:
+        price_filter = Q()
+        for key, _, lower, upper in PRICE_BUCKETS:
+            if key in selection['price']:
+                bucket = Q(price__gte=lower)
+                if upper is not None:
+                    bucket &= Q(price__lt=upper)
+                price_filter |= bucket
+        queryset = queryset.filter(price_filter)
+    if selection['in_stock']:
+        from shop.models import ProductCard
+
+        if queryset.model is ProductCard:
+            queryset = queryset.filter(in_stock=True)
+        else:
+            queryset = queryset.filter(inventory__stock_quantity__gt=0)
+    if selection['on_sale']:
+        queryset = queryset.filter(compare_price__gt=F('price'))
+    return queryset
+
@@ -0,0 +1,106 @@
+"""
+Versioned fragment cache for product cards.
+
+A card is rendered once per (product id, updated_at, language, price
+stamp) and reused by every listing that shows it. Nothing is ever
+deleted: saving a Product, ProductImage or Inventory row moves
+``Product.updated_at`` forward, and the price stamp
+(``shop.pricing.price_index.cache_stamp()``) moves when a promotion is
+edited, starts or ends, so stale cards simply stop being looked up and
+age out.
+"""
+import threading
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+from shop.pricing import price_index
+
+CARD_TEMPLATE = 'shop/includes/product_card.html'
+CARD_TIMEOUT = 60 * 60 * 24
+
+STATS_KEY_PREFIX = 'shop:fragment_stats:'
+STATS_FLUSH_EVERY = 100
+
+
+class _Stats:
+    """Hit/miss counters buffered per process and flushed to the shared cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {'hits': 0, 'misses': 0}
+
+    def record(self, hits, misses):
+        with self._lock:
+            self._pending['hits'] += hits
+            self._pending['misses'] += misses
+            if sum(self._pending.values()) < STATS_FLUSH_EVERY:
+                return
+            pending, self._pending = self._pending, {'hits': 0, 'misses': 0}
+        self._flush(pending)
+
+    def _flush(self, pending):
+        for name, value in pending.items():
+            if not value:
+                continue
+            key = STATS_KEY_PREFIX + name
+            if not cache.add(key, value, None):
+                try:
+                    cache.incr(key, value)
+                except ValueError:
+                    cache.set(key, value, None)
+
+    def snapshot(self):
+        with self._lock:
+            pending, self._pending = self._pending, {'hits': 0, 'misses': 0}
+        self._flush(pending)
+        hits = cache.get(STATS_KEY_PREFIX + 'hits', 0)
+        misses = cache.get(STATS_KEY_PREFIX + 'misses', 0)
+        total = hits + misses
+        return {'hits': hits, 'misses': misses, 'hit_rate': round(hits / total, 4) if total else None}
+
+    def reset(self):
+        with self._lock:
+            self._pending = {'hits': 0, 'misses': 0}
+        cache.delete_many([STATS_KEY_PREFIX + 'hits', STATS_KEY_PREFIX + 'misses'])
+
+
+stats = _Stats()
+
+
+def card_key(product, language, price_stamp):
+    stamp = product.updated_at.timestamp() if product.updated_at else 0
+    return f'shop:card:{product.pk}:{stamp}:{language}:{price_stamp}'
+
+
+def render_cards(products):
+    """Rendered card HTML for each product, with one cache round trip for the lot."""
+    products = list(products)
+    if not products:
+        return []
+    language = get_language()
+    price_stamp = price_index.cache_stamp()
+    keys = [card_key(product, language, price_stamp) for product in products]
+    cached = cache.get_many(keys)
+
+    missing = {}
+    cards = []
+    for key, product in zip(keys, products):
+        html = cached.get(key)
+        if html is None:
+            html = missing.get(key)
+            if html is None:
+                html = missing[key] = render_to_string(
+                    CARD_TEMPLATE, {'product': product, 'sale': price_index.sale(product.pk, product.price)}
+                )
+        cards.append(mark_safe(html))
+    if missing:
+        cache.set_many(missing, CARD_TIMEOUT)
+    stats.record(hits=len(products) - len(missing), misses=len(missing))
+    return cards
+
+
+def render_card(product):
+    return render_cards([product])[0]
@@ -0,0 +1,239 @@
+"""
+Typo-tolerant product search over name, name_bn and brand.
+
+Every word is padded and cut into trigrams ("samsung" -> "  s", " sa",
+"sam", ..., "ng "), and each (trigram, product) pair is a ``ProductTrigram``
+row. The unique (trigram, product) index is the posting list for each
+trigram. A query collects the products sharing the most trigrams with it
+in one indexed GROUP BY. It then re-ranks that short list in Python by
+trigram overlap and edit distance, so "samsng glaxy" still finds
+"Samsung Galaxy". Used by ``search.search_ids()`` when full-text search
+finds too little.
+
+Common trigrams (word starts such as "  s", endings such as "ng ") have
+posting lists thousands of rows long. They dominate the GROUP BY and tell
+candidates apart least. So a query looks up its rarest trigrams first and
+stops at ``POSTINGS_BUDGET`` rows. Each process keeps the posting count of
+every trigram it has seen for ``FREQUENCY_TTL`` seconds.
+"""
+import threading
+import time
+
+from django.db import transaction
+from django.db.models import Count
+
+from shop.models import Product, ProductTrigram
+from shop.analysis import index_terms, tokenize
+
+FIELDS = ('name', 'name_bn', 'brand')
+
+# Products re-ranked per query; the GROUP BY only returns this many.
+CANDIDATES = 50
+
+# A candidate must share this fraction of the query's trigrams...
+MIN_OVERLAP = 0.3
+
+# ...and reach this combined score to be returned.
+MIN_SCORE = 0.5
+
+# Posting rows a query may pull into the GROUP BY, rarest trigrams first;
+# at least MIN_GRAMS trigrams that occur anywhere are looked up regardless.
+POSTINGS_BUDGET = 5000
+MIN_GRAMS = 3
+
+# Seconds a process trusts a trigram's posting count. Counts only choose
+# which trigrams to look up, so they may lag behind the index.
+FREQUENCY_TTL = 60 * 10
+
+
+def word_trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def trigrams(words):
+    grams = set()
+    for word in words:
+        grams |= word_trigrams(word)
+    return grams
+
+
+def product_terms(values):
+    return set(index_terms(' '.join(value or '' for value in values)))
+
+
+def product_trigrams(product):
+    return trigrams(product_terms(getattr(product, field) for field in FIELDS))
+
+
+def index_products(products):
+    """Replace the trigram rows of ``products``; inactive ones are dropped."""
+    products = list(products)
+    rows = [
+        ProductTrigram(trigram=gram, product_id=product.pk)
+        for product in products if product.is_active
+        for gram in product_trigrams(product)
+    ]
+    with transaction.atomic():
+        ProductTrigram.objects.filter(product_id__in=[product.pk for product in products]).delete()
+        ProductTrigram.objects.bulk_create(rows, batch_size=1000)
+
+
+def rebuild_index(batch_size=500):
+    """Re-create every trigram row; returns the number of products indexed."""
+    ProductTrigram.objects.all().delete()
+    products = Product.objects.filter(is_active=True).only('pk', 'is_active', *FIELDS).order_by('pk')
+    count = 0
+    batch = []
+    for product in products.iterator(chunk_size=batch_size):
+        batch.append(product)
+        if len(batch) >= batch_size:
+            index_products(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        index_products(batch)
+        count += len(batch)
+    return count
+
+
+def edit_distance(a, b, limit=None):
+    """
+    Levenshtein distance between ``a`` and ``b``. With ``limit``, gives up
+    and returns ``limit + 1`` as soon as the distance must exceed it.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def _word_similarity(word, candidate):
+    """1.0 for an exact or prefix hit, falling towards 0 with edit distance."""
+    if candidate.startswith(word):
+        return 1.0
+    # Compare against the candidate's leading part so a typed prefix
+    # ("galx") is not punished for the letters still to come.
+    candidate = candidate[:len(word) + 2]
+    longest = max(len(word), len(candidate))
+    # Anything past half the word's length cannot reach MIN_SCORE anyway.
+    limit = longest // 2
+    return max(0.0, 1 - edit_distance(word, candidate, limit) / longest)
+
+
+class TrigramFrequencies:
+    """Per-process cache of how many products each trigram occurs in."""
+
+    def __init__(self, ttl=FREQUENCY_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._counts = {}  # trigram -> (products, time.monotonic() when counted)
+
+    def counts(self, grams):
+        now = time.monotonic()
+        with self._lock:
+            known = {
+                gram: entry[0] for gram in grams
+                if (entry := self._counts.get(gram)) is not None and now - entry[1] < self.ttl
+            }
+        missing = [gram for gram in grams if gram not in known]
+        if missing:
+            counted = dict(
+                ProductTrigram.objects.filter(trigram__in=missing)
+                .values('trigram')
+                .annotate(products=Count('*'))
+                .values_list('trigram', 'products')
+                .order_by()
+            )
+            with self._lock:
+                for gram in missing:
+                    known[gram] = counted.get(gram, 0)
+                    self._counts[gram] = (known[gram], now)
+        return known
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+frequencies = TrigramFrequencies()
+
+
+def select_trigrams(words):
+    """
+    The trigrams of ``words`` worth looking up, within ``POSTINGS_BUDGET``.
+    Every word's rarest trigram comes first, then every word's second
+    rarest, and so on, so each word keeps a say in who the candidates are.
+    """
+    counts = frequencies.counts(trigrams(words))
+    # A trigram no product has costs nothing to look up, but still counts
+    # against the overlap a candidate needs.
+    selected = [gram for gram, count in counts.items() if not count]
+    ordered = sorted(
+        (rank, counts[gram], gram)
+        for word in words
+        for rank, gram in enumerate(sorted(
+            (gram for gram in word_trigrams(word) if counts[gram]), key=lambda gram: (counts[gram], gram)
+        ))
+    )
+    postings = found = 0
+    for _, count, gram in ordered:
+        if gram in selected or (found >= MIN_GRAMS and postings + count > POSTINGS_BUDGET):
+            continue
+        selected.append(gram)
+        found += 1
+        postings += count
+    return selected
+
+
+def search_ids(query, limit=10):
+    """Ids of active products resembling ``query``, best match first."""
+    query_words = tokenize(query)
+    if not query_words:
+        return []
+    grams = select_trigrams(query_words)
+
+    min_hits = max(1, int(len(grams) * MIN_OVERLAP))
+    hits = dict(
+        ProductTrigram.objects.filter(trigram__in=grams)
+        .values('product_id')
+        .annotate(hits=Count('*'))
+        .filter(hits__gte=min_hits)
+        .order_by('-hits')
+        .values_list('product_id', 'hits')[:CANDIDATES]
+    )
+    if not hits:
+        return []
+
+    # Candidates share most of their words, so each (query word, product
+    # word) pair is scored once per query.
+    similarities = {}
+
+    def best_similarity(word, words):
+        best = 0.0
+        for candidate in words:
+            key = (word, candidate)
+            if key not in similarities:
+                similarities[key] = _word_similarity(word, candidate)
+            best = max(best, similarities[key])
+        return best
+
+    scored = []
+    rows = Product.objects.filter(pk__in=hits, is_active=True).values_list('pk', *FIELDS)
+    for pk, *values in rows:
+        words = product_terms(values)
+        similarity = sum(best_similarity(word, words) for word in query_words) / len(query_words)
+        score = (hits[pk] / len(grams) + similarity) / 2
+        if score >= MIN_SCORE:
+            scored.append((score, pk))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [pk for _, pk in scored[:limit]]
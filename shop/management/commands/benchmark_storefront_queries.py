@@ -0,0 +1,167 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from shop import api, cards, recommendations
+from shop.models import Category, Product, ProductAssociation, ProductCard
+from shop.pagination import SORT_ORDERINGS
+
+PAGE = 12
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed N throwaway products and print the query plan and timing of each storefront query. '
+        'Everything runs in a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=20000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        try:
+            with transaction.atomic():
+                categories = self.seed(options['products'])
+                self.run(categories, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, count):
+        started = time.perf_counter()
+        root = Category.objects.create(name='Bench', slug='bench-root')
+        categories = [root] + [
+            Category.objects.create(name=f'Bench {i}', slug=f'bench-{i}', parent=root) for i in range(10)
+        ]
+        brands = ['Acme', 'Walton', 'Samsung', 'Symphony', None]
+        now = timezone.now()
+        batch = []
+        for i in range(count):
+            price = Decimal(random.randint(100, 20000))
+            batch.append(Product(
+                name=f'Bench product {random.randint(0, 10 ** 6)}', slug=f'bench-product-{i}',
+                sku=f'BENCH-{i}', category=random.choice(categories), description='',
+                price=price, compare_price=price * 2 if random.random() < 0.2 else None,
+                brand=random.choice(brands), is_active=random.random() < 0.9,
+                is_featured=random.random() < 0.02,
+            ))
+            if len(batch) == 2000:
+                self.insert(batch, now)
+                batch = []
+        self.insert(batch, now)
+        self.associate()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(f'Seeded {count} products in {time.perf_counter() - started:.1f}s\n')
+        return categories
+
+    def insert(self, products, now):
+        Product.objects.bulk_create(products)
+        # created_at is auto_now_add, so bulk_create stamped every row with
+        # the same moment; spread them out so "newest" has real work to do.
+        for product in products:
+            product.created_at = now - timezone.timedelta(minutes=int(product.slug.rsplit('-', 1)[1]))
+        Product.objects.bulk_update(products, ['created_at'], batch_size=500)
+        # bulk_create sends no signals, so build the listing cards by hand.
+        cards.refresh([product.pk for product in products])
+
+    def associate(self):
+        """Give a tenth of the products a few "bought together" neighbours."""
+        ids = list(Product.objects.filter(slug__startswith='bench-product-').values_list('pk', flat=True))
+        associations = []
+        for pk in random.sample(ids, len(ids) // 10):
+            for related in random.sample(ids, random.randint(1, 6)):
+                if related != pk:
+                    associations.append(ProductAssociation(
+                        product_id=pk, related_id=related, co_purchases=1, score=random.random(),
+                    ))
+        ProductAssociation.objects.bulk_create(associations, batch_size=2000, ignore_conflicts=True)
+
+    def queries(self, categories):
+        """
+        (label, callable) pairs. Each callable runs what the view runs, so
+        the plans printed are those of the SQL the storefront really sends.
+        """
+        # Listings read ProductCard (the shop_card_* indexes); only the
+        # product page and the API still query Product.
+        listed = ProductCard.objects.all()
+        newest = SORT_ORDERINGS['newest']
+        root, leaf = categories[0], categories[1]
+        # A product with a few neighbours, so related_products() also runs
+        # its same-category fallback.
+        few_neighbours = (
+            ProductAssociation.objects.filter(product__is_active=True, related__is_active=True)
+            .values('product_id').annotate(neighbours=Count('*')).filter(neighbours__lt=4)
+        )
+        sample = Product.objects.get(pk=few_neighbours[0]['product_id'])
+        request = RequestFactory().get
+
+        def evaluate(queryset):
+            return lambda: list(queryset.all())
+
+        for sort, ordering in SORT_ORDERINGS.items():
+            yield f'shop: sort={sort}', evaluate(listed.order_by(*ordering)[:PAGE])
+        yield 'shop: brand filter', evaluate(listed.filter(brand__in=['Walton']).order_by(*newest)[:PAGE])
+        yield 'shop: on sale', evaluate(listed.filter(compare_price__gt=F('price')).order_by(*newest)[:PAGE])
+        yield 'category: subtree', evaluate(listed.filter(root.subtree_q('category_')).order_by(*newest)[:PAGE])
+        yield 'category: leaf', evaluate(listed.filter(leaf.subtree_q('category_')).order_by(*newest)[:PAGE])
+        yield 'home: featured', evaluate(ProductCard.objects.filter(is_featured=True).order_by('id')[:8])
+        yield 'home: latest', evaluate(ProductCard.objects.order_by(*newest)[:8])
+        yield 'product_detail: by slug', evaluate(Product.objects.filter(slug=sample.slug, is_active=True))
+        yield 'product_detail: related products', lambda: recommendations.related_products(sample, limit=4)
+        for label, path in (
+            ('api: list etag', '/api/shop/products/'),
+            ('api: category list etag', f'/api/shop/products/?category={leaf.slug}'),
+        ):
+            yield label, lambda path=path: api.product_list_etag(request(path))
+        yield 'api: detail etag', lambda: api.product_detail_etag(request('/'), sample.slug)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+            rows = cursor.fetchall()
+        if connection.vendor == 'sqlite':
+            return '\n'.join(row[-1] for row in rows)
+        return '\n'.join(str(row[0]) for row in rows)
+
+    def run(self, categories, repeat):
+        for label, call in self.queries(categories):
+            call()  # warm the per-process caches (category tree, stamps) first
+            with CaptureQueriesContext(connection) as captured:
+                call()
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                call()
+                timings.append((time.perf_counter() - started) * 1000)
+            plans = [
+                self.explain(query['sql']) for query in captured.captured_queries
+                if query['sql'].lstrip().upper().startswith('SELECT')
+            ]
+            full_scan = any(
+                line.strip().startswith('SCAN') and 'INDEX' not in line
+                for plan in plans for line in plan.splitlines()
+            ) if connection.vendor == 'sqlite' else any('Seq Scan' in plan for plan in plans)
+            style = self.style.WARNING if full_scan else self.style.SUCCESS
+            self.stdout.write(style(
+                f'{label}: {len(plans)} quer{"y" if len(plans) == 1 else "ies"}, '
+                f'median {statistics.median(timings):.2f} ms, max {max(timings):.2f} ms'
+                f'{"  [FULL SCAN]" if full_scan else ""}'
+            ))
+            for plan in plans:
+                self.stdout.write('    ' + plan.replace('\n', '\n    ') + '\n')
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop import cards
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized ProductCard read model from the Product table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = cards.rebuild(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Built {count} product cards in {elapsed:.2f}s'))
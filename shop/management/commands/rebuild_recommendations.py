@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Rebuild "frequently bought together" associations from delivered orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--neighbours', type=int, default=recommendations.NEIGHBOURS)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = recommendations.rebuild(batch_size=options['batch_size'], neighbours=options['neighbours'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} product associations in {elapsed:.2f}s'))
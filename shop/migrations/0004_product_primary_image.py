@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_primary_images(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    ProductImage = apps.get_model('shop', 'ProductImage')
+    primary = {}
+    for image_id, product_id in ProductImage.objects.order_by(
+        '-is_default', 'created_at', 'pk'
+    ).values_list('pk', 'product_id'):
+        primary.setdefault(product_id, image_id)
+    for product_id, image_id in primary.items():
+        Product.objects.filter(pk=product_id).update(primary_image_id=image_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shop.productimage'),
+        ),
+        migrations.RunPython(backfill_primary_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:57
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_trigrams(apps, schema_editor):
+    # Frozen copy of shop.fuzzy.product_trigrams() as of this migration.
+    Product = apps.get_model('shop', 'Product')
+    ProductTrigram = apps.get_model('shop', 'ProductTrigram')
+    rows = []
+    for pk, *values in Product.objects.filter(is_active=True).values_list('pk', 'name', 'name_bn', 'brand').iterator():
+        grams = set()
+        for word in re.findall(r'\w+', ' '.join(value or '' for value in values).casefold()):
+            padded = f'  {word} '
+            grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+        rows.extend(ProductTrigram(trigram=gram, product_id=pk) for gram in grams)
+        if len(rows) >= 5000:
+            ProductTrigram.objects.bulk_create(rows)
+            rows = []
+    ProductTrigram.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_product_association'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('trigram', 'product'), name='unique_product_trigram')],
+            },
+        ),
+        migrations.RunPython(build_trigrams, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:01
+
+import django.db.models.deletion
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def build_cards(apps, schema_editor):
+    # Frozen copy of shop.cards.build_card() as of this migration.
+    Product = apps.get_model('shop', 'Product')
+    ProductCard = apps.get_model('shop', 'ProductCard')
+    Inventory = apps.get_model('admin_dashboard', 'Inventory')
+    in_stock = set(Inventory.objects.filter(stock_quantity__gt=0).values_list('product_id', flat=True))
+    products = Product.objects.filter(is_active=True).select_related('category', 'primary_image').defer(
+        'description', 'description_bn', 'short_description', 'short_description_bn'
+    )
+    cards = []
+    for product in products.iterator(chunk_size=500):
+        discount = 0
+        if product.compare_price and product.compare_price > product.price:
+            discount = int(((product.compare_price - product.price) / product.compare_price) * 100)
+        cards.append(ProductCard(
+            id=product.pk, name=product.name, name_bn=product.name_bn, slug=product.slug,
+            price=product.price, compare_price=product.compare_price, discount_percentage=discount,
+            image_url=default_storage.url(product.primary_image.image.name) if product.primary_image_id else '',
+            category_id=product.category_id, category_slug=product.category.slug,
+            category_path=product.category.path, brand=product.brand, in_stock=product.pk in in_stock,
+            is_featured=product.is_featured, created_at=product.created_at, updated_at=product.updated_at,
+        ))
+    ProductCard.objects.bulk_create(cards, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_product_storefront_indexes'),
+        ('admin_dashboard', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCard',
+            fields=[
+                ('id', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('name_bn', models.CharField(blank=True, max_length=200)),
+                ('slug', models.SlugField(unique=True)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('compare_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('discount_percentage', models.PositiveSmallIntegerField(default=0)),
+                ('image_url', models.CharField(blank=True, max_length=255)),
+                ('category_slug', models.SlugField()),
+                ('category_path', models.CharField(max_length=255)),
+                ('brand', models.CharField(blank=True, max_length=100, null=True)),
+                ('in_stock', models.BooleanField(default=False)),
+                ('is_featured', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.category')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-created_at', 'id'], name='shop_card_newest'), models.Index(fields=['price', 'id'], name='shop_card_price'), models.Index(fields=['-price', 'id'], name='shop_card_price_desc'), models.Index(fields=['name', 'id'], name='shop_card_name'), models.Index(fields=['category_path', '-created_at'], name='shop_card_path_newest'), models.Index(fields=['brand', '-created_at', 'id'], name='shop_card_brand_newest'), models.Index(condition=models.Q(('is_featured', True)), fields=['id'], name='shop_card_featured')],
+            },
+        ),
+        migrations.RunPython(build_cards, migrations.RunPython.noop),
+    ]
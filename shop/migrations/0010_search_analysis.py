@@ -0,0 +1,145 @@
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import migrations
+
+FIELDS = (
+    'name', 'name_bn', 'short_description', 'short_description_bn', 'sku', 'description', 'description_bn',
+)
+
+# Frozen copy of shop.analysis.index_terms() as of this migration, so later
+# changes to the live analyzer cannot change what this migration writes.
+INVISIBLE = dict.fromkeys(map(ord, '\u200b\u200c\u200d\u2060\ufeff\u00ad'))
+BENGALI_DIGITS = str.maketrans('০১২৩৪৫৬৭৮৯', '0123456789')
+SPELLING_VARIANTS = (('ত্\u200d', 'ৎ'), ('অা', 'আ'))
+TOKEN_RE = re.compile(r'[\w\u0980-\u09ff]+')
+BENGALI_RE = re.compile(r'[\u0980-\u09ff]')
+INDEPENDENT_VOWELS = {
+    'অ': 'o', 'আ': 'a', 'ই': 'i', 'ঈ': 'i', 'উ': 'u', 'ঊ': 'u', 'ঋ': 'ri',
+    'এ': 'e', 'ঐ': 'oi', 'ও': 'o', 'ঔ': 'ou',
+}
+VOWEL_SIGNS = {
+    'া': 'a', 'ি': 'i', 'ী': 'i', 'ু': 'u', 'ূ': 'u', 'ৃ': 'ri',
+    'ে': 'e', 'ৈ': 'oi', 'ো': 'o', 'ৌ': 'ou',
+}
+CONSONANTS = {
+    'ক': 'k', 'খ': 'kh', 'গ': 'g', 'ঘ': 'gh', 'ঙ': 'ng',
+    'চ': 'ch', 'ছ': 'chh', 'জ': 'j', 'ঝ': 'jh', 'ঞ': 'n',
+    'ট': 't', 'ঠ': 'th', 'ড': 'd', 'ঢ': 'dh', 'ণ': 'n',
+    'ত': 't', 'থ': 'th', 'দ': 'd', 'ধ': 'dh', 'ন': 'n',
+    'প': 'p', 'ফ': 'f', 'ব': 'b', 'ভ': 'bh', 'ম': 'm',
+    'য': 'j', 'র': 'r', 'ল': 'l', 'শ': 'sh', 'ষ': 'sh', 'স': 's', 'হ': 'h',
+}
+NUKTA_CONSONANTS = {'ড': 'r', 'ঢ': 'rh', 'য': 'y'}
+SIGNS = {'ৎ': 't', 'ং': 'ng', 'ঃ': 'h', 'ঁ': ''}
+HASANTA = '\u09cd'
+NUKTA = '\u09bc'
+
+
+def tokenize(text):
+    text = unicodedata.normalize('NFC', text or '')
+    for variant, canonical in SPELLING_VARIANTS:
+        text = text.replace(variant, canonical)
+    text = text.translate(INVISIBLE).translate(BENGALI_DIGITS).casefold()
+    if not text.isascii():
+        text = ''.join(
+            ''.join(part for part in unicodedata.normalize('NFD', char) if not unicodedata.combining(part))
+            if '\u00c0' <= char <= '\u024f' else char
+            for char in text
+        )
+    return TOKEN_RE.findall(text)
+
+
+def transliterate(term):
+    output = []
+    length = len(term)
+    i = 0
+    while i < length:
+        char = term[i]
+        if char in CONSONANTS:
+            if i + 1 < length and term[i + 1] == NUKTA and char in NUKTA_CONSONANTS:
+                output.append(NUKTA_CONSONANTS[char])
+                i += 1
+            else:
+                output.append(CONSONANTS[char])
+            following = term[i + 1] if i + 1 < length else ''
+            if following in VOWEL_SIGNS:
+                output.append(VOWEL_SIGNS[following])
+                i += 1
+            elif following == HASANTA:
+                i += 1
+            elif following in CONSONANTS or following in SIGNS:
+                output.append('o')
+        elif char in INDEPENDENT_VOWELS:
+            output.append(INDEPENDENT_VOWELS[char])
+        elif char in SIGNS:
+            output.append(SIGNS[char])
+        elif char in VOWEL_SIGNS:
+            output.append(VOWEL_SIGNS[char])
+        elif not BENGALI_RE.match(char):
+            output.append(char)
+        i += 1
+    return ''.join(output)
+
+
+def index_terms(text):
+    terms = tokenize(text)
+    if not getattr(settings, 'SEARCH_TRANSLITERATE_BENGALI', True):
+        return terms
+    extra = []
+    for term in terms:
+        if BENGALI_RE.search(term):
+            latin = transliterate(term)
+            if latin and latin != term:
+                extra.append(latin)
+    return terms + extra
+
+
+def reindex_analyzed(apps, schema_editor):
+    # Re-create the FTS table with the mark-aware tokenizer and the new
+    # columns, then re-fill it and the trigram table with analyzed terms.
+    Product = apps.get_model('shop', 'Product')
+    ProductTrigram = apps.get_model('shop', 'ProductTrigram')
+    products = Product.objects.filter(is_active=True).select_related('category')
+
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS shop_product_fts")
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE shop_product_fts USING fts5("
+            "name, name_bn, short_description, short_description_bn, sku, description, description_bn, category, "
+            "tokenize = \"unicode61 remove_diacritics 0 categories 'L* N* Co M*'\")"
+        )
+        rows = []
+        for product in products.iterator(chunk_size=500):
+            values = [getattr(product, field) or '' for field in FIELDS]
+            values.append(f'{product.category.name} {product.category.name_bn}')
+            rows.append((product.pk, *[' '.join(index_terms(value)) for value in values]))
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO shop_product_fts (rowid, name, name_bn, short_description, short_description_bn, "
+                "sku, description, description_bn, category) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                rows,
+            )
+
+    ProductTrigram.objects.all().delete()
+    trigrams = []
+    for pk, *values in products.values_list('pk', 'name', 'name_bn', 'brand').iterator():
+        for word in set(index_terms(' '.join(value or '' for value in values))):
+            padded = f'  {word} '
+            trigrams.extend(
+                ProductTrigram(trigram=gram, product_id=pk)
+                for gram in {padded[i:i + 3] for i in range(len(padded) - 2)}
+            )
+    ProductTrigram.objects.bulk_create(trigrams, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_product_card'),
+    ]
+
+    operations = [
+        migrations.RunPython(reindex_analyzed, migrations.RunPython.noop),
+    ]
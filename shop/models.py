@@ -1,6 +1,20 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat, Substr
 from django.utils.translation import gettext_lazy as _
 from django.urls import reverse
+from django.utils import timezone
+
+
+def path_range(path):
+    """
+    (lower, upper) bounds matching every path that starts with ``path``.
+
+    Paths end in '/', and '0' is the character right after '/', so this is
+    an index-friendly range scan rather than a LIKE 'prefix%'.
+    """
+    return path, path[:-1] + '0'
+
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
@@ -17,6 +31,10 @@ class Category(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Materialized path of primary keys from the root, e.g. '/3/17/42/'.
+    path = models.CharField(max_length=255, db_index=True, editable=False, default='')
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    
     class Meta:
         verbose_name_plural = "Categories"
         ordering = ['display_order', 'name']
@@ -26,6 +44,48 @@ class Category(models.Model):
     
     def get_absolute_url(self):
         return reverse('shop:category', args=[self.slug])
+    
+    def save(self, *args, **kwargs):
+        # One transaction, so post_save handlers deferred with on_commit see
+        # the final path, and a failed re-root leaves the tree as it was.
+        with transaction.atomic():
+            parent_path = '/'
+            if self.parent_id:
+                parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).get()
+                if self.pk and f'/{self.pk}/' in parent_path:
+                    raise ValueError("A category cannot be moved under itself or one of its descendants.")
+            super().save(*args, **kwargs)
+        
+            old_path = self.path
+            new_path = f'{parent_path}{self.pk}/'
+            if new_path == old_path:
+                return
+            new_depth = new_path.count('/') - 2
+            Category.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+            if old_path:
+                # Re-root the whole subtree in one statement.
+                lower, upper = path_range(old_path)
+                Category.objects.filter(path__gt=lower, path__lt=upper).update(
+                    path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                    depth=F('depth') + (new_depth - self.depth),
+                )
+            self.path, self.depth = new_path, new_depth
+    
+    def get_ancestor_ids(self):
+        return [int(pk) for pk in self.path.strip('/').split('/')[:-1] if pk]
+    
+    def get_ancestors(self):
+        """Breadcrumb trail from the root down to (excluding) this category."""
+        return Category.objects.filter(pk__in=self.get_ancestor_ids()).order_by('depth')
+    
+    def subtree_q(self, prefix=''):
+        """Q matching this category and its descendants, e.g. subtree_q('category__')."""
+        lower, upper = path_range(self.path)
+        return Q(**{f'{prefix}path__gte': lower, f'{prefix}path__lt': upper})
+    
+    def get_descendants(self, include_self=True):
+        descendants = Category.objects.filter(self.subtree_q())
+        return descendants if include_self else descendants.exclude(pk=self.pk)
 
 class Product(models.Model):
     name = models.CharField(max_length=200)
@@ -47,12 +107,56 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Denormalized card image, maintained by the ProductImage signals so
+    # listings can select_related() it instead of querying images per card.
+    primary_image = models.ForeignKey(
+        'ProductImage', on_delete=models.SET_NULL, null=True, blank=True, related_name='+', editable=False
+    )
+    
+    class Meta:
+        # Storefront queries only ever read active products, so the listing
+        # indexes are partial: smaller, and each one matches a sort in
+        # shop.pagination.SORT_ORDERINGS so LIMIT stops after one page.
+        # See the benchmark_storefront_queries command.
+        indexes = [
+            models.Index(fields=['-created_at', 'id'], name='shop_prod_active_newest', condition=Q(is_active=True)),
+            models.Index(fields=['price', 'id'], name='shop_prod_active_price', condition=Q(is_active=True)),
+            # A backwards scan of the one above would yield id DESC ties.
+            models.Index(fields=['-price', 'id'], name='shop_prod_active_price_desc', condition=Q(is_active=True)),
+            models.Index(fields=['name', 'id'], name='shop_prod_active_name', condition=Q(is_active=True)),
+            models.Index(
+                fields=['category', '-created_at', 'id'], name='shop_prod_active_cat_newest',
+                condition=Q(is_active=True),
+            ),
+            models.Index(
+                fields=['id'], name='shop_prod_active_featured', condition=Q(is_active=True, is_featured=True),
+            ),
+            models.Index(
+                fields=['brand', '-created_at', 'id'], name='shop_prod_active_brand_newest',
+                condition=Q(is_active=True),
+            ),
+            models.Index(fields=['updated_at'], name='shop_prod_active_updated', condition=Q(is_active=True)),
+        ]
+    
     def __str__(self):
         return self.name
     
     def get_absolute_url(self):
         return reverse('shop:product_detail', args=[self.slug])
     
+    @classmethod
+    def refresh_primary_image(cls, product_id):
+        """Point primary_image at the default image, else the oldest image."""
+        image_id = ProductImage.objects.filter(product_id=product_id).order_by(
+            '-is_default', 'created_at', 'pk'
+        ).values_list('pk', flat=True).first()
+        cls.objects.filter(pk=product_id).update(primary_image_id=image_id, updated_at=timezone.now())
+    
+    @classmethod
+    def touch(cls, product_id):
+        """Move updated_at forward without a full save, expiring cached cards."""
+        cls.objects.filter(pk=product_id).update(updated_at=timezone.now())
+    
     def get_discount_percentage(self):
         if self.compare_price and self.compare_price > self.price:
             return int(((self.compare_price - self.price) / self.compare_price) * 100)
@@ -65,4 +169,109 @@ class ProductImage(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
-        return f"Image for {self.product.name}"
\ No newline at end of file
+        return f"Image for {self.product.name}"
+
+class ProductAssociation(models.Model):
+    """
+    Item-to-item "frequently bought together" similarity mined from
+    delivered orders by shop.recommendations.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='associations')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    co_purchases = models.PositiveIntegerField(default=0)
+    score = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'related'], name='unique_product_association'),
+        ]
+        indexes = [
+            models.Index(fields=['product', '-score'], name='shop_assoc_product_score'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.score:.3f})"
+
+class ProductTrigram(models.Model):
+    """
+    One posting in shop.fuzzy's trigram index: ``trigram`` occurs in the
+    name, name_bn or brand of ``product``.
+    """
+    trigram = models.CharField(max_length=3)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    
+    class Meta:
+        constraints = [
+            # Doubles as the posting-list index: (trigram, product_id).
+            models.UniqueConstraint(fields=['trigram', 'product'], name='unique_product_trigram'),
+        ]
+    
+    def __str__(self):
+        return f"{self.trigram!r} -> {self.product_id}"
+
+class ProductCard(models.Model):
+    """
+    Narrow, denormalized copy of what a product card shows, one row per
+    active product, maintained by shop.cards. Listing pages read it in a
+    single query instead of loading wide Product rows and their relations.
+    """
+    id = models.PositiveIntegerField(primary_key=True)  # the Product's id
+    name = models.CharField(max_length=200)
+    name_bn = models.CharField(max_length=200, blank=True)
+    slug = models.SlugField(unique=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    compare_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    discount_percentage = models.PositiveSmallIntegerField(default=0)
+    image_url = models.CharField(max_length=255, blank=True)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    category_slug = models.SlugField()
+    # Copy of Category.path, so category.subtree_q('category_') needs no join.
+    category_path = models.CharField(max_length=255)
+    brand = models.CharField(max_length=100, blank=True, null=True)
+    in_stock = models.BooleanField(default=False)
+    is_featured = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', 'id'], name='shop_card_newest'),
+            models.Index(fields=['price', 'id'], name='shop_card_price'),
+            models.Index(fields=['-price', 'id'], name='shop_card_price_desc'),
+            models.Index(fields=['name', 'id'], name='shop_card_name'),
+            models.Index(fields=['category_path', '-created_at'], name='shop_card_path_newest'),
+            models.Index(fields=['brand', '-created_at', 'id'], name='shop_card_brand_newest'),
+            models.Index(fields=['id'], name='shop_card_featured', condition=Q(is_featured=True)),
+        ]
+    
+    def __str__(self):
+        return self.name
+    
+    def get_absolute_url(self):
+        return reverse('shop:product_detail', args=[self.slug])
+
+class VersionStamp(models.Model):
+    """A named version stamp shared by every worker; see shop.versions."""
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField()
+    
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+class VersionChange(models.Model):
+    """
+    The object one bump of a VersionStamp was for, so other workers can
+    patch their copy of an index instead of rebuilding it; see shop.versions.
+    """
+    name = models.CharField(max_length=50)
+    version = models.BigIntegerField()
+    object_id = models.BigIntegerField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'version'], name='unique_version_change'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name}@{self.version}: {self.object_id}"
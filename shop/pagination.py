@@ -0,0 +1,136 @@
+"""
+Keyset (cursor) pagination for storefront listings.
+
+``Paginator`` runs a COUNT(*) and an OFFSET query, so deep pages get slower
+the further a client walks. ``KeysetPaginator`` instead continues after the
+sort key of the last row it returned, which costs the same on page 400 as
+on page 1. Cursors are signed, so clients cannot forge arbitrary filter
+values, and they name the sort they were issued for.
+"""
+import hashlib
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# Every ordering ends in the primary key so the sort key is unique.
+SORT_ORDERINGS = {
+    'newest': ('-created_at', 'id'),
+    'price_low': ('price', 'id'),
+    'price_high': ('-price', 'id'),
+    'name': ('name', 'id'),
+}
+
+CURSOR_SALT = 'shop.pagination.cursor'
+COUNT_CACHE_TIMEOUT = 60 * 5
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator:
+    def __init__(self, queryset, sort, per_page):
+        if sort not in SORT_ORDERINGS:
+            raise ValueError(f'Unsupported sort for keyset pagination: {sort}')
+        self.queryset = queryset
+        self.sort = sort
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in SORT_ORDERINGS[sort]]
+        self.per_page = per_page
+        self._fields = [queryset.model._meta.get_field(name) for name, _ in self.ordering]
+
+    def _encode(self, obj, backwards):
+        values = [field.value_to_string(obj) for field in self._fields]
+        return signing.dumps([self.sort, values, backwards], salt=CURSOR_SALT, compress=True)
+
+    def _decode(self, cursor):
+        try:
+            sort, values, backwards = signing.loads(cursor, salt=CURSOR_SALT)
+            if sort != self.sort or len(values) != len(self._fields):
+                raise InvalidCursor('Cursor was issued for a different sort')
+            return [field.to_python(value) for field, value in zip(self._fields, values)], bool(backwards)
+        except (signing.BadSignature, TypeError, ValueError, ValidationError) as exc:
+            raise InvalidCursor(str(exc)) from exc
+
+    def _seek(self, values, backwards):
+        """WHERE clause selecting rows strictly after ``values`` in walk order."""
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.ordering, values):
+            lookup = 'lt' if descending != backwards else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def page(self, cursor=None):
+        values, backwards = self._decode(cursor) if cursor else (None, False)
+
+        ordering = [
+            f'{"-" if descending != backwards else ""}{name}' for name, descending in self.ordering
+        ]
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, backwards))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+        if not rows:
+            return CursorPage(rows)
+
+        next_cursor = self._encode(rows[-1], False) if has_more or backwards else None
+        previous_cursor = None
+        if (backwards and has_more) or (not backwards and values is not None):
+            previous_cursor = self._encode(rows[0], True)
+        return CursorPage(rows, next_cursor, previous_cursor)
+
+
+def approximate_count(queryset, timeout=COUNT_CACHE_TIMEOUT):
+    """
+    Row count for ``queryset``, cached per filter combination.
+
+    The cache key is derived from the unordered SQL, so every listing with
+    the same filters shares one count for ``timeout`` seconds.
+    """
+    queryset = queryset.order_by()
+    if queryset.query.is_empty():
+        return 0
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.md5(f'{sql}|{params!r}'.encode()).hexdigest()
+    key = f'shop:approx_count:{digest}'
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+def cursor_page(queryset, sort, per_page, cursor):
+    """Keyset page for ``cursor``, starting over if the cursor is stale or forged."""
+    paginator = KeysetPaginator(queryset, sort, per_page)
+    try:
+        return paginator.page(cursor)
+    except InvalidCursor:
+        return paginator.page()
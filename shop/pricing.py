@@ -0,0 +1,249 @@
+"""
+Promotion pricing: flash sales, combo offers and coupons.
+
+``price_index`` keeps, per worker, every FlashSale, ComboOffer and Coupon
+that has not ended, keyed by product (coupons by code). Pricing a listing
+card or a whole cart is then dictionary lookups, not queries.
+
+Promotions start and end without any row being saved. So the index also
+remembers the next start or end time, and when the clock passes it,
+recomputes which promotions are live from what it already holds. Admin
+edits bump the ``prices`` version stamp, and every worker reloads within
+``VERSION_CHECK_INTERVAL``. Checkout re-reads the stamp before charging.
+Card fragments are keyed on ``cache_stamp()``, which covers both.
+
+Rules:
+
+* a flash sale takes its percentage off the product's price. When
+  several overlap, the largest wins;
+* a combo applies once per complete set of its products in the cart. The
+  units in a set get the combo's percentage, or the flash sale's if that
+  is larger. Combos are assigned largest percentage first and no unit
+  counts towards two sets;
+* a coupon applies to the discounted total, if it is live, has uses
+  left, and the total reaches its minimum. Percentage coupons are capped
+  at ``max_discount``, and fixed ones at the total.
+"""
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.utils import timezone
+
+from shop import versions
+
+VERSION_KEY = 'prices'
+CENT = Decimal('0.01')
+HUNDRED = Decimal('100')
+
+
+def money(value):
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def discounted(price, percentage):
+    return money(price * (HUNDRED - percentage) / HUNDRED) if percentage else price
+
+
+class Sale:
+    """A listing's live flash-sale price."""
+    __slots__ = ('price', 'percentage')
+
+    def __init__(self, price, percentage):
+        self.price = price
+        self.percentage = percentage
+
+
+class PricedLine:
+    __slots__ = ('product_id', 'quantity', 'base_price', 'unit_price', 'total', 'discount')
+
+    def __init__(self, product_id, quantity, base_price, total):
+        self.product_id = product_id
+        self.quantity = quantity
+        self.base_price = base_price
+        self.total = total
+        self.discount = base_price * quantity - total
+        # Per-unit price actually charged (an average when a combo covers only some units).
+        self.unit_price = money(total / quantity) if quantity else base_price
+
+
+class PricedCart:
+    def __init__(self, lines, combos, coupon, coupon_discount, coupon_error):
+        self.lines = lines  # product id -> PricedLine
+        self.combos = combos  # [(combo name, number of sets)]
+        self.subtotal = sum((line.base_price * line.quantity for line in lines.values()), Decimal('0'))
+        self.discounted_total = sum((line.total for line in lines.values()), Decimal('0'))
+        self.promotion_discount = self.subtotal - self.discounted_total
+        self.coupon = coupon  # the applied coupon's dict, or None
+        self.coupon_discount = coupon_discount
+        self.coupon_error = coupon_error
+        self.total = self.discounted_total - coupon_discount
+
+
+class PriceIndex(versions.VersionedIndex):
+    version_key = VERSION_KEY
+
+    def __init__(self):
+        super().__init__()
+        self._flash_sales = []  # (start, end, percentage, product ids)
+        self._combos = []  # (start, end, percentage, name, {product id: quantity})
+        self._coupons = {}  # CODE -> dict
+        self._window = None
+        self._next_boundary = None
+        self.flash = {}
+        self.combos = []
+        self.combos_by_product = {}
+
+    def _load(self):
+        from admin_dashboard.models import ComboOffer, ComboProduct, Coupon, FlashSale
+
+        now = timezone.now()
+        sale_products = defaultdict(set)
+        for sale_id, product_id in FlashSale.products.through.objects.filter(
+            flashsale__is_active=True, flashsale__end_time__gt=now
+        ).values_list('flashsale_id', 'product_id'):
+            sale_products[sale_id].add(product_id)
+        self._flash_sales = [
+            (start, end, percentage, frozenset(sale_products[pk]))
+            for pk, start, end, percentage in FlashSale.objects.filter(is_active=True, end_time__gt=now).values_list(
+                'pk', 'start_time', 'end_time', 'discount_percentage'
+            )
+        ]
+
+        requirements = defaultdict(dict)
+        for combo_id, product_id, quantity in ComboProduct.objects.filter(
+            combo__is_active=True, combo__end_date__gt=now
+        ).values_list('combo_id', 'product_id', 'quantity'):
+            requirements[combo_id][product_id] = requirements[combo_id].get(product_id, 0) + max(quantity, 1)
+        self._combos = [
+            (start, end, percentage, name, requirements[pk])
+            for pk, name, start, end, percentage in ComboOffer.objects.filter(
+                is_active=True, end_date__gt=now
+            ).values_list('pk', 'name', 'start_date', 'end_date', 'discount_percentage')
+            if requirements[pk]
+        ]
+
+        self._coupons = {
+            coupon['code'].upper(): coupon
+            for coupon in Coupon.objects.filter(is_active=True, end_date__gt=now).values(
+                'pk', 'code', 'discount_type', 'discount_value', 'min_order_amount', 'max_discount',
+                'start_date', 'end_date', 'usage_limit', 'used_count',
+            )
+        }
+        self._activate(now)
+
+    def _activate(self, now):
+        """Recompute the live promotions from the loaded ones, as of ``now``."""
+        flash = {}
+        for start, end, percentage, product_ids in self._flash_sales:
+            if start <= now < end:
+                for product_id in product_ids:
+                    if percentage > flash.get(product_id, 0):
+                        flash[product_id] = percentage
+        combos = sorted(
+            ((percentage, name, items) for start, end, percentage, name, items in self._combos if start <= now < end),
+            key=lambda combo: -combo[0],
+        )
+        combos_by_product = defaultdict(list)
+        for combo in combos:
+            for product_id in combo[2]:
+                combos_by_product[product_id].append(combo)
+
+        times = [time for promotion in self._flash_sales + self._combos for time in promotion[:2]]
+        times += [time for coupon in self._coupons.values() for time in (coupon['start_date'], coupon['end_date'])]
+        past = [time for time in times if time <= now]
+        self._window = max(past).timestamp() if past else 0
+        self._next_boundary = min((time for time in times if time > now), default=None)
+        self.flash, self.combos, self.combos_by_product = flash, combos, dict(combos_by_product)
+
+    def _ensure_current(self, max_age=None):
+        self._ensure_fresh(max_age)
+        if self._next_boundary is not None and timezone.now() >= self._next_boundary:
+            with self._lock:
+                now = timezone.now()
+                if self._next_boundary is not None and now >= self._next_boundary:
+                    self._activate(now)
+
+    def cache_stamp(self):
+        """Changes whenever any price may have: an admin edit or a promotion starting or ending."""
+        self._ensure_current()
+        return f'{self._version}.{int(self._window)}'
+
+    def sale(self, product_id, price):
+        """The live flash sale on ``product_id`` as a Sale, or None."""
+        self._ensure_current()
+        percentage = self.flash.get(product_id)
+        if not percentage:
+            return None
+        return Sale(discounted(price, percentage), int(percentage))
+
+    def coupon(self, code):
+        """The live coupon called ``code`` (any case), ignoring minimum order amount, or None."""
+        self._ensure_current()
+        coupon = self._coupons.get((code or '').strip().upper())
+        if coupon is None or not coupon['start_date'] <= timezone.now() < coupon['end_date']:
+            return None
+        if coupon['used_count'] >= coupon['usage_limit']:
+            return None
+        return coupon
+
+    def price_lines(self, lines, coupon_code=None, max_age=None):
+        """
+        Price ``{product_id: (quantity, unit price)}`` with every live
+        promotion, in one pass and without queries. Returns a PricedCart.
+        To charge, pass ``max_age=0``: the ``prices`` stamp is then read
+        from the database first, so no admin edit another worker committed
+        is missed.
+        """
+        self._ensure_current(max_age)
+        flash = self.flash
+        remaining = {product_id: quantity for product_id, (quantity, _) in lines.items()}
+
+        combo_units = defaultdict(list)  # product id -> [(units, percentage)]
+        applied = []
+        candidates = {id(combo): combo for product_id in lines for combo in self.combos_by_product.get(product_id, ())}
+        for percentage, name, items in sorted(candidates.values(), key=lambda combo: -combo[0]):
+            sets = min(remaining.get(product_id, 0) // needed for product_id, needed in items.items())
+            if sets <= 0:
+                continue
+            for product_id, needed in items.items():
+                remaining[product_id] -= sets * needed
+                combo_units[product_id].append((sets * needed, percentage))
+            applied.append((name, sets))
+
+        priced = {}
+        for product_id, (quantity, price) in lines.items():
+            flash_percentage = flash.get(product_id, 0)
+            total = remaining[product_id] * discounted(price, flash_percentage)
+            for units, percentage in combo_units.get(product_id, ()):
+                total += units * discounted(price, max(percentage, flash_percentage))
+            priced[product_id] = PricedLine(product_id, quantity, price, total)
+
+        discounted_total = sum((line.total for line in priced.values()), Decimal('0'))
+        coupon, coupon_discount, coupon_error = None, Decimal('0'), None
+        if coupon_code:
+            coupon = self.coupon(coupon_code)
+            if coupon is None:
+                coupon_error = 'This coupon is not valid.'
+            elif discounted_total < coupon['min_order_amount']:
+                coupon_error = f"This coupon needs an order of at least {coupon['min_order_amount']}."
+                coupon = None
+            else:
+                coupon_discount = coupon_value(coupon, discounted_total)
+        return PricedCart(priced, applied, coupon, coupon_discount, coupon_error)
+
+
+def coupon_value(coupon, amount):
+    if coupon['discount_type'] == 'percentage':
+        value = money(amount * coupon['discount_value'] / HUNDRED)
+        if coupon['max_discount'] is not None:
+            value = min(value, coupon['max_discount'])
+    else:
+        value = coupon['discount_value']
+    return min(value, amount)
+
+
+price_index = PriceIndex()
+
+
+def invalidate():
+    price_index.invalidate()
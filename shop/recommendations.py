@@ -0,0 +1,156 @@
+"""
+"Frequently bought together" recommendations.
+
+Co-occurrence of products in delivered orders is turned into a sparse
+item-to-item cosine similarity::
+
+    score(i, j) = orders containing both / sqrt(orders with i * orders with j)
+
+and stored in ``ProductAssociation``, keeping the top ``NEIGHBOURS`` rows
+per product. ``rebuild()`` recomputes everything offline (see the
+``rebuild_recommendations`` command). ``record_order()`` folds a newly
+delivered order in incrementally: it recounts the pairs in that order from
+OrderItem and trims each of its products back to its top ``NEIGHBOURS``.
+Scores of pairs that order did not touch drift slightly until the next
+rebuild.
+"""
+import math
+from collections import Counter
+from itertools import combinations, groupby, islice
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from shop.models import Product, ProductAssociation
+
+NEIGHBOURS = 20
+
+# Baskets bigger than this are mostly bulk/wholesale orders; they add noise
+# and quadratic work, so only their first items are counted.
+MAX_BASKET_SIZE = 50
+
+DELIVERED = 'delivered'
+
+
+def _baskets(batch_size):
+    """Yield the distinct product ids of each delivered order, one order at a time."""
+    from cart.models import OrderItem
+
+    rows = (
+        OrderItem.objects.filter(order__status=DELIVERED)
+        .order_by('order_id')
+        .values_list('order_id', 'product_id')
+        .iterator(chunk_size=batch_size)
+    )
+    for _, items in groupby(rows, key=lambda row: row[0]):
+        yield sorted({product_id for _, product_id in items})[:MAX_BASKET_SIZE]
+
+
+def _score(pair_count, count_a, count_b):
+    return pair_count / math.sqrt(count_a * count_b)
+
+
+def rebuild(batch_size=2000, neighbours=NEIGHBOURS):
+    """Recompute every association from scratch; returns the number of rows written."""
+    item_counts = Counter()
+    pair_counts = Counter()
+    for basket in _baskets(batch_size):
+        item_counts.update(basket)
+        # Counter.update over a generator keeps the pair loop in C.
+        pair_counts.update(combinations(basket, 2))
+
+    neighbours_of = {}
+    for (a, b), count in pair_counts.items():
+        score = _score(count, item_counts[a], item_counts[b])
+        neighbours_of.setdefault(a, []).append((score, b, count))
+        neighbours_of.setdefault(b, []).append((score, a, count))
+
+    def rows():
+        for product_id, candidates in neighbours_of.items():
+            candidates.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+            for score, related_id, count in candidates[:neighbours]:
+                yield ProductAssociation(
+                    product_id=product_id, related_id=related_id, co_purchases=count, score=score
+                )
+
+    written = 0
+    with transaction.atomic():
+        ProductAssociation.objects.all().delete()
+        iterator = rows()
+        while batch := list(islice(iterator, batch_size)):
+            ProductAssociation.objects.bulk_create(batch)
+            written += len(batch)
+    return written
+
+
+def record_order(order):
+    """Fold one newly delivered order into the association table."""
+    from cart.models import OrderItem
+
+    basket = sorted(set(order.items.values_list('product_id', flat=True)))[:MAX_BASKET_SIZE]
+    if len(basket) < 2:
+        return
+
+    # Orders containing both a and b, for a <= b, in one self-join; the
+    # (a, a) entries are the number of orders containing a.
+    counts = {
+        (a, b): orders
+        for a, b, orders in OrderItem.objects.filter(
+            order__status=DELIVERED, product_id__in=basket,
+            order__items__product_id__in=basket, order__items__product_id__gte=F('product_id'),
+        )
+        .values('product_id', 'order__items__product_id')
+        .annotate(orders=Count('order_id', distinct=True))
+        .values_list('product_id', 'order__items__product_id', 'orders')
+        .order_by()
+    }
+
+    rows = []
+    for a, b in combinations(basket, 2):
+        count = counts.get((a, b))
+        if not count:
+            continue  # the order is no longer delivered
+        score = _score(count, counts[a, a], counts[b, b])
+        rows.append(ProductAssociation(product_id=a, related_id=b, co_purchases=count, score=score))
+        rows.append(ProductAssociation(product_id=b, related_id=a, co_purchases=count, score=score))
+
+    with transaction.atomic():
+        ProductAssociation.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['product', 'related'],
+            update_fields=['co_purchases', 'score', 'updated_at'],
+        )
+        _trim(basket, NEIGHBOURS)
+
+
+def _trim(product_ids, neighbours):
+    """Drop the rows of ``product_ids`` beyond each one's top ``neighbours``, ranked as in rebuild()."""
+    rows = (
+        ProductAssociation.objects.filter(product_id__in=product_ids)
+        .order_by('product_id', '-score', 'related_id')
+        .values_list('product_id', 'pk')
+    )
+    surplus = [
+        pk for _, group in groupby(rows, key=lambda row: row[0])
+        for _, pk in islice(group, neighbours, None)
+    ]
+    if surplus:
+        ProductAssociation.objects.filter(pk__in=surplus).delete()
+
+
+def related_products(product, limit=4):
+    """Top ``limit`` neighbours of ``product``, falling back to its category."""
+    associations = (
+        ProductAssociation.objects.filter(product=product, related__is_active=True)
+        .select_related('related__primary_image')
+        .order_by('-score')[:limit]
+    )
+    related = [association.related for association in associations]
+    if len(related) < limit:
+        related += list(
+            Product.objects.filter(category_id=product.category_id, is_active=True)
+            .exclude(pk__in=[product.pk, *[item.pk for item in related]])
+            .select_related('primary_image')[:limit - len(related)]
+        )
+    return related
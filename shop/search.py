@@ -0,0 +1,326 @@
+"""
+Full-text product search.
+
+On SQLite the index is an FTS5 virtual table (``shop_product_fts``) keyed by
+product id and ranked with ``bm25()``. Other database backends use an
+in-process inverted index that applies the same BM25 scoring, so views only
+ever deal with ``search_ids()``.
+
+Live search asks ``search_ids()`` for a page of ids and orders them with
+``restrict_to_ids()``. Listings ask for every hit (``limit=None``) through
+``search_cache.result_cache``, filter by them, and page by relevance with
+``RankedResults``, which fetches one page of rows at a time.
+
+Documents are analyzed by shop.analysis before they reach either backend,
+so both index the same normalized, tokenized (and transliterated) terms.
+"""
+import math
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Case, IntegerField, When
+
+from shop.analysis import index_terms, tokenize
+
+# 'category' holds the English and Bengali names of the product's category.
+SEARCH_FIELDS = (
+    'name', 'name_bn', 'short_description', 'short_description_bn', 'sku', 'description', 'description_bn',
+    'category',
+)
+
+# Relative weight of a hit in each field, in SEARCH_FIELDS order.
+FIELD_WEIGHTS = (10.0, 10.0, 4.0, 4.0, 8.0, 1.0, 1.0, 3.0)
+
+# Product columns (for .only()) that the search fields are built from.
+SOURCE_FIELDS = (
+    'name', 'name_bn', 'short_description', 'short_description_bn', 'sku', 'description', 'description_bn',
+    'category__name', 'category__name_bn',
+)
+
+# Default cap for search_ids(); live search asks for fewer, and listings
+# pass None for every hit.
+MAX_RESULTS = 500
+
+FTS_TABLE = 'shop_product_fts'
+
+# Below this many full-text hits, typo-tolerant matches (shop.fuzzy) are
+# appended so misspelled or transliterated names still find something.
+FUZZY_MIN_HITS = 3
+
+
+def _field_text(product, field):
+    if field == 'category':
+        return f'{product.category.name} {product.category.name_bn}'
+    return getattr(product, field) or ''
+
+
+def _product_rows(products):
+    """Split products into (pk, analyzed field values) rows to index and pks to drop."""
+    rows, removed = [], []
+    for product in products:
+        if product.is_active:
+            values = [' '.join(index_terms(_field_text(product, field))) for field in SEARCH_FIELDS]
+            rows.append((product.pk, *values))
+        else:
+            removed.append(product.pk)
+    return rows, removed
+
+
+def indexable_products():
+    """Active products with only the columns the search fields are built from."""
+    from shop.models import Product
+
+    return Product.objects.filter(is_active=True).select_related('category').only('pk', 'is_active', *SOURCE_FIELDS)
+
+
+class SQLiteFTSBackend:
+    """Search index stored in an FTS5 virtual table next to ``shop_product``."""
+
+    # Content arrives already analyzed, so the tokenizer only has to split
+    # on spaces; counting marks (M*) as token characters keeps Bengali vowel
+    # signs inside their words.
+    create_sql = (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"{', '.join(SEARCH_FIELDS)}, tokenize = \"unicode61 remove_diacritics 0 categories 'L* N* Co M*'\")"
+    )
+
+    def create(self):
+        with connection.cursor() as cursor:
+            cursor.execute(self.create_sql)
+
+    def index(self, products):
+        rows, removed = _product_rows(products)
+        placeholders = ', '.join(['%s'] * (len(SEARCH_FIELDS) + 1))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [(pk,) for pk in removed] + [(row[0],) for row in rows],
+            )
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(SEARCH_FIELDS)}) VALUES ({placeholders})",
+                rows,
+            )
+
+    def remove(self, pks):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in pks])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def search(self, terms, limit):
+        # Quote every term so user input can never inject FTS5 query syntax;
+        # the last one is a prefix match because the header box searches as
+        # the customer types.
+        match = ' '.join(f'"{term}"' for term in terms[:-1])
+        match = f'{match} "{terms[-1]}"*'.strip()
+        weights = ', '.join(str(weight) for weight in FIELD_WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s',
+                [match, -1 if limit is None else limit],  # -1: no limit
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class InMemoryBackend:
+    """
+    Pure-Python inverted index for backends without FTS5.
+
+    Field weights are folded into the term frequency (BM25F-style), so the
+    ranking matches the SQLite backend closely enough for a storefront.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._postings = defaultdict(dict)  # term -> {pk: weighted tf}
+        self._doc_terms = {}                # pk -> terms, for removal
+        self._doc_lengths = {}              # pk -> weighted length
+        self._sorted_terms = None
+
+    def create(self):
+        pass
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._loaded = True
+                    self.index(indexable_products())
+
+    def index(self, products):
+        rows, removed = _product_rows(products)
+        with self._lock:
+            self._remove_locked(removed + [row[0] for row in rows])
+            for pk, *values in rows:
+                frequencies = defaultdict(float)
+                for weight, value in zip(FIELD_WEIGHTS, values):
+                    for term in value.split():
+                        frequencies[term] += weight
+                for term, frequency in frequencies.items():
+                    self._postings[term][pk] = frequency
+                self._doc_terms[pk] = tuple(frequencies)
+                self._doc_lengths[pk] = sum(frequencies.values())
+            self._sorted_terms = None
+
+    def remove(self, pks):
+        with self._lock:
+            self._remove_locked(pks)
+
+    def _remove_locked(self, pks):
+        for pk in pks:
+            for term in self._doc_terms.pop(pk, ()):
+                postings = self._postings[term]
+                postings.pop(pk, None)
+                if not postings:
+                    del self._postings[term]
+            self._doc_lengths.pop(pk, None)
+        self._sorted_terms = None
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._doc_lengths.clear()
+            self._sorted_terms = None
+            self._loaded = True
+
+    def _expand_prefix(self, prefix):
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings)
+        terms = self._sorted_terms
+        position = bisect_left(terms, prefix)
+        expanded = []
+        while position < len(terms) and terms[position].startswith(prefix):
+            expanded.append(terms[position])
+            position += 1
+        return expanded
+
+    def search(self, terms, limit):
+        self._ensure_loaded()
+        with self._lock:
+            doc_count = len(self._doc_lengths)
+            if not doc_count:
+                return []
+            average_length = sum(self._doc_lengths.values()) / doc_count
+
+            # Every query term must match (implicit AND, as in FTS5); the
+            # last term also matches any indexed term it is a prefix of.
+            groups = [[term] for term in terms[:-1]] + [self._expand_prefix(terms[-1])]
+            scores = None
+            for group in groups:
+                group_scores = defaultdict(float)
+                for term in group:
+                    postings = self._postings.get(term, {})
+                    idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for pk, frequency in postings.items():
+                        norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[pk] / average_length)
+                        group_scores[pk] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+                if scores is None:
+                    scores = group_scores
+                else:
+                    scores = {pk: score + group_scores[pk] for pk, score in scores.items() if pk in group_scores}
+                if not scores:
+                    return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [pk for pk, _ in ranked[:limit]]
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = SQLiteFTSBackend() if connection.vendor == 'sqlite' else InMemoryBackend()
+    return _backend
+
+
+def index_products(products):
+    get_backend().index(products)
+
+
+def remove_products(pks):
+    get_backend().remove(pks)
+
+
+def rebuild_index(batch_size=500):
+    """Drop and re-create every index entry; returns the number of products indexed."""
+    backend = get_backend()
+    backend.create()
+    backend.clear()
+    products = indexable_products().order_by('pk')
+    count = 0
+    batch = []
+    for product in products.iterator(chunk_size=batch_size):
+        batch.append(product)
+        if len(batch) >= batch_size:
+            backend.index(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        backend.index(batch)
+        count += len(batch)
+    return count
+
+
+def search_ids(query, limit=MAX_RESULTS):
+    """Return ids of active products matching ``query``, best match first (all of them for ``limit=None``)."""
+    terms = tokenize(query)
+    if not terms:
+        return []
+    ids = get_backend().search(terms, limit)
+    if len(ids) < (FUZZY_MIN_HITS if limit is None else min(limit, FUZZY_MIN_HITS)):
+        from shop import fuzzy
+
+        extra = [pk for pk in fuzzy.search_ids(query, limit) if pk not in ids]
+        ids += extra if limit is None else extra[:limit - len(ids)]
+    return ids
+
+
+def restrict_to_ids(queryset, ids):
+    """Restrict ``queryset`` to a short list of ``ids`` (from ``search_ids()``), keeping their order."""
+    if not ids:
+        return queryset.none()
+    ranking = Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)], output_field=IntegerField())
+    return queryset.filter(pk__in=ids).annotate(search_rank=ranking).order_by('search_rank')
+
+
+class RankedResults:
+    """
+    The rows of ``queryset`` in the order of ``ids`` (best match first),
+    for Paginator. One query finds which ids pass the queryset's filters;
+    each slice then fetches only its own rows.
+    """
+
+    def __init__(self, queryset, ids):
+        self.queryset = queryset
+        self._ids = ids
+        self._kept = None
+
+    @property
+    def ids(self):
+        if self._kept is None:
+            present = set(self.queryset.filter(pk__in=self._ids).values_list('pk', flat=True)) if self._ids else set()
+            self._kept = [pk for pk in self._ids if pk in present]
+        return self._kept
+
+    def count(self):
+        return len(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(restrict_to_ids(self.queryset, self.ids[index]))
+        return restrict_to_ids(self.queryset, [self.ids[index]]).get()
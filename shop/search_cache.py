@@ -0,0 +1,106 @@
+"""
+Cache of search result ids, keyed on the normalized query.
+
+"T-Shirt ", "t-shirt" and "T-SHIRT" share one entry. So do "blue  shirt"
+and "blue shirt". Keys also carry the namespace (which computation produced the ids),
+the active language, any parameters that change the result, and the
+``catalog`` version stamp. Saving or deleting a product or category bumps
+the stamp, so every cached result goes stale at once without having to be found and deleted.
+The stamp comes from shop.versions, which re-reads it from the database at
+most once per ``VERSION_CHECK_INTERVAL``. A lookup therefore costs no round
+trip, and other workers' bumps take effect within that interval.
+
+There are two tiers:
+
+* a per-process LRU bounded by entry count and by bytes, which answers
+  repeated popular queries without touching the cache backend;
+* the configured Django cache, filled on a local miss. It spares other
+  workers the computation only when it is a shared backend (Memcached,
+  Redis). The default LocMemCache is per process, like the LRU.
+"""
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.utils.translation import get_language
+
+from shop import analysis, versions
+
+VERSION_KEY = 'catalog'
+KEY_PREFIX = 'shop:search:'
+TIMEOUT = 60 * 15
+MAX_ENTRIES = 2000
+MAX_BYTES = 4 * 1024 * 1024
+
+
+def normalize_query(query):
+    """Casefolded, trimmed, whitespace-collapsed form of ``query``."""
+    return ' '.join(analysis.normalize(query).split())
+
+
+def _entry_size(key, ids):
+    return sys.getsizeof(key) + sys.getsizeof(ids) + sum(sys.getsizeof(pk) for pk in ids)
+
+
+class SearchResultCache:
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, timeout=TIMEOUT):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (ids, size), least recently used first
+        self._bytes = 0
+
+    def make_key(self, namespace, query, params):
+        parts = [namespace, normalize_query(query), get_language() or '']
+        parts += [f'{name}={params[name]}' for name in sorted(params)]
+        digest = hashlib.md5('\x1f'.join(parts).encode()).hexdigest()
+        return f'{KEY_PREFIX}{versions.get_version(VERSION_KEY)}:{digest}'
+
+    def get_or_compute(self, namespace, query, compute, **params):
+        """Ids for ``query``, calling ``compute()`` only when no tier has them."""
+        key = self.make_key(namespace, query, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return list(entry[0])
+
+        ids = cache.get(key)
+        if ids is None:
+            ids = tuple(compute())
+            cache.set(key, ids, self.timeout)
+        self._remember(key, ids)
+        return list(ids)
+
+    def _remember(self, key, ids):
+        size = _entry_size(key, ids)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (ids, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes}
+
+
+result_cache = SearchResultCache()
+
+
+def invalidate():
+    versions.bump_version(VERSION_KEY)
@@ -1,19 +1,56 @@
 from rest_framework import serializers
+from core import images as derivatives
 from .models import Product, Category
 
-class CategorySerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """Pass ``fields=[...]`` to serialize only that subset of Meta.fields."""
+    
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+class SrcsetField(serializers.Field):
+    """Read-only image field rendered as its URL plus responsive srcsets (see core.images)."""
+    
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+    
+    def to_representation(self, value):
+        if not value:
+            return None
+        known = derivatives.manifest(value)
+        return {
+            'url': value.url,
+            'srcset': derivatives.srcset(value, known=known),
+            'webp_srcset': derivatives.srcset(value, webp=True, known=known),
+        }
+
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    image_srcset = SrcsetField(source='image')
+    
     class Meta:
         model = Category
-        fields = ['id', 'name', 'name_bn', 'slug', 'image']
+        fields = ['id', 'name', 'name_bn', 'slug', 'image', 'image_srcset']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
+    primary_image = serializers.SerializerMethodField()
+    primary_image_srcset = SrcsetField(source='primary_image.image')
     images = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
         fields = ['id', 'name', 'name_bn', 'slug', 'category', 'price', 
-                 'compare_price', 'short_description', 'short_description_bn', 'images']
+                 'compare_price', 'short_description', 'short_description_bn', 'primary_image', 'primary_image_srcset', 'images']
+    
+    def get_primary_image(self, obj):
+        # Expects select_related('primary_image') on listing querysets.
+        return obj.primary_image.image.url if obj.primary_image_id else None
     
     def get_images(self, obj):
-        return [img.image.url for img in obj.images.all()]
\ No newline at end of file
+        # Primary image first; the rest come from prefetch_related('images').
+        images = sorted(obj.images.all(), key=lambda img: img.pk != obj.primary_image_id)
+        return [img.image.url for img in images]
\ No newline at end of file
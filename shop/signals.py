@@ -0,0 +1,111 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from admin_dashboard.models import ComboOffer, ComboProduct, Coupon, FlashSale, Inventory
+from cart.models import Order
+from shop import cards, category_tree, fuzzy, pricing, recommendations, search, search_cache
+from shop.autocomplete import autocomplete_index
+from shop.facets import facet_index
+from shop.models import Category, Product, ProductImage
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_products([instance])
+    fuzzy.index_products([instance])
+    cards.refresh([instance.pk])
+    transaction.on_commit(lambda: facet_index.product_changed(instance))
+    transaction.on_commit(lambda: autocomplete_index.product_changed(instance))
+    transaction.on_commit(category_tree.invalidate)
+    transaction.on_commit(search_cache.invalidate)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+    cards.remove([instance.pk])
+    transaction.on_commit(lambda: facet_index.product_deleted(instance.pk))
+    transaction.on_commit(lambda: autocomplete_index.product_deleted(instance.pk))
+    transaction.on_commit(category_tree.invalidate)
+    transaction.on_commit(search_cache.invalidate)
+
+
+@receiver(post_save, sender=Inventory)
+def inventory_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    Product.touch(instance.product_id)
+    cards.refresh([instance.product_id])
+    transaction.on_commit(lambda: facet_index.stock_changed(instance.product_id, instance.stock_quantity))
+
+
+@receiver(post_delete, sender=Inventory)
+def inventory_deleted(sender, instance, **kwargs):
+    Product.touch(instance.product_id)
+    cards.refresh([instance.product_id])
+    transaction.on_commit(lambda: facet_index.stock_changed(instance.product_id, 0))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(facet_index.invalidate)
+    transaction.on_commit(category_tree.invalidate)
+    transaction.on_commit(search_cache.invalidate)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Category.save() rewrites the subtree's paths after post_save; refresh
+    # the cards once it has.
+    transaction.on_commit(lambda: cards.refresh_category(instance))
+    # Products are searchable by their category's names.
+    search.index_products(search.indexable_products().filter(category=instance))
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def product_image_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    Product.refresh_primary_image(instance.product_id)
+    cards.refresh([instance.product_id])
+
+
+@receiver(post_save, sender=FlashSale)
+@receiver(post_delete, sender=FlashSale)
+@receiver(m2m_changed, sender=FlashSale.products.through)
+@receiver(post_save, sender=ComboOffer)
+@receiver(post_delete, sender=ComboOffer)
+@receiver(post_save, sender=ComboProduct)
+@receiver(post_delete, sender=ComboProduct)
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def promotion_changed(sender, raw=False, action=None, **kwargs):
+    if raw or (action is not None and not action.startswith('post_')):
+        return
+    transaction.on_commit(pricing.invalidate)
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_status(sender, instance, raw=False, **kwargs):
+    if raw or not instance.pk:
+        instance._previous_status = None
+        return
+    instance._previous_status = Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=Order)
+def order_delivered(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_status', None)
+    if instance.status == recommendations.DELIVERED and previous != recommendations.DELIVERED:
+        transaction.on_commit(lambda: recommendations.record_order(instance))
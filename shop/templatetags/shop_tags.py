@@ -0,0 +1,17 @@
+from django import template
+
+from shop.fragments import render_card, render_cards
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_card(product):
+    """{% product_card product %} -- one cached product card."""
+    return render_card(product)
+
+
+@register.simple_tag
+def product_cards(products):
+    """{% product_cards products as cards %} -- cached cards for a whole listing block."""
+    return render_cards(products)
@@ -1,3 +1,580 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.http import QueryDict
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from admin_dashboard.models import ComboOffer, ComboProduct, Coupon, FlashSale, Inventory
+from cart.models import Order, OrderItem
+from django.core import signing
+
+from shop import category_tree, fuzzy, pricing, recommendations, search, versions
+from shop.analysis import tokenize
+from shop.autocomplete import VERSION_KEY as AUTOCOMPLETE_KEY, AutocompleteIndex
+from shop.facets import FacetIndex, apply_selection, parse_selection
+from shop.models import Category, Product, ProductAssociation, ProductCard
+from shop.pagination import CURSOR_SALT, InvalidCursor, KeysetPaginator, cursor_page
+from shop.search_cache import result_cache
+
+
+def make_category(slug, parent=None):
+    return Category.objects.create(name=slug.title(), slug=slug, parent=parent)
+
+
+def make_product(category, sku='SKU-1', **fields):
+    fields.setdefault('price', Decimal('10.00'))
+    fields.setdefault('description', '')
+    return Product.objects.create(name=fields.pop('name', sku), slug=sku.lower(), sku=sku, category=category, **fields)
+
+
+class CategoryMoveCardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def listed_under(self, category):
+        category.refresh_from_db()
+        return list(ProductCard.objects.filter(category.subtree_q('category_')).values_list('pk', flat=True))
+
+    def test_moving_a_category_moves_its_descendants_cards(self):
+        a = make_category('a')
+        b = make_category('b', a)
+        c = make_category('c', b)
+        x = make_category('x')
+        product = make_product(c)
+
+        b.parent = x
+        with self.captureOnCommitCallbacks(execute=True):
+            b.save()
+
+        c.refresh_from_db()
+        self.assertEqual(ProductCard.objects.get(pk=product.pk).category_path, c.path)
+        self.assertEqual(self.listed_under(x), [product.pk])
+        self.assertEqual(self.listed_under(a), [])
+
+
+class CategoryPathTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.a = make_category('a')
+            self.b = make_category('b', self.a)
+            self.c = make_category('c', self.b)
+            self.d = make_category('d', self.c)
+            self.x = make_category('x')
+
+    def move(self, category, parent):
+        category.parent = parent
+        with self.captureOnCommitCallbacks(execute=True):
+            category.save()
+        for node in (self.a, self.b, self.c, self.d, self.x):
+            node.refresh_from_db()
+
+    def subtree(self, category):
+        return set(Category.objects.filter(category.subtree_q()).values_list('slug', flat=True))
+
+    def test_new_categories_get_their_path_and_depth(self):
+        self.assertEqual(self.a.path, f'/{self.a.pk}/')
+        self.assertEqual(self.d.path, f'/{self.a.pk}/{self.b.pk}/{self.c.pk}/{self.d.pk}/')
+        self.assertEqual([node.depth for node in (self.a, self.b, self.c, self.d)], [0, 1, 2, 3])
+        self.assertEqual(self.d.get_ancestor_ids(), [self.a.pk, self.b.pk, self.c.pk])
+
+    def test_moving_a_category_re_roots_its_subtree(self):
+        self.move(self.b, self.x)
+        self.assertEqual(self.c.path, f'/{self.x.pk}/{self.b.pk}/{self.c.pk}/')
+        self.assertEqual(self.d.path, f'/{self.x.pk}/{self.b.pk}/{self.c.pk}/{self.d.pk}/')
+        self.assertEqual([node.depth for node in (self.b, self.c, self.d)], [1, 2, 3])
+        self.assertEqual(self.subtree(self.x), {'x', 'b', 'c', 'd'})
+        self.assertEqual(self.subtree(self.a), {'a'})
+
+    def test_moving_to_the_top_level_and_back(self):
+        self.move(self.c, None)
+        self.assertEqual((self.c.path, self.c.depth), (f'/{self.c.pk}/', 0))
+        self.assertEqual((self.d.path, self.d.depth), (f'/{self.c.pk}/{self.d.pk}/', 1))
+        self.assertEqual(self.subtree(self.a), {'a', 'b'})
+        self.move(self.c, self.a)
+        self.assertEqual([node.depth for node in (self.c, self.d)], [1, 2])
+        self.assertEqual(self.subtree(self.a), {'a', 'b', 'c', 'd'})
+
+    def test_category_cannot_move_under_its_own_descendant(self):
+        self.b.parent = self.d
+        with self.assertRaises(ValueError):
+            self.b.save()
+        self.b.refresh_from_db()
+        self.assertEqual(self.b.parent_id, self.a.pk)
+        self.assertEqual(self.subtree(self.b), {'b', 'c', 'd'})
+
+    def test_subtree_does_not_match_siblings_sharing_a_pk_prefix(self):
+        roots = [make_category(f'root-{number}') for number in range(12)]  # e.g. /1/ next to /10/ and /11/
+        for root in roots:
+            self.assertEqual(self.subtree(root), {root.slug})
+
+    def test_tree_snapshot_follows_a_move(self):
+        make_product(self.d)
+        self.move(self.b, self.x)
+        tree = category_tree.get_tree()
+        self.assertEqual([node.slug for node in tree.ancestors(tree.by_id[self.d.pk])], ['x', 'b', 'c'])
+        self.assertEqual(set(tree.subtree_ids(tree.by_id[self.x.pk])), {self.x.pk, self.b.pk, self.c.pk, self.d.pk})
+        self.assertEqual(tree.by_id[self.x.pk].subtree_product_count, 1)
+        self.assertEqual(tree.by_id[self.a.pk].subtree_product_count, 0)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        fuzzy.frequencies.clear()
+        self.phones = make_category('phones')
+
+    def test_hits_in_the_name_outrank_hits_in_the_description(self):
+        described = make_product(self.phones, 'SKU-1', name='Budget handset', description='pairs with a walton charger')
+        named = make_product(self.phones, 'SKU-2', name='Walton Primo')
+        self.assertEqual(search.search_ids('walton'), [named.pk, described.pk])
+
+    def full_text(self, query):
+        return search.get_backend().search(tokenize(query), 10)
+
+    def test_last_word_matches_as_a_prefix_and_every_word_must_match(self):
+        primo = make_product(self.phones, 'SKU-1', name='Walton Primo')
+        make_product(self.phones, 'SKU-2', name='Walton Xanon')
+        self.assertEqual(self.full_text('walton pri'), [primo.pk])
+        self.assertEqual(self.full_text('pri walton'), [])
+
+    def test_limit_caps_results_and_none_returns_every_hit(self):
+        for number in range(5):
+            make_product(self.phones, f'SKU-{number}', name=f'Walton {number}')
+        self.assertEqual(len(search.search_ids('walton', 2)), 2)
+        self.assertEqual(len(search.search_ids('walton', limit=None)), 5)
+
+    def test_typo_falls_back_to_trigram_matches(self):
+        galaxy = make_product(self.phones, 'SKU-1', name='Samsung Galaxy', brand='Samsung')
+        self.assertEqual(self.full_text('samsng glaxy'), [])
+        self.assertEqual(search.search_ids('samsng glaxy'), [galaxy.pk])
+
+    def test_fuzzy_lookup_skips_common_trigrams_but_not_whole_words(self):
+        for number in range(30):
+            make_product(self.phones, f'SKU-C{number}', name=f'Case {number}')
+        wanted = make_product(self.phones, 'SKU-S', name='Samsung Galaxy case')
+        with mock.patch.object(fuzzy, 'POSTINGS_BUDGET', 10), mock.patch.object(fuzzy, 'MIN_GRAMS', 2):
+            grams = fuzzy.select_trigrams(['samsng', 'case'])
+            self.assertEqual(fuzzy.search_ids('samsng case', 1), [wanted.pk])
+        self.assertNotIn(' ca', grams)  # in every product
+        self.assertTrue(set(grams) & set(fuzzy.word_trigrams('samsng')))
+        self.assertTrue(set(grams) & set(fuzzy.word_trigrams('case')))
+
+    def test_query_syntax_is_searched_literally(self):
+        make_product(self.phones, 'SKU-1', name='Walton Primo')
+        self.assertEqual(self.full_text('walton OR "primo* NEAR('), [])
+
+    def test_signals_keep_the_index_current(self):
+        product = make_product(self.phones, 'SKU-1', name='Walton Primo')
+        product.name = 'Symphony Z'
+        product.save()
+        self.assertEqual(search.search_ids('walton'), [])
+        self.assertEqual(search.search_ids('symphony'), [product.pk])
+
+        self.phones.name = 'Handsets'
+        self.phones.save()
+        self.assertEqual(search.search_ids('handsets'), [product.pk])
+
+        product.is_active = False
+        product.save()
+        self.assertEqual(search.search_ids('symphony'), [])
+        product.is_active = True
+        product.save()
+        product.delete()
+        self.assertEqual(search.search_ids('symphony'), [])
+
+    def test_restrict_to_ids_keeps_their_order(self):
+        products = [make_product(self.phones, f'SKU-{number}') for number in range(3)]
+        ids = [products[2].pk, products[0].pk]
+        self.assertEqual([card.pk for card in search.restrict_to_ids(ProductCard.objects.all(), ids)], ids)
+
+    def test_ranked_results_page_in_rank_order_after_filters(self):
+        products = [make_product(self.phones, f'SKU-{number}', brand='Walton' if number % 2 else None) for number in range(5)]
+        ids = [product.pk for product in reversed(products)]
+        results = search.RankedResults(ProductCard.objects.filter(brand='Walton'), ids)
+        self.assertEqual(len(results), 2)
+        self.assertEqual([card.pk for card in results[0:2]], [products[3].pk, products[1].pk])
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        versions.bump_version(AUTOCOMPLETE_KEY)  # a stamp row for this test's transaction
+        self.phones = make_category('phones')
+        self.primo = make_product(self.phones, 'SKU-1', name='Walton Primo')
+        self.index, self.other_worker = AutocompleteIndex(), AutocompleteIndex()
+        for index in (self.index, self.other_worker):
+            index.suggest('walton')
+
+    def save(self, product, **fields):
+        for name, value in fields.items():
+            setattr(product, name, value)
+        product.save()
+        self.index.product_changed(product)  # what the post_save handler runs on commit
+
+    def test_changes_show_in_suggestions(self):
+        self.save(self.primo, name='Walton Xanon', sku='XN-77')
+        added = make_product(self.phones, 'SKU-2', name='Symphony Zeta')
+        self.index.product_changed(added)
+        self.assertEqual(self.index.suggest('primo'), [])
+        self.assertEqual(self.index.suggest('xan'), [self.primo.pk])
+        self.assertEqual(self.index.suggest('xn-77'), [self.primo.pk])
+        self.assertEqual(self.index.suggest('zet'), [added.pk])
+        self.index.product_deleted(added.pk)
+        self.assertEqual(self.index.suggest('zet'), [])
+
+    def test_other_workers_replay_a_change_without_reloading(self):
+        self.save(self.primo, name='Walton Xanon')
+        with mock.patch.object(self.other_worker, '_load', side_effect=AssertionError('reloaded')):
+            self.assertEqual(self.other_worker.suggest('xan'), [self.primo.pk])
+            self.assertEqual(self.other_worker.suggest('primo'), [])
+
+    def test_an_unlogged_bump_reloads(self):
+        self.save(self.primo, name='Walton Xanon')
+        self.other_worker.invalidate()
+        with mock.patch.object(self.other_worker, '_load', wraps=self.other_worker._load) as load:
+            self.assertEqual(self.other_worker.suggest('xan'), [self.primo.pk])
+        load.assert_called_once()
+
+    def test_fragmented_index_is_rebuilt(self):
+        with mock.patch('shop.autocomplete.REBUILD_MIN_PENDING', 2):
+            for name in ('Walton One', 'Walton Two', 'Walton Three'):
+                self.save(self.primo, name=name)
+        self.assertEqual(list(self.index.product_ids), [self.primo.pk])
+        self.assertEqual(self.index.new_words, [])
+        self.assertEqual(self.index.suggest('three'), [self.primo.pk])
+
+
+class FacetCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        phones = make_category('phones')
+        android = make_category('android', phones)
+        accessories = make_category('accessories')
+        self.cheap = make_product(android, 'SKU-1', brand='Walton', price=Decimal('300'), compare_price=Decimal('400'))
+        self.mid = make_product(android, 'SKU-2', brand='Samsung', price=Decimal('800'))
+        self.dear = make_product(phones, 'SKU-3', brand='Walton', price=Decimal('1200'))
+        self.cable = make_product(accessories, 'SKU-4', brand='Walton', price=Decimal('300'))
+        make_product(android, 'SKU-5', brand='Walton', price=Decimal('300'), is_active=False)
+        for product in (self.cheap, self.cable):
+            Inventory.objects.create(product=product, stock_quantity=3)
+        self.index = FacetIndex()
+
+    def counts(self, query=''):
+        selection = parse_selection(QueryDict(query))
+        return self.index.counts(selection), selection
+
+    @staticmethod
+    def values(facet):
+        return {value['value']: value['count'] for value in facet}
+
+    def test_counts_without_a_selection(self):
+        counts, _ = self.counts()
+        self.assertEqual(counts['total'], 4)
+        self.assertEqual(self.values(counts['category']), {'phones': 3, 'accessories': 1})
+        self.assertEqual(self.values(counts['brand']), {'Samsung': 1, 'Walton': 3})
+        self.assertEqual(
+            self.values(counts['price']), {'0-500': 2, '500-1000': 1, '1000-2500': 1, '2500-5000': 0, '5000-': 0}
+        )
+        self.assertEqual((counts['in_stock'], counts['on_sale']), (2, 1))
+
+    def test_a_facet_ignores_its_own_filter_but_respects_the_others(self):
+        counts, _ = self.counts('brand=Walton&price=0-500')
+        self.assertEqual(counts['total'], 2)
+        self.assertEqual(self.values(counts['brand']), {'Walton': 2})
+        self.assertEqual(self.values(counts['price'])['0-500'], 2)
+        self.assertEqual(self.values(counts['price'])['1000-2500'], 1)
+        self.assertEqual(self.values(counts['category']), {'phones': 1, 'accessories': 1})
+
+    def test_category_covers_its_subtree_and_lists_its_children(self):
+        counts, _ = self.counts('category=phones')
+        self.assertEqual(counts['total'], 3)
+        self.assertEqual(self.values(counts['category']), {'android': 2})
+        self.assertEqual(self.values(counts['brand']), {'Samsung': 1, 'Walton': 2})
+        subtree = Category.objects.filter(slug__in=['phones', 'android']).values_list('pk', flat=True)
+        self.assertEqual(self.index.category_subtree_ids('phones'), set(subtree))
+
+    def test_apply_selection_lists_what_the_counts_describe(self):
+        queries = ('', 'category=phones', 'brand=Walton&in_stock=1', 'category=phones&on_sale=1', 'price=0-500&price=1000-2500')
+        for query in queries:
+            counts, selection = self.counts(query)
+            for model in (Product, ProductCard):
+                queryset = model.objects.all() if model is ProductCard else model.objects.filter(is_active=True)
+                with self.subTest(query=query, model=model.__name__):
+                    self.assertEqual(apply_selection(queryset, selection).count(), counts['total'])
+
+    def test_restrict_to_limits_every_count(self):
+        selection = parse_selection(QueryDict('brand=Walton'))
+        counts = self.index.counts(selection, restrict_to=[self.cheap.pk, self.mid.pk])
+        self.assertEqual(counts['total'], 1)
+        self.assertEqual(self.values(counts['brand']), {'Samsung': 1, 'Walton': 1})
+
+    def test_a_changed_product_shows_in_the_counts(self):
+        self.counts()
+        self.mid.brand = 'Walton'
+        self.mid.save()
+        self.index.product_changed(self.mid)  # what the post_save handler runs on commit
+        counts, _ = self.counts('brand=Walton')
+        self.assertEqual(counts['total'], 4)
+        self.assertNotIn('Samsung', self.values(counts['brand']))
+
+
+class SearchListingCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        result_cache.clear()
+
+    def test_repeated_search_listing_reuses_the_ranked_ids(self):
+        category = make_category('phones')
+        for number in range(3):
+            make_product(category, f'SKU-{number}', name=f'Walton phone {number}')
+
+        self.client.get('/en/shop/', {'search': 'walton'})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/en/shop/', {'search': 'walton'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page_obj'].paginator.count, 3)
+        self.assertFalse([query for query in queries if search.FTS_TABLE in query['sql']])
+
+
+class PriceIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+        category = make_category('phones')
+        self.phone = make_product(category, 'PHONE', price=Decimal('100.00'))
+        self.case = make_product(category, 'CASE', price=Decimal('20.00'))
+
+    def flash_sale(self, percentage, *products, starts=-1, ends=1):
+        sale = FlashSale.objects.create(
+            name=f'{percentage}% off', discount_percentage=Decimal(percentage),
+            start_time=self.now + timedelta(hours=starts), end_time=self.now + timedelta(hours=ends),
+        )
+        sale.products.set(products)
+        return sale
+
+    def combo(self, percentage, items):
+        combo = ComboOffer.objects.create(
+            name=f'{percentage}% combo', discount_percentage=Decimal(percentage),
+            start_date=self.now - timedelta(hours=1), end_date=self.now + timedelta(hours=1),
+        )
+        for product, quantity in items:
+            ComboProduct.objects.create(combo=combo, product=product, quantity=quantity)
+        return combo
+
+    def coupon(self, code, discount_type, value, **fields):
+        return Coupon.objects.create(
+            code=code, discount_type=discount_type, discount_value=Decimal(value),
+            start_date=self.now - timedelta(hours=1), end_date=self.now + timedelta(hours=1), **fields,
+        )
+
+    def price(self, quantities, coupon_code=None):
+        pricing.invalidate()  # the test database was rolled back under the shared index
+        lines = {product.pk: (quantity, product.price) for product, quantity in quantities}
+        return pricing.price_index.price_lines(lines, coupon_code)
+
+    def test_largest_overlapping_flash_sale_wins(self):
+        self.flash_sale(10, self.phone)
+        self.flash_sale(25, self.phone, self.case)
+        priced = self.price([(self.phone, 2), (self.case, 1)])
+        self.assertEqual(priced.lines[self.phone.pk].total, Decimal('150.00'))
+        self.assertEqual(priced.lines[self.case.pk].total, Decimal('15.00'))
+        self.assertEqual(pricing.price_index.sale(self.phone.pk, self.phone.price).percentage, 25)
+
+    def test_combo_applies_once_per_complete_set(self):
+        self.combo(10, [(self.phone, 1), (self.case, 2)])
+        priced = self.price([(self.phone, 3), (self.case, 4)])
+        self.assertEqual(priced.combos, [('10% combo', 2)])
+        self.assertEqual(priced.lines[self.phone.pk].total, Decimal('280.00'))  # 2 x 90 + 100
+        self.assertEqual(priced.lines[self.case.pk].total, Decimal('72.00'))  # 4 x 18
+
+    def test_units_count_towards_one_combo_the_largest_first(self):
+        self.combo(10, [(self.phone, 1), (self.case, 1)])
+        self.combo(30, [(self.phone, 1)])
+        priced = self.price([(self.phone, 1), (self.case, 1)])
+        self.assertEqual(priced.combos, [('30% combo', 1)])
+        self.assertEqual(priced.total, Decimal('90.00'))  # 70 + 20
+
+    def test_combo_units_take_the_flash_sale_when_it_is_larger(self):
+        self.flash_sale(50, self.case)
+        self.combo(10, [(self.phone, 1), (self.case, 1)])
+        priced = self.price([(self.phone, 1), (self.case, 1)])
+        self.assertEqual(priced.lines[self.phone.pk].total, Decimal('90.00'))
+        self.assertEqual(priced.lines[self.case.pk].total, Decimal('10.00'))
+
+    def test_percentage_coupon_is_capped_at_max_discount(self):
+        self.coupon('HALF', 'percentage', 50, max_discount=Decimal('30.00'))
+        priced = self.price([(self.phone, 1)], 'half')
+        self.assertEqual(priced.coupon_discount, Decimal('30.00'))
+        self.assertEqual(priced.total, Decimal('70.00'))
+
+    def test_fixed_coupon_is_capped_at_the_total(self):
+        self.coupon('BIG', 'fixed', 500)
+        priced = self.price([(self.case, 1)], 'BIG')
+        self.assertEqual(priced.coupon_discount, Decimal('20.00'))
+        self.assertEqual(priced.total, Decimal('0.00'))
+
+    def test_coupon_minimum_applies_to_the_discounted_total(self):
+        self.flash_sale(20, self.phone)
+        self.coupon('MIN90', 'fixed', 5, min_order_amount=Decimal('90.00'))
+        priced = self.price([(self.phone, 1)], 'MIN90')
+        self.assertIsNone(priced.coupon)
+        self.assertEqual(priced.coupon_error, 'This coupon needs an order of at least 90.00.')
+        self.assertEqual(priced.total, Decimal('80.00'))
+
+    def test_used_up_coupon_is_not_valid(self):
+        self.coupon('GONE', 'fixed', 5, usage_limit=1, used_count=1)
+        priced = self.price([(self.phone, 1)], 'GONE')
+        self.assertEqual(priced.coupon_error, 'This coupon is not valid.')
+
+    def test_sales_start_and_end_without_a_reload(self):
+        self.flash_sale(10, self.phone, starts=1, ends=2)
+        self.price([])  # loads the index
+        index = pricing.price_index
+        self.assertIsNone(index.sale(self.phone.pk, self.phone.price))
+
+        with mock.patch('django.utils.timezone.now', return_value=self.now + timedelta(minutes=90)):
+            with self.assertNumQueries(0):
+                self.assertEqual(index.sale(self.phone.pk, self.phone.price).price, Decimal('90.00'))
+        with mock.patch('django.utils.timezone.now', return_value=self.now + timedelta(hours=3)):
+            with self.assertNumQueries(0):
+                self.assertIsNone(index.sale(self.phone.pk, self.phone.price))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = make_category('phones')
+        # Seven products on three prices, so most sort keys tie.
+        for number, price in enumerate(['5.00', '5.00', '7.00', '5.00', '7.00', '9.00', '7.00']):
+            make_product(category, f'SKU-{number}', price=Decimal(price))
+        self.cards = ProductCard.objects.all()
+        self.expected = list(self.cards.order_by('price', 'id').values_list('pk', flat=True))
+
+    def walk(self, paginator, cursor=None, backwards=False):
+        pages = []
+        page = paginator.page(cursor)
+        while True:
+            pages.append([card.pk for card in page])
+            cursor = page.previous_cursor if backwards else page.next_cursor
+            if cursor is None:
+                return pages[::-1] if backwards else pages
+            page = paginator.page(cursor)
+
+    def test_forward_walk_visits_every_row_once_in_order(self):
+        pages = self.walk(KeysetPaginator(self.cards, 'price_low', 3))
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), self.expected)
+
+    def test_backward_walk_returns_the_same_pages(self):
+        paginator = KeysetPaginator(self.cards, 'price_low', 3)
+        forward = self.walk(paginator)
+        last = paginator.page(paginator.page(paginator.page().next_cursor).next_cursor)
+        self.assertIsNone(last.next_cursor)
+        backward = self.walk(paginator, last.previous_cursor, backwards=True) + [[card.pk for card in last]]
+        self.assertEqual(backward, forward)
+        first = paginator.page(paginator.page(paginator.page().next_cursor).previous_cursor)
+        self.assertEqual([card.pk for card in first], self.expected[:3])
+        self.assertIsNone(first.previous_cursor)
+
+    def test_tampered_cursor_is_rejected(self):
+        paginator = KeysetPaginator(self.cards, 'price_low', 3)
+        cursor = paginator.page().next_cursor
+        tampered = cursor[:-2] + ('A' if cursor[-2] != 'A' else 'B') + cursor[-1]
+        with self.assertRaises(InvalidCursor):
+            paginator.page(tampered)
+        self.assertEqual([card.pk for card in cursor_page(self.cards, 'price_low', 3, tampered)], self.expected[:3])
+
+    def test_cursor_for_another_sort_or_salt_is_rejected(self):
+        other_sort = KeysetPaginator(self.cards, 'name', 3).page().next_cursor
+        unsalted = signing.dumps(['price_low', ['5.00', '1'], False])
+        paginator = KeysetPaginator(self.cards, 'price_low', 3)
+        for cursor in (other_sort, unsalted, signing.dumps('junk', salt=CURSOR_SALT)):
+            with self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+
+    def test_shop_listing_starts_over_on_a_forged_cursor(self):
+        response = self.client.get('/en/shop/', {'sort': 'price_low', 'cursor': 'forged'})
+        page = response.context['page_obj']
+        self.assertEqual(response.context['pagination_mode'], 'cursor')
+        self.assertEqual([card.pk for card in page], self.expected)
+        self.assertIsNone(page.previous_cursor)
+
+
+class RecommendationTests(TestCase):
+    BASKETS = [(0, 1), (0, 1, 2), (0, 2, 3), (1, 2), (0, 3, 4), (3, 4), (0, 1, 4)]
+
+    def setUp(self):
+        cache.clear()
+        category = make_category('phones')
+        self.products = [make_product(category, f'SKU-{number}') for number in range(5)]
+        self.orders = 0
+
+    def order(self, basket, delivered=True):
+        self.orders += 1
+        order = Order.objects.create(
+            order_number=f'T-{self.orders}', email='a@example.com', full_name='A', phone='1', address='A',
+            city='A', postal_code='1', total_amount=Decimal('10.00'),
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=self.products[number], quantity=1, price=Decimal('10.00'))
+            for number in basket
+        ])
+        if delivered:
+            order.status = recommendations.DELIVERED
+            with self.captureOnCommitCallbacks(execute=True):  # runs record_order()
+                order.save()
+        return order
+
+    def associations(self):
+        return {
+            (product_id, related_id): (co_purchases, round(score, 9))
+            for product_id, related_id, co_purchases, score in ProductAssociation.objects.values_list(
+                'product_id', 'related_id', 'co_purchases', 'score'
+            )
+        }
+
+    def test_incremental_orders_match_a_rebuild(self):
+        for basket in self.BASKETS:
+            self.order(basket)
+        incremental = self.associations()
+        recommendations.rebuild()
+        rebuilt = self.associations()
+        self.assertEqual(
+            {pair: value[0] for pair, value in incremental.items()}, {pair: value[0] for pair, value in rebuilt.items()}
+        )
+        # Scores of pairs the last order touched are exact.
+        last = [self.products[number].pk for number in self.BASKETS[-1]]
+        for pair in [(a, b) for a in last for b in last if a != b]:
+            self.assertEqual(incremental[pair], rebuilt[pair])
+
+    def test_recount_keeps_the_top_neighbours(self):
+        with mock.patch.object(recommendations, 'NEIGHBOURS', 2):
+            for basket in self.BASKETS:
+                self.order(basket)
+        per_product = {}
+        for product_id, _ in self.associations():
+            per_product[product_id] = per_product.get(product_id, 0) + 1
+        self.assertEqual(set(per_product.values()), {2})
+
+    def test_pruned_pair_is_recounted_not_restarted(self):
+        for basket in self.BASKETS:
+            self.order(basket)
+        three, four = self.products[3].pk, self.products[4].pk
+        # As if the last rebuild had pruned the pair from both top-N lists.
+        ProductAssociation.objects.filter(product_id__in=[three, four], related_id__in=[three, four]).delete()
+        self.order((3, 4))
+        self.assertEqual(self.associations()[three, four][0], 3)
 
-# Create your tests here.
+    def test_undelivered_orders_are_not_counted(self):
+        self.order((0, 1), delivered=False)
+        self.order((0, 2))
+        self.assertEqual(set(self.associations()), {
+            (self.products[0].pk, self.products[2].pk), (self.products[2].pk, self.products[0].pk),
+        })
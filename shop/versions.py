@@ -0,0 +1,161 @@
+"""
+Version stamps for process-local catalog structures.
+
+Stamps are ``VersionStamp`` rows, so a bump made by one worker is seen by
+all of them whatever cache backend is configured. Each process re-reads a
+stamp at most once every ``VERSION_CHECK_INTERVAL`` seconds (default 1),
+so hot paths do not query it on every call. A process sees its own bumps
+at once, and other workers' bumps within one interval. Callers that must
+not act on a stale stamp (charging an order) pass ``max_age=0``.
+
+A missing row is seeded from the clock, so a stamp that is recreated can
+never roll back to a value some worker already built from.
+
+A bump can name the object it was for. Those are logged as
+``VersionChange`` rows, and an index that opts in with ``logs_changes``
+catches up on other workers' bumps by re-reading just those objects,
+as long as every bump since its version was logged.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+DEFAULT_CHECK_INTERVAL = 1.0
+
+# Logged changes kept per stamp; an index further behind rebuilds.
+CHANGE_LOG_LENGTH = 1000
+
+_lock = threading.Lock()
+_known = {}  # name -> (value, time.monotonic() when read)
+
+
+def _seed():
+    return int(time.time() * 1000)
+
+
+def check_interval():
+    return getattr(settings, 'VERSION_CHECK_INTERVAL', DEFAULT_CHECK_INTERVAL)
+
+
+def _remember(name, value):
+    with _lock:
+        _known[name] = (value, time.monotonic())
+    return value
+
+
+def _read(name):
+    from shop.models import VersionStamp
+
+    value = VersionStamp.objects.filter(name=name).values_list('value', flat=True).first()
+    if value is None:
+        try:
+            with transaction.atomic():
+                VersionStamp.objects.create(name=name, value=_seed())
+        except IntegrityError:
+            pass  # another worker seeded it first
+        value = VersionStamp.objects.filter(name=name).values_list('value', flat=True).get()
+    return value
+
+
+def get_version(name, max_age=None):
+    """Stamp ``name``, read from the database if this process last did more than ``max_age`` seconds ago."""
+    max_age = check_interval() if max_age is None else max_age
+    with _lock:
+        known = _known.get(name)
+    if known is not None and time.monotonic() - known[1] < max_age:
+        return known[0]
+    return _remember(name, _read(name))
+
+
+def bump_version(name, object_id=None):
+    """Increment stamp ``name``, logging ``object_id`` as the reason if given."""
+    from shop.models import VersionChange, VersionStamp
+
+    with transaction.atomic():
+        if not VersionStamp.objects.filter(name=name).update(value=F('value') + 1):
+            _read(name)  # seeds the row
+            VersionStamp.objects.filter(name=name).update(value=F('value') + 1)
+        value = VersionStamp.objects.filter(name=name).values_list('value', flat=True).get()
+        if object_id is not None:
+            VersionChange.objects.create(name=name, version=value, object_id=object_id)
+            VersionChange.objects.filter(name=name, version__lte=value - CHANGE_LOG_LENGTH).delete()
+    return _remember(name, value)
+
+
+def changes_since(name, version, current):
+    """
+    Object ids logged for the bumps of ``name`` after ``version`` up to
+    ``current``, or None if any of those bumps was not logged.
+    """
+    from shop.models import VersionChange
+
+    if not 0 <= current - version <= CHANGE_LOG_LENGTH:
+        return None
+    object_ids = list(
+        VersionChange.objects.filter(name=name, version__gt=version, version__lte=current)
+        .values_list('object_id', flat=True)
+    )
+    return object_ids if len(object_ids) == current - version else None
+
+
+class VersionedIndex:
+    """
+    Base for in-process indexes kept fresh by a version stamp.
+
+    Subclasses implement ``_load()``. Local changes go through ``_apply()``,
+    which bumps the shared stamp and patches this process's copy in place
+    when no other worker has changed it in between. Otherwise the next read
+    rebuilds from the database, unless the subclass sets ``logs_changes``
+    and implements ``_replay()`` to patch in the logged objects instead.
+    """
+
+    version_key = None
+    logs_changes = False
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = None
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _replay(self, object_ids):
+        """Bring the objects behind logged bumps up to date from the database."""
+        raise NotImplementedError
+
+    def _catch_up(self, current):
+        if not self.logs_changes or self._version is None:
+            return False
+        object_ids = changes_since(self.version_key, self._version, current)
+        if object_ids is None:
+            return False
+        self._replay(object_ids)
+        return True
+
+    def _ensure_fresh(self, max_age=None):
+        current = get_version(self.version_key, max_age)
+        if self._version != current:
+            with self._lock:
+                if self._version != current:
+                    if not self._catch_up(current):
+                        self._load()
+                    self._version = current
+
+    def _apply(self, change, object_id=None):
+        new_version = bump_version(self.version_key, object_id if self.logs_changes else None)
+        with self._lock:
+            if self._version is None:
+                return  # not loaded yet; the first read builds it from scratch
+            if new_version != self._version + 1:
+                # Missed another worker's change. Replaying the log covers
+                # ours too; failing that, the next read reloads.
+                self._version = new_version if self._catch_up(new_version) else None
+                return
+            change()
+            self._version = new_version
+
+    def invalidate(self):
+        bump_version(self.version_key)
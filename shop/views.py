@@ -1,28 +1,70 @@
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.core.paginator import Paginator
-from django.db.models import Q
-from shop.models import Product, Category
+from functools import partial
+from shop.models import Product, ProductCard
 from shop.serializers import ProductSerializer
+from shop import category_tree, recommendations, search
+from shop.search_cache import result_cache
+from shop.autocomplete import autocomplete_index
+from shop.facets import apply_selection, facet_index, parse_selection
+from shop.pricing import price_index
+from shop.pagination import SORT_ORDERINGS, approximate_count, cursor_page
+
+LISTING_PAGE_SIZE = 12
+SEARCH_PAGE_SIZE = 8
+MAX_SEARCH_PAGE_SIZE = 48
+
+
+def serializable_products():
+    """Active products with everything ProductSerializer reads, in three queries total."""
+    return Product.objects.filter(is_active=True).select_related(
+        'category', 'primary_image'
+    ).prefetch_related('images')
+
+
+def paginate_listing(request, products, sort_by):
+    """
+    Page ``products`` with keyset pagination when the request carries a
+    ``cursor`` parameter (empty for the first page), else with Paginator.
+    """
+    cursor = request.GET.get('cursor')
+    if cursor is not None and sort_by in SORT_ORDERINGS:
+        page_obj = cursor_page(products, sort_by, LISTING_PAGE_SIZE, cursor)
+        return {
+            'page_obj': page_obj,
+            'pagination_mode': 'cursor',
+            # Called only if the template renders it; cached per filter set.
+            'approximate_count': partial(approximate_count, products),
+        }
+    paginator = Paginator(products, LISTING_PAGE_SIZE)
+    return {
+        'page_obj': paginator.get_page(request.GET.get('page')),
+        'pagination_mode': 'page',
+    }
+
 
 def shop(request):
-    products = Product.objects.filter(is_active=True)
+    products = ProductCard.objects.all()
     
     # Filtering
-    category_slug = request.GET.get('category')
-    if category_slug:
-        products = products.filter(category__slug=category_slug)
+    selection = parse_selection(request.GET)
+    category_slug = selection['category']
+    products = apply_selection(products, selection)
     
     search_query = request.GET.get('search')
+    search_ids = None
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) | 
-            Q(description__icontains=search_query)
+        search_ids = result_cache.get_or_compute(
+            'search', search_query, lambda: search.search_ids(search_query, limit=None)
         )
+        products = products.filter(pk__in=search_ids)
     
     # Sorting
-    sort_by = request.GET.get('sort', 'newest')
-    if sort_by == 'price_low':
+    sort_by = request.GET.get('sort', 'relevance' if search_query else 'newest')
+    if sort_by == 'relevance' and search_query:
+        products = search.RankedResults(products, search_ids)
+    elif sort_by == 'price_low':
         products = products.order_by('price')
     elif sort_by == 'price_high':
         products = products.order_by('-price')
@@ -32,15 +74,15 @@ def shop(request):
         products = products.order_by('-created_at')
     
     # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    pagination = paginate_listing(request, products, sort_by)
     
-    categories = Category.objects.filter(is_active=True)
+    categories = list(category_tree.get_tree().by_id.values())
     
     context = {
-        'page_obj': page_obj,
+        **pagination,
         'categories': categories,
+        'facets': facet_index.counts(selection, restrict_to=search_ids),
+        'selection': selection,
         'selected_category': category_slug,
         'search_query': search_query or '',
         'sort_by': sort_by,
@@ -48,41 +90,79 @@ def shop(request):
     return render(request, 'shop/shop.html', context)
 
 def category(request, slug):
-    category = get_object_or_404(Category, slug=slug, is_active=True)
-    products = Product.objects.filter(category=category, is_active=True)
+    tree = category_tree.get_tree()
+    category = tree.by_slug.get(slug)
+    if category is None:
+        raise Http404("No Category matches the given query.")
+    products = ProductCard.objects.filter(category.subtree_q('category_'))
+    
+    sort_by = request.GET.get('sort', 'newest')
+    if sort_by not in SORT_ORDERINGS:
+        sort_by = 'newest'
+    products = products.order_by(*SORT_ORDERINGS[sort_by])
     
     # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    pagination = paginate_listing(request, products, sort_by)
     
     context = {
+        **pagination,
         'category': category,
-        'page_obj': page_obj,
+        'breadcrumbs': tree.ancestors(category),
+        'subcategories': tree.children_of(category),
+        'sort_by': sort_by,
     }
     return render(request, 'shop/category.html', context)
 
 def product_detail(request, slug):
     product = get_object_or_404(Product, slug=slug, is_active=True)
-    related_products = Product.objects.filter(
-        category=product.category, 
-        is_active=True
-    ).exclude(id=product.id)[:4]
+    related_products = recommendations.related_products(product, limit=4)
     
     context = {
         'product': product,
+        'sale': price_index.sale(product.pk, product.price),
         'related_products': related_products,
     }
     return render(request, 'shop/product_detail.html', context)
 
 def product_search(request):
     query = request.GET.get('q', '')
+    cursor = request.GET.get('cursor')
+    if cursor is not None:
+        return product_search_page(request, query, cursor)
     if query:
-        products = Product.objects.filter(
-            Q(name__icontains=query) | 
-            Q(description__icontains=query),
-            is_active=True
-        )[:8]
+        # Prefix index first (no database work to find matches); full-text
+        # search only when no product name, Bengali name or SKU starts with it.
+        ids = result_cache.get_or_compute(
+            'suggest', query,
+            lambda: autocomplete_index.suggest(query, SEARCH_PAGE_SIZE) or search.search_ids(query, SEARCH_PAGE_SIZE),
+            limit=SEARCH_PAGE_SIZE,
+        )
+        products = search.restrict_to_ids(serializable_products(), ids)
         serializer = ProductSerializer(products, many=True)
         return JsonResponse(serializer.data, safe=False)
-    return JsonResponse([], safe=False)
\ No newline at end of file
+    return JsonResponse([], safe=False)
+
+def product_search_page(request, query, cursor):
+    """Cursor-paginated search results: ``?q=...&cursor=&sort=&limit=``."""
+    sort_by = request.GET.get('sort', 'newest')
+    if sort_by not in SORT_ORDERINGS:
+        sort_by = 'newest'
+    try:
+        limit = min(max(int(request.GET.get('limit', SEARCH_PAGE_SIZE)), 1), MAX_SEARCH_PAGE_SIZE)
+    except ValueError:
+        limit = SEARCH_PAGE_SIZE
+    
+    products = serializable_products()
+    if query:
+        ids = result_cache.get_or_compute('search', query, lambda: search.search_ids(query, limit=None))
+        products = products.filter(pk__in=ids)
+    page_obj = cursor_page(products, sort_by, limit, cursor)
+    
+    data = {
+        'results': ProductSerializer(page_obj.object_list, many=True).data,
+        'next': page_obj.next_cursor,
+        'previous': page_obj.previous_cursor,
+    }
+    if request.GET.get('count') == '1':
+        data['approximate_count'] = approximate_count(products)
+    return JsonResponse(data)
\ No newline at end of file